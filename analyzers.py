@@ -0,0 +1,107 @@
+import importlib
+import jsonstream
+
+# A small plugin system for computing metrics from deliberation exports. Every metric is an Analyzer with a handler for each kind of
+# record it cares about (see jsonstream.iter_records), and run_analyzers walks an export once, handing each record to every analyzer
+# that wants it. Adding a metric means writing an Analyzer, not adding another loop over the data, and metrics from different scripts
+# (eg. jsonparser's speak instances and votingparser's participant counts) can share a single pass over a file:
+#
+#   results = analyzers.run_analyzers(file, ["speakInstances", "voting"])
+#
+# To add a metric, subclass Analyzer, override the handlers you need and result(), and register it under a name:
+#
+#   @analyzers.register("questionCount")
+#   class QuestionCountAnalyzer(analyzers.Analyzer):
+#       def __init__(self):
+#           self.count = 0
+#       def transcript(self, roomname, event):
+#           if event.get("type") == "submitQuestion":
+#               self.count += 1
+#       def result(self):
+#           return self.count
+
+# Registered analyzer classes, keyed by name.
+registry = {}
+
+# The modules the built-in analyzers are registered in, keyed by name. They're only imported the first time one of their analyzers is asked
+# for by name (see get), so naming one works without importing its script first, and a script doesn't pay for importing the others.
+BUILTIN = {
+    "speakInstances": "jsonparser",
+    "speakerTotals": "jsonparser",
+    "voting": "votingparser",
+    "connectedTimes": "jsonparser_connectedtime",
+    "abuseFlags": "jsonparser_connectedtime",
+    "transcriptIndex": "transcripts",
+    "identities": "identities",
+    "timeline": "timeline",
+}
+
+# The record types analyzers can handle. The handler for each one is the Analyzer method of the same name.
+RECORD_TYPES = ["room", "user", "speakBlock", "disconnectedBlock", "transcript", "poll"]
+
+# Class decorator that adds an Analyzer to the registry under name, so it can be asked for by name in run_analyzers.
+def register(name):
+    def decorator(cls):
+        registry[name] = cls
+        return cls
+    return decorator
+
+# Returns the analyzer class registered under name, importing the module of a built-in one if it hasn't been imported yet. Raises
+# ValueError naming every analyzer that can be asked for if there's none by that name.
+def get(name):
+    if name not in registry and name in BUILTIN:
+        importlib.import_module(BUILTIN[name])
+    if name not in registry:
+        known = sorted(set(registry) | set(BUILTIN))
+        raise ValueError("Unknown analyzer " + repr(name) + ", expected one of " + ", ".join(known))
+    return registry[name]
+
+# Base class for analyzers. The handlers take the same arguments as the records from jsonstream.iter_records, minus the record type,
+# and do nothing by default. Only handlers a subclass overrides are called.
+class Analyzer:
+    def room(self, roomname, room):
+        pass
+
+    def user(self, roomname, user):
+        pass
+
+    def speakBlock(self, roomname, user, block):
+        pass
+
+    def disconnectedBlock(self, roomname, user, block):
+        pass
+
+    def transcript(self, roomname, event):
+        pass
+
+    def poll(self, roomname, pollid, poll):
+        pass
+
+    # Called once every record has been handled. Returns whatever the analyzer computed.
+    def result(self):
+        return None
+
+# Sends every record to the matching handler of each analyzer. Analyzers that don't override a handler are left out of that record
+# type's dispatch list entirely, so they cost nothing for records they ignore.
+def dispatch(records, analyzers):
+    handlers = {}
+    for recordtype in RECORD_TYPES:
+        handlers[recordtype] = [getattr(analyzer, recordtype) for analyzer in analyzers
+                                if getattr(type(analyzer), recordtype) is not getattr(Analyzer, recordtype)]
+
+    for record in records:
+        for handler in handlers[record[0]]:
+            handler(*record[1:])
+
+# Walks a json export (a file path, or an iterable of room dictionaries) once and runs every analyzer over it. analyzers can hold
+# Analyzer instances or the names of registered analyzers, which are created with their default arguments. Returns a list with each
+# analyzer's result, in the same order.
+def run_analyzers(file, analyzers):
+    analyzers = [get(analyzer)() if isinstance(analyzer, str) else analyzer for analyzer in analyzers]
+
+    rooms = file
+    if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+        rooms = jsonstream.iter_rooms(file)
+
+    dispatch(jsonstream.iter_records(rooms), analyzers)
+    return [analyzer.result() for analyzer in analyzers]
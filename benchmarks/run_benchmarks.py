@@ -0,0 +1,171 @@
+import os
+import sys
+import io
+import gc
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+
+# Times and memory-profiles each step of the three scripts on synthetic exports of increasing size, and saves the results as json so they
+# can be compared between versions:
+#
+#   python benchmarks/run_benchmarks.py --output before.json
+#   ... make changes ...
+#   python benchmarks/run_benchmarks.py --output after.json --compare before.json
+#
+# Each stage is run --repeat times with the fastest time kept, then once more under tracemalloc to measure its peak memory. A stage that
+# raises is recorded with its error rather than stopping the run, and stages that need its output are skipped.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+import jsonparser
+import jsonparser_connectedtime
+import votingparser
+
+# name: (rooms per export, users per room, speaks per user, number of exports)
+SCALES = {
+    "small": (5, 6, 10, 2),
+    "medium": (40, 8, 30, 2),
+    "large": (200, 10, 50, 2),
+}
+
+# Runs func(), returning its result along with the fastest wall time out of repeat runs and the peak traced memory of one more run.
+def measure(func, repeat, memory=True):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, best, peak
+
+# Returns the list of (stage name, function) pairs to benchmark for a set of files. Stages take the outputs of the stages before them
+# from the outputs dictionary, which run_scale fills in as it goes.
+def stages(files, outputs):
+    first = files[0]
+    return [
+        ("jsonparser.parse_jsons", lambda: jsonparser.parse_jsons([first], ["bench"])),
+        ("jsonparser.get_speak_instances_from_json", lambda: jsonparser.get_speak_instances_from_json(outputs["jsonparser.parse_jsons"][0][0], ['Record'])),
+        ("jsonparser.stream_json", lambda: jsonparser.stream_json(first, ['Record'])),
+        ("jsonparser.organize_by_group", lambda: jsonparser.organize_by_group(outputs["jsonparser.stream_json"][1], outputs["jsonparser.stream_json"][0])),
+        ("jsonparser.total_speaker_times", lambda: jsonparser.total_speaker_times(outputs["jsonparser.stream_json"][1], outputs["jsonparser.stream_json"][0])),
+        ("jsonparser.organize_floor_time", lambda: jsonparser.organize_floor_time(outputs["jsonparser.stream_json"][1], outputs["jsonparser.stream_json"][0])),
+        ("jsonparser.organize_request_waits", lambda: jsonparser.organize_request_waits(outputs["jsonparser.stream_json"][1], outputs["jsonparser.stream_json"][0])),
+        ("jsonparser.generate_output", lambda: jsonparser.generate_output(outputs["jsonparser.stream_json"][1], outputs["jsonparser.stream_json"][0], "bench")),
+        ("jsonparser_connectedtime.extract_file", lambda: jsonparser_connectedtime.extract_file(first)),
+        ("jsonparser_connectedtime.organize_connectedtimes_by_group", lambda: jsonparser_connectedtime.organize_connectedtimes_by_group(
+            outputs["jsonparser_connectedtime.extract_file"][2], outputs["jsonparser_connectedtime.extract_file"][0])),
+        ("jsonparser_connectedtime.organize_abuseflags", lambda: jsonparser_connectedtime.organize_abuseflags(
+            outputs["jsonparser_connectedtime.extract_file"][3], outputs["jsonparser_connectedtime.extract_file"][0])),
+        ("votingparser.grab_data_from_file", lambda: votingparser.grab_data_from_file(files)),
+        ("votingparser.generate_output", lambda: votingparser.generate_output(*outputs["votingparser.grab_data_from_file"], "bench")),
+    ]
+
+# Generates the exports for one scale in folder and benchmarks every stage on them. Returns a list of result dictionaries.
+def run_scale(name, params, folder, repeat, memory):
+    rooms, users, speaks, numfiles = params
+    files = synthetic.generate(folder, rooms, users, speaks, numfiles, seed=0)
+    size = sum(os.path.getsize(file) for file in files)
+
+    results = []
+    outputs = {}
+    for stage, func in stages(files, outputs):
+        result = {"scale": name, "rooms": rooms, "users": users, "speaks": speaks, "files": numfiles, "bytes": size,
+                  "stage": stage, "seconds": None, "peak_bytes": None, "error": None}
+        try:
+            # the scripts print progress as they go, which we don't want mixed in with the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                outputs[stage], result["seconds"], result["peak_bytes"] = measure(func, repeat, memory)
+        except Exception as e:
+            tracemalloc.stop()
+            result["error"] = repr(e)
+        results.append(result)
+        print_result(result)
+    return results
+
+def print_result(result):
+    if result["error"] is not None:
+        print("  {:<60} failed: {}".format(result["stage"], result["error"]))
+        return
+    memory = "" if result["peak_bytes"] is None else "{:>10.1f} MB peak".format(result["peak_bytes"] / 1e6)
+    print("  {:<60} {:>10.4f} s {}".format(result["stage"], result["seconds"], memory))
+
+# Details of the machine and versions the benchmarks ran on, saved alongside the results.
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        import pandas, numpy
+        info["pandas"] = pandas.__version__
+        info["numpy"] = numpy.__version__
+    except ImportError:
+        pass
+    try:
+        info["commit"] = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        pass
+    return info
+
+# Prints how each stage's time and memory compare to an earlier results file. Ratios above 1 mean the current run was slower or used more.
+def compare(results, baselinefile):
+    with open(baselinefile, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(r["scale"], r["stage"]): r for r in baseline["results"]}
+
+    print("\nCompared to " + baselinefile + " (current / baseline):")
+    for result in results:
+        before = old.get((result["scale"], result["stage"]))
+        if before is None or result["seconds"] is None or before["seconds"] is None:
+            continue
+        line = "  {:<8} {:<60} time x{:.2f}".format(result["scale"], result["stage"], result["seconds"] / max(before["seconds"], 1e-9))
+        if result["peak_bytes"] and before["peak_bytes"]:
+            line += "  memory x{:.2f}".format(result["peak_bytes"] / before["peak_bytes"])
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the speaker data scripts on synthetic deliberation exports.")
+    parser.add_argument("--scales", default="small,medium,large", help="comma separated scales to run, from: " + ", ".join(SCALES))
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each stage. The fastest is kept.")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each stage")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to save the results to")
+    parser.add_argument("--compare", metavar="FILE", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # generate_output writes its files to the current folder, so keep them out of the way
+        os.chdir(folder)
+        try:
+            for name in args.scales.split(","):
+                print(name + ": " + "{} rooms x {} users x {} speaks, {} files".format(*SCALES[name]))
+                results += run_scale(name, SCALES[name], os.path.join(folder, name), args.repeat, not args.no_memory)
+        finally:
+            os.chdir(cwd)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print("\nSaved results to " + args.output)
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
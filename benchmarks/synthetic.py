@@ -0,0 +1,107 @@
+import os
+import json
+import random
+import argparse
+
+# Writes synthetic deliberation exports with the same layout as the real ones, so the scripts can be benchmarked at any scale without
+# needing real data. Everything is generated from a seed, so the same arguments always produce the same files.
+#
+# Each export is a json array of rooms. Each room has roomData, userData (with speakBlocks, disconnectedBlocks and advanceAgenda for every
+# user), transcriptData (moderator markers, questions, question votes and the odd abuse flag) and pollData (move on polls). Every room
+# also has a 'Record' user and an observer, like real deliberations do.
+
+# Deliberations are timed from here, in milliseconds like the real exports
+BASE_TIME = 1_700_000_000_000
+
+# Makes a single room. rng is a random.Random, so rooms come out the same for the same seed.
+def make_room(rng, name, num_users, speaks_per_user):
+    start = BASE_TIME + rng.randint(0, 3_600_000)
+    users = []
+
+    # real participants, plus the recording user and an observer who never speak
+    uids = ["{}-user{}".format(name, i) for i in range(num_users)]
+    for i, uid in enumerate(uids):
+        users.append(make_user(rng, uid, "Participant {} {}".format(name, i), "participant", start, speaks_per_user))
+    users.append(make_user(rng, name + "-record", "Record", "admin", start, 0))
+    users.append(make_user(rng, name + "-observer", "Observer " + name, "observer", start, 0))
+
+    # the deliberation runs from the moderator's introductions until the last speak finishes
+    end = max([block["finishTime"] for user in users for block in user["speakBlocks"]] + [start + 60_000])
+    transcript = [{"type": "moderator", "text": "Introductions", "t": start}]
+    for uid in uids:
+        for _ in range(rng.randint(0, 2)):
+            transcript.append({"type": "submitQuestion", "userId": uid, "t": rng.randint(start, end)})
+        for _ in range(rng.randint(0, 3)):
+            transcript.append({"type": "submitQuestionRanks", "userId": uid, "t": rng.randint(start, end)})
+        if rng.random() < 0.05:
+            transcript.append({"type": "abusiveLanguage", "userId": uid, "t": rng.randint(start, end)})
+    transcript.append({"type": "moderator", "text": "Deliberation ends", "t": end})
+    transcript.sort(key=lambda event: event["t"])
+
+    polls = {}
+    for i in range(rng.randint(1, 4)):
+        polls["poll{}".format(i)] = {"type": "advanceAgenda", "data": {"from": rng.choice(uids)}, "t": rng.randint(start, end)}
+
+    return {
+        "roomData": {"name": name, "id": name.lower().replace(" ", "-")},
+        "userData": users,
+        "transcriptData": transcript,
+        "pollData": polls,
+    }
+
+# Makes a single user, with speaks spread out after start. Some speak requests have no requestTime and some speaks have no length, as
+# happens in real exports.
+def make_user(rng, uid, screenName, role, start, num_speaks):
+    speakBlocks = []
+    t = start
+    for _ in range(num_speaks):
+        t += rng.randint(5_000, 240_000)
+        length = rng.choice([0, rng.randint(1_000, 120_000), rng.randint(1_000, 30_000)])
+        requestTime = None if rng.random() < 0.1 else t - rng.randint(0, 20_000)
+        speakBlocks.append({"requestTime": requestTime, "speakTime": t, "finishTime": t + length})
+        t += length
+
+    disconnectedBlocks = []
+    for _ in range(rng.choice([0, 0, 0, 1, 2])):
+        disconnected = rng.randint(start, start + 3_600_000)
+        disconnectedBlocks.append({"disconnectedTime": disconnected, "connectedTime": disconnected + rng.randint(1_000, 120_000)})
+
+    advanceAgenda = [{"answer": rng.randint(0, 1)} for _ in range(rng.randint(0, 3))]
+
+    return {
+        "id": uid,
+        "screenName": screenName,
+        "role": role,
+        "speakBlocks": speakBlocks,
+        "disconnectedBlocks": disconnectedBlocks,
+        "advanceAgenda": advanceAgenda,
+    }
+
+# Writes num_files exports to folder and returns their paths.
+def generate(folder, rooms=10, users=8, speaks=20, files=1, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for f in range(files):
+        export = [make_room(rng, "Room {}".format(r), users, speaks) for r in range(rooms)]
+        path = os.path.join(folder, "synthetic_{}.json".format(f))
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json.dump(export, json_file)
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write seeded synthetic deliberation exports.")
+    parser.add_argument("folder", help="folder to write the exports to")
+    parser.add_argument("--rooms", type=int, default=10, help="rooms per export")
+    parser.add_argument("--users", type=int, default=8, help="participants per room")
+    parser.add_argument("--speaks", type=int, default=20, help="speak blocks per participant")
+    parser.add_argument("--files", type=int, default=1, help="number of exports to write")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = generate(args.folder, args.rooms, args.users, args.speaks, args.files, args.seed)
+    print("Wrote " + str(len(paths)) + " exports to " + args.folder)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import io
+import glob
+import gzip
+import queue
+import zipfile
+import threading
+import importlib.util
+
+# Reading exports straight out of compressed files, so an archive kept compressed never has to be unpacked to disk first. An export can
+# be:
+#   x.json                       read as is
+#   x.json.gz                    gzip
+#   x.json.zst                   zstandard (needs pip install zstandard)
+#   archive.zip::path/x.json     a json inside a zip archive, named by the archive's path and the json's path in it
+# open_export gives a binary file for any of these, decompressing as it's read, so nothing is written to disk. For the compressed ones the
+# decompression runs on a background thread a few chunks ahead of the reader, so it overlaps with parsing (zlib and zstandard let go of
+# the GIL while they work).
+
+SUFFIXES = [".json.gz", ".json.zst", ".json"]
+MEMBER_SEPARATOR = "::"
+
+# Size of each chunk the background thread decompresses, and how many decompressed chunks it may get ahead of the reader.
+CHUNK_SIZE = 1 << 20
+READ_AHEAD = 4
+
+# Returns True for file names that are exports (compressed or not). Zip archives are looked inside with zip_members instead.
+def is_export(filename):
+    return any(filename.endswith(suffix) for suffix in SUFFIXES)
+
+# The zstandard exports readable has already said it's skipping, so a folder that's looked through again and again (see watch.py) only
+# says so once.
+_skipped = set()
+
+# Leaves out the zstandard exports if zstandard isn't installed, saying why, so a run gets through everything else rather than failing
+# part way.
+def readable(exports):
+    if importlib.util.find_spec("zstandard") is not None:
+        return exports
+    for export in exports:
+        if export.endswith(".zst") and export not in _skipped:
+            _skipped.add(export)
+            print("Skipping " + export + ": reading .json.zst files needs zstandard. Run: pip install zstandard")
+    return [export for export in exports if not export.endswith(".zst")]
+
+# Returns the paths of the jsons inside a zip archive, as archive.zip::member paths, in the order they are stored.
+def zip_members(archive):
+    try:
+        with zipfile.ZipFile(archive) as z:
+            names = [info.filename for info in z.infolist() if not info.is_dir() and is_export(info.filename)
+                     and not info.filename.startswith("__MACOSX/")]
+    except (OSError, zipfile.BadZipFile) as e:
+        print("Couldn't read " + archive + ": " + repr(e))
+        return []
+    return [archive + MEMBER_SEPARATOR + name for name in names]
+
+# Returns every export directly in folder: plain jsons first, in the order glob finds them like the scripts always have, then gzip and
+# zstandard jsons, then the jsons inside each zip archive.
+def find_exports(folder):
+    exports = glob.glob(os.path.join(folder, "*.json"))
+    exports += glob.glob(os.path.join(folder, "*.json.gz"))
+    exports += glob.glob(os.path.join(folder, "*.json.zst"))
+    for archive in glob.glob(os.path.join(folder, "*.zip")):
+        exports += zip_members(archive)
+    return readable(exports)
+
+# Like find_exports, for a folder whose file names are already known (eg. from os.walk). Files are taken in the order given.
+def exports_in(folder, filenames):
+    exports = [os.path.join(folder, f) for f in filenames if is_export(f)]
+    for f in filenames:
+        if f.endswith(".zip"):
+            exports += zip_members(os.path.join(folder, f))
+    return readable(exports)
+
+# Splits an export path into the file on disk and the path of the json inside it (None unless it's in a zip archive).
+def split(path):
+    path = str(path)
+    if MEMBER_SEPARATOR in path:
+        archive, member = path.split(MEMBER_SEPARATOR, 1)
+        return archive, member
+    return path, None
+
+# Returns the os.stat of the file on disk an export is read from (the archive, for a json inside a zip).
+def stat(path):
+    return os.stat(split(path)[0])
+
+# Returns how many bytes of disk an export takes up (its compressed size inside a zip archive).
+def disk_size(path):
+    archive, member = split(path)
+    if member is None:
+        return os.path.getsize(archive)
+    with zipfile.ZipFile(archive) as z:
+        return z.getinfo(member).compress_size
+
+# Returns the name the scripts give an export's output: the file name without its extensions, and for a json in a zip archive, the
+# archive's name and the json's joined by "_".
+def export_name(path):
+    archive, member = split(path)
+    if member is None:
+        return os.path.basename(archive).split('.')[0]
+    return os.path.basename(archive).split('.')[0] + "_" + os.path.basename(member).split('.')[0]
+
+# Returns True if an export is read as is, so it can be memory-mapped or seeked around in (see roomindex.py).
+def is_plain(path):
+    archive, member = split(path)
+    return member is None and not archive.endswith((".gz", ".zst"))
+
+# Opens an export for reading as a binary file, decompressing it on a background thread if it's compressed.
+def open_export(path):
+    archive, member = split(path)
+    if member is not None:
+        z = zipfile.ZipFile(archive)
+        try:
+            return ThreadedReader(z.open(member), [z])
+        except Exception:
+            z.close()
+            raise
+    if archive.endswith(".gz"):
+        return ThreadedReader(gzip.open(archive, 'rb'))
+    if archive.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .json.zst files needs zstandard. Run: pip install zstandard")
+        raw = open(archive, 'rb')
+        return ThreadedReader(zstandard.ZstdDecompressor().stream_reader(raw), [raw])
+    return open(archive, 'rb')
+
+# Opens an export for reading as text, the way the scripts have always opened jsons (utf-8, with anything invalid replaced).
+def open_text(path):
+    binary = open_export(path)
+    if isinstance(binary, ThreadedReader):
+        binary = io.BufferedReader(binary, CHUNK_SIZE)
+    return io.TextIOWrapper(binary, encoding='utf-8', errors="replace")
+
+# A binary file that reads from another one on a background thread. The thread reads CHUNK_SIZE at a time into a queue at most
+# READ_AHEAD chunks long, and read() takes from the queue, so decompressing the next chunks overlaps with whatever is done with this one.
+# An error on the thread is raised again from read(). Closing stops the thread and closes the source and anything in others (eg. the
+# zip archive a member came from).
+class ThreadedReader(io.RawIOBase):
+    def __init__(self, source, others=[]):
+        self.source = source
+        self.others = others
+        self.chunks = queue.Queue(READ_AHEAD)
+        self.stopping = threading.Event()
+        self.leftover = b""
+        self.done = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while not self.stopping.is_set():
+                chunk = self.source.read(CHUNK_SIZE)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    # Waits for room in the queue, giving up if the reader is closed in the meantime.
+    def _put(self, item):
+        while not self.stopping.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    # Waits for the next chunk from the thread if everything read so far has been handed out.
+    def _fill(self):
+        while not self.leftover and not self.done:
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                self.done = True
+                raise chunk
+            if not chunk:
+                self.done = True
+            self.leftover = chunk
+
+    def readinto(self, buffer):
+        self._fill()
+        size = min(len(buffer), len(self.leftover))
+        buffer[:size] = self.leftover[:size]
+        self.leftover = self.leftover[size:]
+        return size
+
+    # Hands back the chunks as they are rather than copying them through readinto.
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        self._fill()
+        data = self.leftover[:size]
+        self.leftover = self.leftover[size:]
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            self.thread.join()
+            self.source.close()
+            for other in self.others:
+                other.close()
+        io.RawIOBase.close(self)
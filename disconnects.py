@@ -0,0 +1,68 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+
+# Disconnected time, worked out from users' disconnected blocks as intervals rather than by adding up connectedTime - disconnectedTime for
+# each block. For every user at once:
+#   - a block that never reconnected (no connectedTime) runs to the end of the room's deliberation
+#   - blocks are clipped to the room's deliberation window, from its "Introductions" to its "Deliberation ends" moderator events. A room
+#     without the markers isn't clipped at the start, and ends at the latest time anything happened in it.
+#   - overlapping and duplicate blocks (eg. from a burst of reconnects) are merged, so no time is counted twice
+# giving each user's total disconnected time, number of separate disconnections and longest disconnection.
+
+class RoomDisconnects:
+    def __init__(self, names, uids, total, count, longest):
+        # lined up with each other, one entry per user in the room in the order they appear in the export
+        self.names = names
+        self.uids = uids
+        self.total = total
+        self.count = count
+        self.longest = longest
+
+    def __len__(self):
+        return len(self.uids)
+
+# Takes in each block's owner (an index into the users, 0..numusers-1), disconnected time and connected time (NaN if it never
+# reconnected), and the start and end of each user's deliberation window (NaN for no start marker). Returns the total, count and
+# longest disconnection per user as arrays of numusers.
+def disconnected_times(owners, disconnected, connected, windowstart, windowend, numusers):
+    owners = np.asarray(owners, dtype=np.int64)
+    disconnected = np.asarray(disconnected, dtype=np.float64)
+    connected = np.asarray(connected, dtype=np.float64)
+    windowstart = np.asarray(windowstart, dtype=np.float64)
+    windowend = np.asarray(windowend, dtype=np.float64)
+
+    # open blocks run to the end of the window, then everything is clipped to it
+    ends = np.where(np.isnan(connected), windowend[owners], connected)
+    ends = np.minimum(ends, windowend[owners])
+    starts = np.fmax(disconnected, windowstart[owners])
+    keep = ends > starts
+    return merge_intervals(owners[keep], starts[keep].astype(np.int64), ends[keep].astype(np.int64), numusers)
+
+# Takes in intervals and the owner of each, and returns the total length of the union of each owner's intervals, the number of separate
+# intervals in it and the longest of them, as arrays of numowners. All of the owners are handled together: the intervals are sorted by
+# owner and start, and an interval starts a new stretch when it begins after every earlier interval of the same owner has ended.
+def merge_intervals(owners, starts, ends, numowners):
+    total = np.zeros(numowners, dtype=np.int64)
+    count = np.zeros(numowners, dtype=np.int64)
+    longest = np.zeros(numowners, dtype=np.int64)
+    if len(owners) == 0:
+        return total, count, longest
+
+    order = np.lexsort((starts, owners))
+    owners, starts, ends = owners[order], starts[order], ends[order]
+
+    # the latest end so far within each owner. Offsetting every owner's times past the one before lets one running maximum cover them all.
+    base = starts.min()
+    offset = ends.max() - base + 1
+    reach = np.maximum.accumulate((ends - base) + owners * offset) - owners * offset + base
+
+    newstretch = np.ones(len(owners), dtype=bool)
+    newstretch[1:] = (owners[1:] != owners[:-1]) | (starts[1:] > reach[:-1])
+    firsts = np.flatnonzero(newstretch)
+    lengths = np.maximum.reduceat(reach, firsts) - starts[firsts]
+    stretchowners = owners[firsts]
+
+    total += np.bincount(stretchowners, weights=lengths, minlength=numowners).astype(np.int64)
+    count += np.bincount(stretchowners, minlength=numowners)
+    np.maximum.at(longest, stretchowners, lengths)
+    return total, count, longest
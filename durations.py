@@ -0,0 +1,66 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+
+# Formatting for lengths of time. The scripts keep every length as integer milliseconds while they work, and only turn them into
+# something readable at the very end, a whole column at a time, with format_durations. The styles are:
+#   mm:ss     minutes and seconds, eg. 05:06. Minutes keep counting past an hour (75:03) rather than wrapping around.
+#   h:mm:ss   hours, minutes and seconds, eg. 1:15:03
+#   seconds   the length in seconds, as a number, keeping partial seconds (eg. 306.25)
+#   ms        the length in milliseconds, as a number
+# The clock styles drop partial seconds, and give negative lengths a leading "-".
+
+STYLES = ["mm:ss", "h:mm:ss", "seconds", "ms"]
+
+# Takes in an array (or list) of lengths in milliseconds and returns them all formatted in the given style, as an object array of strings
+# for the clock styles or a numeric array for seconds and ms.
+def format_durations(lengths, style="mm:ss"):
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    if style == "ms":
+        return lengths
+    if style == "seconds":
+        return lengths / 1000
+    if style not in STYLES:
+        raise ValueError("Unknown duration style " + repr(style) + ", expected one of " + ", ".join(STYLES))
+
+    if len(lengths) == 0:
+        return np.array([], dtype=object)
+
+    seconds = np.abs(lengths) // 1000
+    if style == "mm:ss":
+        minutes, seconds = np.divmod(seconds, 60)
+        out = two_digits(minutes)
+    else:
+        hours, seconds = np.divmod(seconds, 3600)
+        minutes, seconds = np.divmod(seconds, 60)
+        out = np.char.add(np.char.add(hours.astype(str), ":"), two_digits(minutes))
+    out = np.char.add(np.char.add(out, ":"), two_digits(seconds))
+
+    out = np.where(lengths < 0, np.char.add("-", out), out)
+    return out.astype(object)
+
+# Formats a single length in milliseconds, the same as format_durations but without numpy. Prefer format_durations for whole columns.
+def format_duration(length, style="mm:ss"):
+    length = int(length)
+    if style == "ms":
+        return length
+    if style == "seconds":
+        return length / 1000
+    if style not in STYLES:
+        raise ValueError("Unknown duration style " + repr(style) + ", expected one of " + ", ".join(STYLES))
+
+    seconds = abs(length) // 1000
+    if style == "mm:ss":
+        minutes, seconds = divmod(seconds, 60)
+        out = "{:02d}:{:02d}".format(minutes, seconds)
+    else:
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        out = "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+    return "-" + out if length < 0 else out
+
+# Takes in an array of non-negative integers and returns them as strings padded to at least two digits. (np.char.zfill can't be used
+# here, since it cuts its results down to the width asked for.)
+def two_digits(values):
+    strings = values.astype(str)
+    return np.where(values < 10, np.char.add("0", strings), strings)
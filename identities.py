@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import zlib
+import pickle
+import argparse
+from array import array
+import analyzers
+import profiling
+import compressed
+
+# A table of every participant seen across all of the deliberations processed, kept between runs, so questions like "which rooms and
+# deliberations has this uid been in?" are a lookup rather than a scan through every export. Every uid, screen name, room name and export
+# is stored once and given a small integer id (like the codes in a speakstore, but shared by every file and every run), and each
+# appearance of a participant is just four of those ids in compact arrays:
+#   uid, screen name, room, export   one entry per participant per room per export
+# The table is saved as a compressed pickle (".speakerdata_identities" by default). votingparser adds the participants of the files it
+# reads with --identities, and "python identities.py --update" adds exports directly:
+#
+#   python identities.py --update term1 term2        add every export under term1 and term2
+#   python identities.py u123                        every deliberation and room u123 was in, and the names they used
+#
+# The same participants, screen names and rooms come up again and again across an archive, so the objects the scripts build for them
+# (votingparser's participants, connectedtime's users, the values of a speakstore) keep their strings through intern,
+# and every copy of a uid, name or room read from any file is the one string in memory.
+
+DEFAULT_PATH = ".speakerdata_identities"
+
+# Returns the one shared copy of a string (see sys.intern), so objects holding the same uid, screen name or room share it rather than each
+# keeping their own. Anything that isn't a string (eg. a missing uid) is returned as it is.
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+# Bump this whenever what's saved changes shape, so an old table is started again rather than read wrongly.
+TABLE_VERSION = 1
+
+class IdentityTable:
+    def __init__(self):
+        # the distinct values of each kind, so values[kind][id] is the string with that id
+        self.values = {"uid": [], "name": [], "room": [], "export": []}
+        self.ids = {kind: {} for kind in self.values}
+        # export id: (size, mtime) of the file when its participants were recorded
+        self.stats = {}
+
+        self._uid = array('l')
+        self._name = array('l')
+        self._room = array('l')
+        self._export = array('l')
+        # uid id: positions of its rows, and name id: ids of the uids that used it, worked out when first asked for
+        self._byuid = None
+        self._byname = None
+
+    # Returns the id of a value of one kind ("uid", "name", "room" or "export"), giving it the next id if it's new.
+    def encode(self, kind, value):
+        ids = self.ids[kind]
+        if value not in ids:
+            ids[value] = len(self.values[kind])
+            self.values[kind].append(value)
+        return ids[value]
+
+    # Returns the id of a value, or None if the table has never seen it.
+    def lookup(self, kind, value):
+        return self.ids[kind].get(value)
+
+    # Records the participants of an export, replacing whatever was recorded for it before. appearances is an iterable of
+    # (uid, screen name, room name), and repeats are only recorded once.
+    def record(self, file, appearances):
+        export = self.encode("export", os.path.abspath(file))
+        self.forget(export)
+        try:
+            stat = compressed.stat(file)
+            self.stats[export] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            self.stats[export] = None
+
+        seen = set()
+        for uid, name, room in appearances:
+            row = (self.encode("uid", uid), self.encode("name", name), self.encode("room", room))
+            if row in seen:
+                continue
+            seen.add(row)
+            self._uid.append(row[0])
+            self._name.append(row[1])
+            self._room.append(row[2])
+            self._export.append(export)
+        self._byuid = None
+        self._byname = None
+
+    # Drops everything recorded for an export (by id). Every recorded export has an entry in stats, so exports that were never recorded
+    # cost nothing, and the rows of one that was are filtered out of all the columns in one pass.
+    def forget(self, export):
+        if export not in self.stats:
+            return
+        columns = [self._uid, self._name, self._room, self._export]
+        kept = [array('l') for column in columns]
+        for row in zip(*columns):
+            if row[3] != export:
+                for column, value in zip(kept, row):
+                    column.append(value)
+        self._uid, self._name, self._room, self._export = kept
+        del self.stats[export]
+        self._byuid = None
+        self._byname = None
+
+    # Returns True if an export's participants were recorded from the file as it is now.
+    def up_to_date(self, file):
+        export = self.lookup("export", os.path.abspath(file))
+        if export is None or self.stats.get(export) is None:
+            return False
+        stat = compressed.stat(file)
+        return self.stats[export] == (stat.st_size, stat.st_mtime_ns)
+
+    # Works out the rows of every uid and the uids of every name in one pass, the first time either is asked for.
+    def _index(self):
+        if self._byuid is None:
+            self._byuid = {}
+            self._byname = {}
+            for i, (u, n) in enumerate(zip(self._uid, self._name)):
+                self._byuid.setdefault(u, []).append(i)
+                self._byname.setdefault(n, {})[u] = None
+
+    # Returns the positions of every appearance of a uid.
+    def _rows(self, uid):
+        code = self.lookup("uid", uid)
+        if code is None:
+            return []
+        self._index()
+        return self._byuid.get(code, [])
+
+    # Returns (export, room name) for every room a uid was in, in the order they were recorded.
+    def rooms_of(self, uid):
+        return [(self.values["export"][self._export[i]], self.values["room"][self._room[i]]) for i in self._rows(uid)]
+
+    # Returns the exports (deliberations) a uid was in, in the order they were recorded.
+    def exports_of(self, uid):
+        return list(dict.fromkeys(export for export, room in self.rooms_of(uid)))
+
+    # Returns the screen names a uid has used, in the order they were recorded.
+    def names_of(self, uid):
+        return list(dict.fromkeys(self.values["name"][self._name[i]] for i in self._rows(uid)))
+
+    # Returns the uids that have used a screen name.
+    def uids_named(self, name):
+        code = self.lookup("name", name)
+        if code is None:
+            return []
+        self._index()
+        return [self.values["uid"][u] for u in self._byname.get(code, {})]
+
+    # The lookups by uid and name are rebuilt on demand, so leave them out when saving.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_byuid'] = None
+        state['_byname'] = None
+        return state
+
+    # Tables saved before the lookup by name was added don't have it.
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._byname = None
+
+    def __len__(self):
+        return len(self._uid)
+
+# Loads the table saved at path, or returns an empty one if there isn't one (or it's from a different TABLE_VERSION or damaged).
+def load(path=DEFAULT_PATH):
+    try:
+        with open(path, 'rb') as f:
+            version, table = pickle.loads(zlib.decompress(f.read()))
+        if version == TABLE_VERSION:
+            return table
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print("Starting a new identity table, couldn't read " + path + ": " + repr(e))
+    return IdentityTable()
+
+# Saves the table to path. Written to a temporary file and moved into place, so a run that's stopped part way never leaves half a table.
+def save(table, path=DEFAULT_PATH):
+    temp = path + "." + str(os.getpid()) + "." + str(time.time_ns()) + ".tmp"
+    with open(temp, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps((TABLE_VERSION, table), protocol=pickle.HIGHEST_PROTOCOL)))
+    os.replace(temp, path)
+
+# Returns the (uid, screen name, room name) of every user in every room of a votingparser partial (participants, group_list).
+def partial_appearances(partial):
+    participants, group_list = partial
+    return [(person.uid, person.name, room) for person in participants.values() for room in person.groups]
+
+# Collects the (uid, screen name, room name) of every user in an export.
+@analyzers.register("identities")
+class IdentityAnalyzer(analyzers.Analyzer):
+    def __init__(self):
+        self.appearances = []
+
+    def user(self, roomname, user):
+        self.appearances.append((user.get("id"), user.get("screenName"), roomname))
+
+    def result(self):
+        return self.appearances
+
+# Records the participants of every export in paths (files or folders, searched however deeply nested) that has changed since it was last
+# recorded. Returns the number of exports read.
+def update(table, paths):
+    read = 0
+    for path in paths:
+        if os.path.isfile(path):
+            files = compressed.zip_members(path) if path.endswith(".zip") else [path]
+        else:
+            files = []
+            for folder, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                files += compressed.exports_in(folder, sorted(filenames))
+
+        for file in files:
+            if table.up_to_date(file):
+                continue
+            print("Reading " + file + "...")
+            try:
+                with profiling.for_file(file), profiling.stage("identities") as stage:
+                    appearances = analyzers.run_analyzers(file, [IdentityAnalyzer()])[0]
+                    stage.records = len(appearances)
+            except Exception as e:
+                print("Failed to read " + file + ": " + repr(e))
+                continue
+            table.record(file, appearances)
+            read += 1
+    return read
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up the deliberations, rooms and names of participants across every export seen.")
+    parser.add_argument("uids", nargs="*", help="uids to look up")
+    parser.add_argument("--table", default=DEFAULT_PATH, help="the identity table to use (default " + DEFAULT_PATH + ")")
+    parser.add_argument("--update", nargs="*", metavar="PATH",
+                        help="first add the participants of every export in these files or folders (the current folder if none are given) "
+                        "that has changed since it was last added")
+    parser.add_argument("--name", action="append", default=[], help="also look up the uids that have used this screen name")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    cprofiler = profiling.start(args)
+
+    table = load(args.table)
+    if args.update is not None:
+        read = update(table, args.update or ["."])
+        save(table, args.table)
+        print("Added " + str(read) + " exports. The table has " + str(len(table.values["uid"])) + " participants in "
+              + str(len(table.values["export"])) + " exports.")
+
+    for uid in args.uids:
+        rooms = table.rooms_of(uid)
+        if not rooms:
+            print("\n" + uid + " hasn't been seen")
+            continue
+        print("\n" + uid + " (" + ", ".join(table.names_of(uid)) + ")")
+        for export in table.exports_of(uid):
+            print("  " + export + ": " + ", ".join(room for e, room in rooms if e == export))
+
+    for name in args.name:
+        print("\n" + name + ": " + (", ".join(table.uids_named(name)) or "no uids"))
+
+    profiling.finish(args, cprofiler)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+
+# Sweep line over the speak instances of a room. Every speak becomes a start event and a finish event, the events are sorted once, and a
+# running count of how many people are speaking is kept along the timeline. That splits the room's time into segments with a fixed number
+# of speakers in each, which gives all of the following in O(n log n) rather than comparing every pair of speaks:
+#   span      time from the first speak starting to the last one finishing
+#   speaking  time with at least one person speaking
+#   overlap   time with two or more people speaking at once
+#   silence   time in the span with nobody speaking
+#   floor     for each speaker, the total time they were the only one speaking, and the longest stretch of it without anybody else
+#             speaking or a pause. A speaker who finishes and starts again at the same moment keeps the floor.
+# A finish and a start at the same moment don't count as overlapping.
+
+class RoomSweep:
+    def __init__(self, people, first, floortime, longestfloor, span, speaking, overlap, silence):
+        # the codes of the speakers, in the order they first started speaking, and the row each first spoke in
+        self.people = people
+        self.first = first
+        # per speaker, lined up with people
+        self.floortime = floortime
+        self.longestfloor = longestfloor
+        # for the whole room
+        self.span = span
+        self.speaking = speaking
+        self.overlap = overlap
+        self.silence = silence
+
+# Takes in the start times, end times and speaker codes (any integers, eg. uid codes from a speakstore) of a room's speaks, and returns a
+# RoomSweep. Zero length speaks should be left out beforehand.
+def sweep(starts, ends, who):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    who = np.asarray(who, dtype=np.int64)
+
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return RoomSweep(empty, empty, empty, empty, 0, 0, 0, 0)
+
+    # number the speakers 0..k-1 in the order they first start speaking
+    codes, first, local = np.unique(who, return_index=True, return_inverse=True)
+    byfirst = np.argsort(first, kind='stable')
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[byfirst] = np.arange(len(codes))
+    local = rank[local]
+
+    # sort the events by time, with finishes before starts at the same moment
+    n = len(starts)
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(n, dtype=np.int64), -np.ones(n, dtype=np.int64)])
+    speakers = np.concatenate([local, local])
+    order = np.lexsort((deltas, times))
+    times = times[order]
+
+    # after each event: how many are speaking, and the sum of their codes, which is the code of the speaker whenever only one is
+    active = np.cumsum(deltas[order])[:-1]
+    holder = np.cumsum(deltas[order] * speakers[order])[:-1]
+    lengths = np.diff(times)
+
+    speaking = int(lengths[active >= 1].sum())
+    overlap = int(lengths[active >= 2].sum())
+    span = int(times[-1] - times[0])
+
+    # the segments that take up time, labelled with their only speaker or -1 for nobody/several. Segments tile the timeline, so a run
+    # of segments with the same label is a single uninterrupted stretch.
+    keep = lengths > 0
+    lengths = lengths[keep]
+    label = np.where(active == 1, holder, -1)[keep]
+
+    floortime = np.zeros(len(codes), dtype=np.int64)
+    longestfloor = np.zeros(len(codes), dtype=np.int64)
+    if len(lengths) > 0:
+        runstarts = np.flatnonzero(np.concatenate([[True], label[1:] != label[:-1]]))
+        runlengths = np.add.reduceat(lengths, runstarts)
+        runlabels = label[runstarts]
+        solo = runlabels >= 0
+        floortime = np.bincount(runlabels[solo], weights=runlengths[solo], minlength=len(codes)).astype(np.int64)
+        np.maximum.at(longestfloor, runlabels[solo], runlengths[solo])
+
+    return RoomSweep(codes[byfirst], first[byfirst], floortime, longestfloor, span, speaking, overlap, span - speaking)
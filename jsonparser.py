@@ -1,73 +1,248 @@
-import pandas as pd
-import glob
+import lightweight
+pd = lightweight.lazy_import("pandas")
+np = lightweight.lazy_import("numpy")
 import os
-import time
-import datetime
 import sys
-import re
-
-# This datatype defines a single speak instance. By extracting all the speak instances in our data into a giant list of these,
-# it makes it easier to write new functions to analyze the data.
-class speakInstance:
-    def __init__(self, group, speaker, uid, speakBlock):
-        if speakBlock == 0:
-            self.uid = uid
-            self.start = 0
-            self.end = 0
-            self.requestTime = None
-            self.length = 0
-            self.speaker = speaker
-            self.group = group
-        else:
-            speakBlock = dict(speakBlock)
-            self.uid = uid
-            self.start = speakBlock['speakTime']
-            self.end = speakBlock['finishTime']
-            self.requestTime = speakBlock['requestTime']
-            self.length = self.end-self.start
-            self.speaker = speaker
-            self.group = group
-
-
-# Takes in a list of json files, performs the parsing and data organization, and writes the output to a xlsx file.
+import argparse
+import concurrent.futures
+import speakstore
+import parsecache
+import analyzers
+import profiling
+import durations
+import intervals
+import waits
+import outputs
+import roomindex
+import compressed
+import watch
+
+# Takes in a list of json files, performs the parsing and data organization, and writes the output to a xlsx file (or the files of
+# another output format). With overwrite, existing output for jsonname is written over instead of being kept (see outputs.write_sheets).
 # Add custom functions for new types of data orginization in the indicated block below and save their output to the
 # excel_sheets dictionary along with the name of the sheet you want the data to be written to.
-def generate_output(speak_instances, roomnames, jsonname):
+def generate_output(speak_instances, roomnames, jsonname, time_format="mm:ss", output_format="xlsx", overwrite=False):
 
     #######################################
     # Place functions for generating output here.
     # Be sure to add the output to excel_sheets in the format key=sheetname, value=dataframe
+    # If a new sheet needs more than the speak instances, write it as an analyzers.Analyzer and run it in the same pass over the
+    # file as SpeakInstancesAnalyzer, rather than looping over the data again.
 
     excel_sheets = {}
 
-    excel_sheets['Speak Instances By Group'] = organize_by_group(speak_instances, roomnames)
-    excel_sheets['Speaker Totals'] = total_speaker_times(speak_instances, roomnames)
+    with profiling.stage("organize_by_group") as stage:
+        excel_sheets['Speak Instances By Group'] = organize_by_group(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("total_speaker_times") as stage:
+        excel_sheets['Speaker Totals'] = total_speaker_times(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("organize_floor_time") as stage:
+        excel_sheets['Floor Time By Group'], excel_sheets['Overlap And Silence'] = organize_floor_time(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("organize_request_waits") as stage:
+        excel_sheets['Request Wait Times'] = organize_request_waits(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
 
     ########################################
 
-    # Write the output to a xlsx file
-    filename = check_for_existing_file(jsonname)
-    writer = pd.ExcelWriter(filename)
+    # Write the output in the format picked for the run (a xlsx workbook by default, see outputs.py)
+    with profiling.stage("write_" + output_format) as stage:
+        files = outputs.write_sheets(excel_sheets, jsonname, output_format, overwrite)
+        stage.records = len(excel_sheets)
+
+    return ", ".join(files)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Produce speaker data workbooks for every deliberation json in the current folder.")
+    parser.add_argument("--stream", action="store_true",
+                        help="read exports one room at a time instead of loading them into dataframes. Uses much less memory on large exports.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of files to process at once in separate processes. Use 0 for one per cpu core.")
+    parser.add_argument("--cache", nargs="?", const=parsecache.DEFAULT_DIRECTORY, default=None, metavar="DIR",
+                        help="keep the data parsed from each json in a cache folder (" + parsecache.DEFAULT_DIRECTORY + " by default) and reuse it "
+                        "on later runs for any file that hasn't changed.")
+    parser.add_argument("--cache-size", type=int, default=parsecache.DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="largest the cache folder is allowed to grow before old entries are deleted.")
+    parser.add_argument("--time-format", choices=durations.STYLES, default="mm:ss",
+                        help="how to write lengths of time in the output (default mm:ss)")
+    parser.add_argument("--output-format", choices=outputs.FORMATS, default="xlsx",
+                        help="what to write the output as (default xlsx). xlsx-streaming writes the workbook in constant memory, and csv, "
+                        "parquet and feather write a file per sheet.")
+    parser.add_argument("--rooms", metavar="NAMES",
+                        help="comma separated names of the only rooms to process. Reads just those rooms from each export through a "
+                        "room index saved next to it.")
+    parser.add_argument("--quick", action="store_true",
+                        help="only write the Speaker Totals sheet, as a csv, using nothing but the standard library. Starts and finishes "
+                        "much faster on small folders.")
+    parser.add_argument("--combined", action="store_true",
+                        help="instead of a workbook per json, write one Request Wait Times sheet for every json in the folder together, as "
+                        "\"<folder> - Combined\". Rooms with the same name in different jsons are counted as one.")
+    watch.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.quick and args.output_format != "xlsx":
+        parser.error("--quick always writes csv, so it can't be used with --output-format")
+    if args.watch and args.workers != 1:
+        parser.error("--watch processes files one at a time as they come in, so it can't be used with --workers")
+    if args.combined and (args.quick or args.watch or args.workers != 1):
+        parser.error("--combined reads the whole folder in one go, so it can't be used with --quick, --watch or --workers")
+    if not args.quick:
+        outputs.check_available(args.output_format)
+    rooms = roomindex.parse_rooms_argument(args.rooms)
+    cprofiler = profiling.start(args)
+
+    cache = None
+    if args.cache is not None:
+        cache = parsecache.ParseCache(args.cache, args.cache_size * 1024 * 1024)
+
+    if args.watch:
+        try:
+            watch_folder(os.getcwd(), args.stream, cache, args.time_format, args.output_format, rooms, args.quick, args.poll_seconds,
+                         args.settle_seconds)
+        except KeyboardInterrupt:
+            print("\nStopped watching. Exiting...")
+        profiling.finish(args, cprofiler)
+        return
 
-    for sheetname, data in excel_sheets.items():
-        data.to_excel(writer, sheet_name=sheetname)
+    json_files, names = grab_json_files()
 
-    # close the Pandas Excel writer and output the Excel file.
-    writer.save()
+    filename = None
+    if args.combined:
+        filename = process_combined(json_files, os.path.basename(os.getcwd()) + " - Combined", args.stream, cache, args.time_format,
+                                    args.output_format, rooms)
+    elif args.workers != 1:
+        filename = run_parallel(json_files, names, args.workers or os.cpu_count(), args.stream, cache, args.time_format,
+                                args.output_format, rooms, args.quick)
+    else:
+        for i in range(len(json_files)):
+            filename = process_file(json_files[i], names[i], args.stream, cache, args.time_format, args.output_format,
+                                    rooms, args.quick) or filename
 
-    return filename
+    profiling.finish(args, cprofiler)
 
-def main():
-    json_files, names = grab_json_files()
+    if filename is None:
+        print("\nNo data saved. Exiting...")
+    else:
+        print("\nData saved to " +  filename + ". Exiting...")
+    lightweight.pause(1.5)
+
+# Parses a single json file (or just the given rooms of it) and returns a tuple of its roomnames and speak instances, or None if the json
+# contains no user data.
+def extract_speak_instances(file, stream=False, rooms=None):
+    if stream:
+        roomnames, speak_instances = stream_json(file, ['Record'], rooms)
+        if roomnames is None:
+            return None
+        return roomnames, speak_instances
+
+    parsed_jsons, roomnames, names = parse_jsons([file], [file], rooms)
+    if len(parsed_jsons) == 0:
+        return None
+    return roomnames[0], get_speak_instances_from_json(parsed_jsons[0], ['Record'])
+
+# Runs the whole pipeline for a single json file: parsing, getting the speak instances and writing the output. Returns the name of the
+# output file, or None if the json contains no user data. This is what each worker process runs in parallel mode. If a ParseCache is
+# given, the speak instances are taken from it when the file hasn't changed since it was last parsed. Given a list of rooms, only those
+# rooms are processed. With quick, only the Speaker Totals csv is written, without pandas or numpy (see process_file_quick). With
+# overwrite, the output from an earlier run is written over.
+def process_file(file, name, stream=False, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None, quick=False,
+                 overwrite=False):
+    with profiling.for_file(file):
+        # the cache holds whole files, so runs over a subset of rooms go straight to the file
+        if rooms is not None:
+            cache = None
+        if quick:
+            return process_file_quick(file, name, cache, time_format, rooms, overwrite)
+        data = parsecache.cached(cache, file, "jsonparser", lambda file: extract_speak_instances(file, stream, rooms))
+        if data is None:
+            return None
+
+        roomnames, speak_instances = data
+        return generate_output(speak_instances, roomnames, name, time_format, output_format, overwrite)
+
+# Reads every json file in json_files (from the cache if it's given, like process_file) and writes the request wait times of all of them
+# together as a single Request Wait Times sheet under name, by combining their speak instances with speakstore.concat. Rooms are matched by
+# name, so a room that comes up in several jsons (eg. the same group meeting every week) gets one row, and so does each of its speakers.
+# Returns the name of the output, or None if none of the jsons contain user data.
+def process_combined(json_files, name, stream=False, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None):
+    if rooms is not None:
+        cache = None
+    roomnames = {}
+    stores = []
+    for file in json_files:
+        with profiling.for_file(file):
+            data = parsecache.cached(cache, file, "jsonparser", lambda file: extract_speak_instances(file, stream, rooms))
+        if data is None:
+            continue
+        roomnames.update(dict.fromkeys(str(room) for room in data[0]))
+        stores.append(data[1])
+    if not stores:
+        return None
+
+    with profiling.stage("organize_request_waits") as stage:
+        combined = speakstore.concat(stores)
+        sheet = organize_request_waits(combined, list(roomnames), time_format)
+        stage.records = len(combined)
+    with profiling.stage("write_" + output_format):
+        return ", ".join(outputs.write_sheets({'Request Wait Times': sheet}, name, output_format))
+
+# Hands each json file to a pool of worker processes so several files are processed at once. Each file is independent, so a file that
+# fails or has no user data is reported and skipped without stopping the others. Returns the name of the last output file written.
+def run_parallel(json_files, names, workers, stream=False, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None, quick=False):
+    filename = None
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i in range(len(json_files)):
+            if profiling.profiler.enabled:
+                future = pool.submit(profiling.call_profiled, profiling.profiler.trace_memory, process_file, json_files[i], names[i], stream,
+                                     cache, time_format, output_format, rooms, quick)
+            else:
+                future = pool.submit(process_file, json_files[i], names[i], stream, cache, time_format, output_format, rooms, quick)
+            futures[future] = json_files[i]
 
-    parsed_jsons, roomnames, names = parse_jsons(json_files, names)
+        for future in concurrent.futures.as_completed(futures):
+            file = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print("Failed to process " + file + ": " + repr(e))
+                continue
 
-    for i in range(len(parsed_jsons)):
-        speak_instances = get_speak_instances_from_json(parsed_jsons[i], ['Record'])
-        filename = generate_output(speak_instances, roomnames[i], names[i])
+            if profiling.profiler.enabled:
+                result, stages = result
+                profiling.profiler.merge(stages)
 
-    print("\nData saved to " +  filename + ". Exiting...")
-    time.sleep(1.5)
+            if result is None:
+                print("Skipped " + file + " because it contains no user data.")
+            else:
+                print("Saved data from " + file + " to " + result)
+                filename = result
+
+    return filename
+
+# Watch mode (see watch.py): processes each json in path as it's added or changed, until stopped with Ctrl+C. Each json's output is
+# written over the output from the last time it was processed rather than numbered, so there's always one up to date set per json.
+def watch_folder(path, stream=False, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None, quick=False,
+                 interval=watch.POLL_SECONDS, settle=watch.SETTLE_SECONDS):
+    watcher = watch.Watcher(lambda: compressed.find_exports(path), settle)
+    print("Watching " + path + " for new and changed json files. Press Ctrl+C to stop.\n")
+
+    for ready, removed in watcher.changes(interval):
+        for file in ready:
+            try:
+                result = process_file(file, compressed.export_name(file), stream, cache, time_format, output_format, rooms, quick, True)
+            except Exception as e:
+                print("Failed to process " + file + ": " + repr(e))
+            else:
+                if result is None:
+                    print("Skipped " + file + " because it contains no user data.")
+                else:
+                    print("Saved data from " + file + " to " + result)
+            watcher.processed(file)
+        for file in removed:
+            watcher.processed(file)
 
 ########################################
 # Data organization functions
@@ -77,18 +252,20 @@ def main():
 # DisplayName_[roomname], ParticipantID_[roomname], SpeakTime_[roomname]. 
 # Use the list comprehensions below as a model for how to organize the data in different ways. Note that for room in roomnames would need
 # to be a different loop to organize the data by something other than room.
-def organize_by_group(all_speak_instances, roomnames):
+def organize_by_group(all_speak_instances, roomnames, time_format="mm:ss"):
     out = pd.DataFrame()
 
-    # sort the list of speak instances by start time. 
-    all_speak_instances.sort(key=lambda x: x.start)
+    # get the speak instances as columns, with every room's rows already sorted by start time
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+    columns = all_speak_instances.columns()
 
     # iterate over our many rooms, using list comprehensions to add the relevant data to our output dataframe
     for room in roomnames:
         room = str(room)
         # get the speak instances we care about create a dataframe to store this group's data in. We use this intermediate dataframe because
         # pandas is a bit annoying about adding new rows to a dataframe.
-        speaksinroom = [x for x in all_speak_instances if (x.group == room and x.length > 0)]
+        rows = all_speak_instances.room_rows(room, by_start=True)
+        speaksinroom = rows[columns['length'][rows] > 0]
         newelems = pd.DataFrame(index=range(len(speaksinroom)))
 
         # debug code for ensuring proper ordering of speaks
@@ -96,9 +273,9 @@ def organize_by_group(all_speak_instances, roomnames):
         # newelems[room + "_startTime"] = speakstarts
         
         # create lists with the data we care about and add them to our intermediate dataframe
-        newelems["DisplayName_" + room] = [x.speaker for x in speaksinroom]
-        newelems["ParticipantID_" + room] = [x.uid for x in speaksinroom]
-        newelems["SpeakTime_" + room] = [convert_to_minsecs(x.length) for x in speaksinroom] 
+        newelems["DisplayName_" + room] = all_speak_instances.decode('speaker', columns['speaker'][speaksinroom])
+        newelems["ParticipantID_" + room] = all_speak_instances.decode('uid', columns['uid'][speaksinroom])
+        newelems["SpeakTime_" + room] = durations.format_durations(columns['length'][speaksinroom], time_format)
         
         # concatenate the intermediate dataframe to our output dataframe
         out = pd.concat([out, newelems], axis=1)
@@ -108,47 +285,34 @@ def organize_by_group(all_speak_instances, roomnames):
 # Takes in a  list of speak instances and roomnames and returns a dataframe with the following columns corresponding to each room:
 # DisplayName_[roomname], ParticipantID_[roomname], TotalSpeakTime_[roomname].
 # Use the dictionary and loop below as a model for how to sum data in different ways.
-def total_speaker_times(all_speak_instances, roomnames):
+def total_speaker_times(all_speak_instances, roomnames, time_format="mm:ss"):
     out = pd.DataFrame()
 
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+
+    # total up every speaker in every room at once
+    totals = all_speak_instances.speaker_totals()
+
     # iterate over our many rooms
     for room in roomnames:
         room = str(room)
-        speaksinroom = [x for x in all_speak_instances if x.group == room]
+        code = all_speak_instances.room_code(room)
 
         #don't bother with rooms that have no speak instances
-        if len(speaksinroom) == 0:
+        if code not in totals:
             continue
 
-        # this will hold a tuple with the speaker's name and uid as the key, and a float for their total speak time as the value
-        totalspeaklengths = {}
-        numspeaktimes = {}
-        
-        # Get the total time each speaker spoke in the room
-        for speak in speaksinroom:
-            if (speak.uid, speak.speaker) in totalspeaklengths.keys():
-                totalspeaklengths[(speak.uid, speak.speaker)] += speak.length
-            else:
-                totalspeaklengths[(speak.uid, speak.speaker)] = speak.length
-
-        for speak in speaksinroom:
-            if speak.length > 0:
-                if (speak.uid, speak.speaker) in numspeaktimes.keys():
-                    numspeaktimes[(speak.uid, speak.speaker)] += 1
-                else:
-                    numspeaktimes[(speak.uid, speak.speaker)] = 1
-            else:
-                if (speak.uid, speak.speaker) not in numspeaktimes.keys():
-                    numspeaktimes[(speak.uid, speak.speaker)] = 0
+        # uids and speakers come back as codes in the order each speaker first appears in the room, alongside their total speak time
+        # and number of (non-zero length) speaks
+        uids, speakers, totalspeaklengths, numspeaktimes = totals[code]
 
-        newelems = pd.DataFrame(index=range(len(totalspeaklengths)))
+        newelems = pd.DataFrame(index=range(len(uids)))
 
         # append the info to our intermediate dataframe
-        displayorder = totalspeaklengths.keys() # .keys() can't be trusted to return the same order every time, so we need to store it. Thanks python.
-        newelems["DisplayName_" + room] = list(map(lambda x: x[1], displayorder))
-        newelems["ParticipantID_" + room] = list(map(lambda x: x[0], displayorder))
-        newelems["TotalSpeakTime_" + room] = [convert_to_minsecs(totalspeaklengths[x]) for x in displayorder]
-        newelems["NumSpeaks_" + room] = [numspeaktimes[x] for x in displayorder]
+        newelems["DisplayName_" + room] = all_speak_instances.decode('speaker', speakers)
+        newelems["ParticipantID_" + room] = all_speak_instances.decode('uid', uids)
+        newelems["TotalSpeakTime_" + room] = durations.format_durations(totalspeaklengths, time_format)
+        newelems["NumSpeaks_" + room] = numspeaktimes
 
         # concatenate the intermediate dataframe to our output dataframe
         out = pd.concat([out, newelems], axis=1)
@@ -156,12 +320,93 @@ def total_speaker_times(all_speak_instances, roomnames):
     return out
 
 
+# Takes in a list of speak instances and roomnames and returns two dataframes, both worked out with one sweep over each room's speaks
+# (see intervals.py):
+#   floor time, with the following columns corresponding to each room: DisplayName_[roomname], ParticipantID_[roomname],
+#   FloorTime_[roomname] (total time as the only one speaking) and LongestFloorTime_[roomname] (longest uninterrupted stretch of it)
+#   overlap and silence, with a row for each room: how long from its first speak to its last, how much of that somebody was speaking,
+#   how much two or more people were speaking at once, and how much was silent
+def organize_floor_time(all_speak_instances, roomnames, time_format="mm:ss"):
+    floor = pd.DataFrame()
+    rooms = []
+
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+    columns = all_speak_instances.columns()
+
+    for room in roomnames:
+        room = str(room)
+        rows = all_speak_instances.room_rows(room, by_start=True)
+        rows = rows[columns['length'][rows] > 0]
+
+        result = intervals.sweep(columns['start'][rows], columns['end'][rows], columns['uid'][rows])
+        rooms.append((room, result.span, result.speaking, result.overlap, result.silence, len(rows)))
+
+        #don't bother with rooms that have no speak instances
+        if len(rows) == 0:
+            continue
+
+        newelems = pd.DataFrame(index=range(len(result.people)))
+        newelems["DisplayName_" + room] = all_speak_instances.decode('speaker', columns['speaker'][rows[result.first]])
+        newelems["ParticipantID_" + room] = all_speak_instances.decode('uid', result.people)
+        newelems["FloorTime_" + room] = durations.format_durations(result.floortime, time_format)
+        newelems["LongestFloorTime_" + room] = durations.format_durations(result.longestfloor, time_format)
+
+        floor = pd.concat([floor, newelems], axis=1)
+
+    overlap = pd.DataFrame.from_records(rooms, columns=["Room", "SpanTime", "SpeakingTime", "OverlapTime", "SilenceTime", "NumSpeaks"])
+    for column in ["SpanTime", "SpeakingTime", "OverlapTime", "SilenceTime"]:
+        overlap[column] = durations.format_durations(overlap[column].to_numpy(), time_format)
+
+    return floor, overlap
+
+
+# Takes in a list of speak instances and roomnames and returns a dataframe of how long people waited between requesting the floor and
+# getting it (see waits.py). Each room has a row for everyone in it (DisplayName "All speakers") followed by a row for each speaker, with
+# their number of speaks, how many of those had a request time, and the mean, 50th, 90th and 99th percentile and longest wait.
+def organize_request_waits(all_speak_instances, roomnames, time_format="mm:ss"):
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+    columns = all_speak_instances.columns()
+    byroom, byspeaker = waits.request_waits(all_speak_instances)
+
+    # the speaker keys are room code * number of uids + uid code, so each room's speakers are a sorted slice
+    speakerrooms = byspeaker.keys // max(len(all_speak_instances.uids), 1)
+    bounds = np.searchsorted(speakerrooms, np.arange(len(all_speak_instances.rooms) + 1))
+
+    picks = []
+    for room in roomnames:
+        code = all_speak_instances.room_code(str(room))
+        if code is None or code not in byroom.keys:
+            continue
+        picks.append((byroom, np.searchsorted(byroom.keys, code), True))
+        picks += [(byspeaker, i, False) for i in range(bounds[code], bounds[code + 1])]
+
+    out = pd.DataFrame({
+        "Room": [all_speak_instances.rooms[columns['room'][table.rows[i]]] for table, i, whole in picks],
+        "DisplayName": ["All speakers" if whole else all_speak_instances.speakers[columns['speaker'][table.rows[i]]] for table, i, whole in picks],
+        "ParticipantID": ["" if whole else all_speak_instances.uids[columns['uid'][table.rows[i]]] for table, i, whole in picks],
+        "NumSpeaks": [table.speaks[i] for table, i, whole in picks],
+        "NumRequestTimes": [table.requests[i] for table, i, whole in picks],
+    })
+
+    stats = [("MeanWait", lambda table: table.mean)]
+    stats += [("P" + str(round(q * 100)) + "Wait", lambda table, n=n: table.quantiles[n]) for n, q in enumerate(waits.QUANTILES)]
+    stats += [("MaxWait", lambda table: table.maximum)]
+    for name, stat in stats:
+        values = np.array([stat(table)[i] for table, i, whole in picks], dtype=np.float64)
+        known = ~np.isnan(values)
+        formatted = np.full(len(values), None, dtype=object)
+        formatted[known] = durations.format_durations(np.round(values[known]), time_format)
+        out[name] = formatted
+
+    return out
+
+
 ########################################
 # Helper functions
 ########################################
 
-# Grab all json files in the same folder as the script. Optional override_path argument can be used to get files from a different
-# folder.
+# Grab all json files in the same folder as the script, including gzip and zstandard compressed ones and the jsons inside zip archives
+# (see compressed.py). Optional override_path argument can be used to get files from a different folder.
 def grab_json_files(override_path=""):
     
     jsonnames = []
@@ -172,38 +417,45 @@ def grab_json_files(override_path=""):
         path = os.getcwd()
 
     print("Searching " + path + " for json files\n")
-    json_files = glob.glob(os.path.join(path, "*.json"))
+    json_files = compressed.find_exports(path)
 
     # grab the filenames we find. There is probably a more efficent way to do this but here we are
     for filepath in json_files:
-        n = re.search(r".+\\([^\.]+)", filepath)
-        jsonnames.append(n.group(1))
+        jsonnames.append(compressed.export_name(filepath))
 
     #check that there are in fact some files to parse
     if len(json_files) == 0:
         print("No json files found in the current directory. Exiting.")
-        time.sleep(2.5)
+        lightweight.pause(2.5)
         sys.exit()
 
     return json_files, jsonnames
 
 # Takes in a list of json files paths and return a list of pandas dataframes containing the userdata from each json
-# organized in rows by room and a list of all roomnames parsed from the json files.
-def parse_jsons(json_files, names):
+# organized in rows by room and a list of all roomnames parsed from the json files. Given a list of rooms, only those rooms are
+# loaded, through the files' room indexes (see roomindex.py), rather than the whole of each file.
+def parse_jsons(json_files, names, rooms=None):
     parsed_jsons = []
     roomnames = []
 
     #loop through each file and parse the json data
     i = 0
     for file in json_files:
-        with open(file, 'r', encoding='utf-8', errors="replace") as json_file:
+        with compressed.open_text(file) as json_file:
             print("Parsing " + file + "...")
-            df = pd.read_json(json_file)
+            with profiling.stage("read_json") as stage:
+                if rooms is None:
+                    df = pd.read_json(json_file)
+                else:
+                    df = pd.DataFrame(list(roomindex.load_rooms(file, rooms)))
+                stage.records = len(df)
 
             #this is a bit messy, but it makes the first row of our output dataframes the room the data corresponds to.
-            df_roomdata = pd.json_normalize(df['roomData'])
             try:
-                df_userdata = pd.json_normalize(df['userData'])
+                with profiling.stage("json_normalize") as stage:
+                    df_roomdata = pd.json_normalize(df['roomData'])
+                    stage.records = len(df_roomdata)
+                    df_userdata = pd.json_normalize(df['userData'])
             except:
                 print("File " + file + " contains no user data.")
                 names.pop(i)
@@ -219,41 +471,167 @@ def parse_jsons(json_files, names):
 
     return parsed_jsons, roomnames, names
 
-# Takes in a pandas dataframe resulting from a single deliberation and turns it into a list of speak instances.
+# Takes in a pandas dataframe resulting from a single deliberation and turns it into a SpeakInstanceStore of speak instances.
 # The optional exclude argument can be used to exclude a list of users from the list of speak instances (such as admins, in 
 # cases where they spoke in the deliberation).
 def get_speak_instances_from_json(df, exclude_speakers=[]):
-    speak_instances = []
-    i = 0
-    for room in df['room']:
-        for col in df.columns[1:]:
-            user = df[col][i]
-            if (user != None) and (not user['screenName'] in exclude_speakers):
-                user = dict(user)
-                speakBlocks = list(user['speakBlocks'])
-                if speakBlocks:
-                    for block in speakBlocks:
-                        speak_instances.append(speakInstance(room, user['screenName'], user['id'], block))
-                if user['id']:
-                    speak_instances.append(speakInstance(room, user['screenName'], user['id'], 0))
-        i+=1
+    speak_instances = speakstore.SpeakInstanceStore()
+    with profiling.stage("speak_instances") as stage:
+        i = 0
+        for room in df['room']:
+            for col in df.columns[1:]:
+                user = df[col][i]
+                if (user != None) and (not user['screenName'] in exclude_speakers):
+                    user = dict(user)
+                    speakBlocks = list(user['speakBlocks'])
+                    if speakBlocks:
+                        for block in speakBlocks:
+                            speak_instances.add(room, user['screenName'], user['id'], block)
+                    if user['id']:
+                        speak_instances.add(room, user['screenName'], user['id'], 0)
+            i+=1
+        stage.records = len(speak_instances)
     return speak_instances
 
-# For prettifying speak-length data in miliseconds to human readable minutes:seconds format 
+# Builds the speak instances for a deliberation from the room, user and speakBlock records of an export, as an analyzer so it can share
+# a single pass over the file with any other metrics. The result is a tuple of the roomnames and a SpeakInstanceStore of the speak
+# instances, or (None, None) if the export contains no user data. Users named in exclude_speakers are left out, and so are observers if
+# exclude_observers is set.
+@analyzers.register("speakInstances")
+class SpeakInstancesAnalyzer(analyzers.Analyzer):
+    def __init__(self, exclude_speakers=['Record'], exclude_observers=False):
+        self.exclude_speakers = exclude_speakers
+        self.exclude_observers = exclude_observers
+        self.roomnames = []
+        self.speak_instances = speakstore.SpeakInstanceStore()
+        self.has_users = False
+
+    def room(self, roomname, room):
+        self.roomnames.append(roomname)
+        if "userData" in room:
+            self.has_users = True
+
+    def user(self, roomname, user):
+        # add the zero length instance that makes sure every user shows up in the totals, even if they never spoke
+        if self.included(user) and user['id']:
+            self.speak_instances.add(roomname, user['screenName'], user['id'], 0)
+
+    def speakBlock(self, roomname, user, block):
+        if self.included(user):
+            self.speak_instances.add(roomname, user['screenName'], user['id'], block)
+
+    def included(self, user):
+        if self.exclude_observers and user['role'] == 'observer':
+            return False
+        return user['screenName'] not in self.exclude_speakers
+
+    def result(self):
+        if not self.has_users:
+            return None, None
+        return self.roomnames, self.speak_instances
+
+# Streaming alternative to parse_jsons + get_speak_instances_from_json. Reads a single json file one room at a time and builds the
+# speak instances straight from its records, so the export is never held in memory as a whole. Returns the list of roomnames and a
+# SpeakInstanceStore of the speak instances, or (None, None) if the file contains no user data. Given a list of rooms, only those rooms are
+# read, through the file's room index.
+def stream_json(file, exclude_speakers=[], rooms=None):
+    print("Parsing " + file + "...")
+    with profiling.stage("stream_json") as stage:
+        source = file if rooms is None else roomindex.load_rooms(file, rooms)
+        roomnames, speak_instances = analyzers.run_analyzers(source, [SpeakInstancesAnalyzer(exclude_speakers)])[0]
+        stage.records = 0 if speak_instances is None else len(speak_instances)
+
+    if roomnames is None:
+        print("File " + file + " contains no user data.")
+
+    return roomnames, speak_instances
+
+# The quick path's version of SpeakInstancesAnalyzer and total_speaker_times together. Totals up each speaker's speak time and number of
+# speaks in each room as the records go by, in plain dictionaries, so nothing but the standard library is needed. Speakers are kept in
+# the order they first appear in each room, and the same users are left out as in the speak instances. The result is a tuple of the
+# roomnames and a dictionary of room: {(uid, speaker): [total length, number of speaks]}, or (None, None) if the export contains no user
+# data.
+@analyzers.register("speakerTotals")
+class SpeakerTotalsAnalyzer(SpeakInstancesAnalyzer):
+    def __init__(self, exclude_speakers=['Record'], exclude_observers=False):
+        SpeakInstancesAnalyzer.__init__(self, exclude_speakers, exclude_observers)
+        self.totals = {}
+
+    def user(self, roomname, user):
+        if self.included(user) and user['id']:
+            self.totals.setdefault(roomname, {}).setdefault((user['id'], user['screenName']), [0, 0])
+
+    def speakBlock(self, roomname, user, block):
+        if self.included(user):
+            length = block['finishTime'] - block['speakTime']
+            total = self.totals.setdefault(roomname, {}).setdefault((user['id'], user['screenName']), [0, 0])
+            total[0] += length
+            total[1] += length > 0
+
+    def result(self):
+        if not self.has_users:
+            return None, None
+        return self.roomnames, self.totals
+
+# Reads a single json file with SpeakerTotalsAnalyzer and returns its result, or None if the json contains no user data.
+def extract_speaker_totals(file, rooms=None):
+    print("Parsing " + file + "...")
+    with profiling.stage("speaker_totals") as stage:
+        source = file if rooms is None else roomindex.load_rooms(file, rooms)
+        roomnames, totals = analyzers.run_analyzers(source, [SpeakerTotalsAnalyzer()])[0]
+        stage.records = 0 if totals is None else sum(len(room) for room in totals.values())
+
+    if roomnames is None:
+        print("File " + file + " contains no user data.")
+        return None
+    return roomnames, totals
+
+# The --quick version of process_file: writes just the Speaker Totals sheet, as "<name> - Speaker Totals.csv", laid out exactly like the
+# csv the full run writes, but built with the standard library alone so pandas and numpy are never imported. Returns the name of the file
+# written, or None if the json contains no user data.
+def process_file_quick(file, name, cache=None, time_format="mm:ss", rooms=None, overwrite=False):
+    data = parsecache.cached(cache, file, "speakertotals", lambda file: extract_speaker_totals(file, rooms))
+    if data is None:
+        return None
+    roomnames, totals = data
+
+    with profiling.stage("write_quick_csv") as stage:
+        # a block of columns for each room that has speakers, like total_speaker_times
+        blocks = []
+        for room in roomnames:
+            if not totals.get(room):
+                continue
+            room = str(room)
+            header = ["DisplayName_" + room, "ParticipantID_" + room, "TotalSpeakTime_" + room, "NumSpeaks_" + room]
+            rows = [[speaker, uid, durations.format_duration(length, time_format), count]
+                    for (uid, speaker), (length, count) in totals[room].items()]
+            blocks.append((header, rows))
+
+        # rooms with fewer speakers than the longest are padded with empty cells, which makes their numbers floats in a dataframe
+        numrows = max([len(rows) for header, rows in blocks], default=0)
+        header = [""]
+        lines = [[] for _ in range(numrows)]
+        for blockheader, rows in blocks:
+            header += blockheader
+            for i in range(numrows):
+                if i >= len(rows):
+                    lines[i] += [None] * len(blockheader)
+                elif len(rows) < numrows:
+                    lines[i] += [float(value) if isinstance(value, (int, float)) else value for value in rows[i]]
+                else:
+                    lines[i] += rows[i]
+
+        if not overwrite:
+            name = outputs.available_name(name, ['Speaker Totals'], "csv")
+        filename = name + " - Speaker Totals.csv"
+        lightweight.write_csv(filename, [header], lines)
+        stage.records = numrows
+    return filename
+
+# For prettifying speak-length data in miliseconds to human readable minutes:seconds format. The organize functions format whole columns
+# at once with durations.format_durations instead.
 def convert_to_minsecs(length):
-    d = datetime.timedelta(milliseconds=length)
-    return str(d)[2:7]
-
-# Given a filename, checks for an existing output file, and returns the appropriate filename to use in the format output (n).xlsx.
-def check_for_existing_file(filename):
-    if os.path.isfile(filename + ".xlsx"):
-        i = 1
-        while True:
-            if not os.path.isfile(filename + " (" + str(i) + ").xlsx"):
-                return filename + " (" + str(i) + ").xlsx"
-            i+=1
-    else:
-        return filename + ".xlsx"
+    return durations.format_duration(length, "mm:ss")
 
 ########################################
 # Execution statement
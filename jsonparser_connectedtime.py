@@ -1,37 +1,29 @@
-import pandas as pd
-import glob
+import lightweight
+pd = lightweight.lazy_import("pandas")
+np = lightweight.lazy_import("numpy")
 import os
-import time
-import datetime
 import sys
-import re
-
-# This datatype defines a single speak instance. By extracting all the speak instances in our data into a giant list of these,
-# it makes it easier to write new functions to analyze the data.
-class speakInstance:
-    def __init__(self, group, speaker, uid, speakBlock):
-        if speakBlock == 0:
-            self.uid = uid
-            self.start = 0
-            self.end = 0
-            self.requestTime = None
-            self.length = 0
-            self.speaker = speaker
-            self.group = group
-        else:
-            speakBlock = dict(speakBlock)
-            self.uid = uid
-            self.start = speakBlock['speakTime']
-            self.end = speakBlock['finishTime']
-            self.requestTime = speakBlock['requestTime']
-            self.length = self.end-self.start
-            self.speaker = speaker
-            self.group = group
-
-# Takes in a list of json files, performs the parsing and data organization, and writes the output to a xlsx file.
+import speakstore
+import analyzers
+import jsonparser
+import parsecache
+import argparse
+import profiling
+import durations
+import outputs
+import disconnects
+import transcripts
+import roomindex
+import compressed
+import identities
+import watch
+
+# Takes in a list of json files, performs the parsing and data organization, and writes the output to a xlsx file (or the files of
+# another output format). With overwrite, existing output for jsonname is written over instead of being kept (see outputs.write_sheets).
 # Add custom functions for new types of data orginization in the indicated block below and save their output to the
 # excel_sheets dictionary along with the name of the sheet you want the data to be written to.
-def generate_output(speak_instances, roomnames, jsonname, users, flags):
+def generate_output(speak_instances, roomnames, jsonname, disconnections, flags, time_format="mm:ss", output_format="xlsx",
+                    overwrite=False):
 
     #######################################
     # Place functions for generating output here.
@@ -39,38 +31,118 @@ def generate_output(speak_instances, roomnames, jsonname, users, flags):
 
     excel_sheets = {}
 
-    excel_sheets['Speak Instances By Group'] = organize_by_group(speak_instances, roomnames)
-    excel_sheets['Speaker Totals'] = total_speaker_times(speak_instances, roomnames)
-    excel_sheets['Disconnected Time By Group'] = organize_connectedtimes_by_group(users, roomnames)
-    excel_sheets['Abuse Flags by Group'] = organize_abuseflags(flags, roomnames)
+    with profiling.stage("organize_by_group") as stage:
+        excel_sheets['Speak Instances By Group'] = organize_by_group(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("total_speaker_times") as stage:
+        excel_sheets['Speaker Totals'] = total_speaker_times(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("organize_floor_time") as stage:
+        excel_sheets['Floor Time By Group'], excel_sheets['Overlap And Silence'] = jsonparser.organize_floor_time(speak_instances, roomnames,
+                                                                                                                  time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("organize_request_waits") as stage:
+        excel_sheets['Request Wait Times'] = jsonparser.organize_request_waits(speak_instances, roomnames, time_format)
+        stage.records = len(speak_instances)
+    with profiling.stage("organize_connectedtimes") as stage:
+        excel_sheets['Disconnected Time By Group'] = organize_connectedtimes_by_group(disconnections, roomnames, time_format)
+        stage.records = sum(len(table) for table in disconnections.values())
+    with profiling.stage("organize_abuseflags") as stage:
+        excel_sheets['Abuse Flags by Group'] = organize_abuseflags(flags, roomnames)
+        stage.records = len(flags)
     ########################################
 
-    # Write the output to a xlsx file
-    filename = check_for_existing_file(jsonname)
-    writer = pd.ExcelWriter(filename)
-
-    for sheetname, data in excel_sheets.items():
-        data.to_excel(writer, sheet_name=sheetname)
-
-    # close the Pandas Excel writer and output the Excel file.
-    writer.save()
+    # Write the output in the format picked for the run (a xlsx workbook by default, see outputs.py)
+    with profiling.stage("write_" + output_format) as stage:
+        files = outputs.write_sheets(excel_sheets, jsonname, output_format, overwrite)
+        stage.records = len(excel_sheets)
+
+    return ", ".join(files)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Produce speaker, disconnected time and abuse flag workbooks for every deliberation json in the current folder.")
+    parser.add_argument("--cache", nargs="?", const=parsecache.DEFAULT_DIRECTORY, default=None, metavar="DIR",
+                        help="keep the data parsed from each json in a cache folder (" + parsecache.DEFAULT_DIRECTORY + " by default) and reuse it "
+                        "on later runs for any file that hasn't changed.")
+    parser.add_argument("--cache-size", type=int, default=parsecache.DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="largest the cache folder is allowed to grow before old entries are deleted.")
+    parser.add_argument("--time-format", choices=durations.STYLES, default="mm:ss",
+                        help="how to write lengths of time in the output (default mm:ss)")
+    parser.add_argument("--output-format", choices=outputs.FORMATS, default="xlsx",
+                        help="what to write the output as (default xlsx). xlsx-streaming writes the workbook in constant memory, and csv, "
+                        "parquet and feather write a file per sheet.")
+    parser.add_argument("--rooms", metavar="NAMES",
+                        help="comma separated names of the only rooms to process. Reads just those rooms from each export through a "
+                        "room index saved next to it.")
+    watch.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    outputs.check_available(args.output_format)
+    rooms = roomindex.parse_rooms_argument(args.rooms)
+    cprofiler = profiling.start(args)
+
+    cache = None
+    if args.cache is not None:
+        cache = parsecache.ParseCache(args.cache, args.cache_size * 1024 * 1024)
+
+    if args.watch:
+        try:
+            watch_folder(os.getcwd(), cache, args.time_format, args.output_format, rooms, args.poll_seconds, args.settle_seconds)
+        except KeyboardInterrupt:
+            print("\nStopped watching. Exiting...")
+        profiling.finish(args, cprofiler)
+        return
 
-    return filename
-
-def main():
     json_files, names = grab_json_files()
 
-    parsed_jsons, roomnames, names = parse_jsons(json_files, names)
-    transcriptDatas, roomnames, names = parse_jsons_for_transcriptData(json_files, names)
+    filename = None
+    for i in range(len(json_files)):
+        filename = process_file(json_files[i], names[i], cache, args.time_format, args.output_format, rooms) or filename
 
-    for i in range(len(parsed_jsons)):
-        flags = generateAbuseFlags(transcriptDatas[i])
-        users = generateConnectedTimes(parsed_jsons[i])
-        speak_instances = get_speak_instances_from_json(parsed_jsons[i], ['Record'])
-        filename = generate_output(speak_instances, roomnames[i], names[i], users, flags)
+    profiling.finish(args, cprofiler)
 
-    print("\nData saved to " +  filename + ". Exiting...")
-    time.sleep(1.5)
+    if filename is None:
+        print("\nNo data saved. Exiting...")
+    else:
+        print("\nData saved to " +  filename + ". Exiting...")
+    lightweight.pause(1.5)
+
+# Reads a single json file (from the cache if it's given and the file hasn't changed) and writes its output. Returns the name of the output,
+# or None if the json contains no user data. Given a list of rooms, only those rooms are processed. With overwrite, the output from an
+# earlier run is written over.
+def process_file(file, name, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None, overwrite=False):
+    with profiling.for_file(file):
+        if rooms is None:
+            data = parsecache.cached(cache, file, "connectedtime", extract_file)
+        else:
+            # the cache holds whole files, so runs over a subset of rooms go straight to the file
+            data = extract_file(file, rooms)
+        if data is None:
+            return None
+        roomnames, speak_instances, disconnections, flags = data
+        return generate_output(speak_instances, roomnames, name, disconnections, flags, time_format, output_format, overwrite)
+
+# Watch mode (see watch.py): processes each json in path as it's added or changed, until stopped with Ctrl+C. Each json's output is
+# written over the output from the last time it was processed rather than numbered, so there's always one up to date set per json.
+def watch_folder(path, cache=None, time_format="mm:ss", output_format="xlsx", rooms=None, interval=watch.POLL_SECONDS,
+                 settle=watch.SETTLE_SECONDS):
+    watcher = watch.Watcher(lambda: compressed.find_exports(path), settle)
+    print("Watching " + path + " for new and changed json files. Press Ctrl+C to stop.\n")
+
+    for ready, removed in watcher.changes(interval):
+        for file in ready:
+            try:
+                result = process_file(file, nameFromPath(file), cache, time_format, output_format, rooms, True)
+            except Exception as e:
+                print("Failed to process " + file + ": " + repr(e))
+            else:
+                if result is None:
+                    print("Skipped " + file + " because it contains no user data.")
+                else:
+                    print("Saved data from " + file + " to " + result)
+            watcher.processed(file)
+        for file in removed:
+            watcher.processed(file)
 
 ########################################
 # Data organization functions
@@ -80,18 +152,20 @@ def main():
 # DisplayName_[roomname], ParticipantID_[roomname], SpeakTime_[roomname]. 
 # Use the list comprehensions below as a model for how to organize the data in different ways. Note that for room in roomnames would need
 # to be a different loop to organize the data by something other than room.
-def organize_by_group(all_speak_instances, roomnames):
+def organize_by_group(all_speak_instances, roomnames, time_format="mm:ss"):
     out = pd.DataFrame()
 
-    # sort the list of speak instances by start time. 
-    all_speak_instances.sort(key=lambda x: x.start)
+    # get the speak instances as columns, with every room's rows already sorted by start time
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+    columns = all_speak_instances.columns()
 
     # iterate over our many rooms, using list comprehensions to add the relevant data to our output dataframe
     for room in roomnames:
         room = str(room)
         # get the speak instances we care about create a dataframe to store this group's data in. We use this intermediate dataframe because
         # pandas is a bit annoying about adding new rows to a dataframe.
-        speaksinroom = [x for x in all_speak_instances if (x.group == room and x.length > 0)]
+        rows = all_speak_instances.room_rows(room, by_start=True)
+        speaksinroom = rows[columns['length'][rows] > 0]
         newelems = pd.DataFrame(index=range(len(speaksinroom)))
 
         # debug code for ensuring proper ordering of speaks
@@ -99,9 +173,9 @@ def organize_by_group(all_speak_instances, roomnames):
         # newelems[room + "_startTime"] = speakstarts
         
         # create lists with the data we care about and add them to our intermediate dataframe
-        newelems["DisplayName_" + room] = [x.speaker for x in speaksinroom]
-        newelems["ParticipantID_" + room] = [x.uid for x in speaksinroom]
-        newelems["SpeakTime_" + room] = [convert_to_minsecs(x.length) for x in speaksinroom] 
+        newelems["DisplayName_" + room] = all_speak_instances.decode('speaker', columns['speaker'][speaksinroom])
+        newelems["ParticipantID_" + room] = all_speak_instances.decode('uid', columns['uid'][speaksinroom])
+        newelems["SpeakTime_" + room] = durations.format_durations(columns['length'][speaksinroom], time_format)
         
         # concatenate the intermediate dataframe to our output dataframe
         out = pd.concat([out, newelems], axis=1)
@@ -111,46 +185,33 @@ def organize_by_group(all_speak_instances, roomnames):
 # Takes in a  list of speak instances and roomnames and returns a dataframe with the following columns corresponding to each room:
 # DisplayName_[roomname], ParticipantID_[roomname], TotalSpeakTime_[roomname].
 # Use the dictionary and loop below as a model for how to sum data in different ways.
-def total_speaker_times(all_speak_instances, roomnames):
+def total_speaker_times(all_speak_instances, roomnames, time_format="mm:ss"):
     out = pd.DataFrame()
 
+    all_speak_instances = speakstore.as_store(all_speak_instances)
+
+    # total up every speaker in every room at once
+    totals = all_speak_instances.speaker_totals()
+
     # iterate over our many rooms
     for room in roomnames:
-        speaksinroom = [x for x in all_speak_instances if x.group == room]
+        code = all_speak_instances.room_code(room)
 
         #don't bother with rooms that have no speak instances
-        if len(speaksinroom) == 0:
+        if code not in totals:
             continue
 
-        # this will hold a tuple with the speaker's name and uid as the key, and a float for their total speak time as the value
-        totalspeaklengths = {}
-        numspeaktimes = {}
-        
-        # Get the total time each speaker spoke in the room
-        for speak in speaksinroom:
-            if (speak.uid, speak.speaker) in totalspeaklengths.keys():
-                totalspeaklengths[(speak.uid, speak.speaker)] += speak.length
-            else:
-                totalspeaklengths[(speak.uid, speak.speaker)] = speak.length
-
-        for speak in speaksinroom:
-            if speak.length > 0:
-                if (speak.uid, speak.speaker) in numspeaktimes.keys():
-                    numspeaktimes[(speak.uid, speak.speaker)] += 1
-                else:
-                    numspeaktimes[(speak.uid, speak.speaker)] = 1
-            else:
-                if (speak.uid, speak.speaker) not in numspeaktimes.keys():
-                    numspeaktimes[(speak.uid, speak.speaker)] = 0
+        # uids and speakers come back as codes in the order each speaker first appears in the room, alongside their total speak time
+        # and number of (non-zero length) speaks
+        uids, speakers, totalspeaklengths, numspeaktimes = totals[code]
 
-        newelems = pd.DataFrame(index=range(len(totalspeaklengths)))
+        newelems = pd.DataFrame(index=range(len(uids)))
 
         # append the info to our intermediate dataframe
-        displayorder = totalspeaklengths.keys() # .keys() can't be trusted to return the same order every time, so we need to store it. Thanks python.
-        newelems["DisplayName_" + room] = list(map(lambda x: x[1], displayorder))
-        newelems["ParticipantID_" + room] = list(map(lambda x: x[0], displayorder))
-        newelems["TotalSpeakTime_" + room] = [convert_to_minsecs(totalspeaklengths[x]) for x in displayorder]
-        newelems["NumSpeaks_" + room] = [numspeaktimes[x] for x in displayorder]
+        newelems["DisplayName_" + room] = all_speak_instances.decode('speaker', speakers)
+        newelems["ParticipantID_" + room] = all_speak_instances.decode('uid', uids)
+        newelems["TotalSpeakTime_" + room] = durations.format_durations(totalspeaklengths, time_format)
+        newelems["NumSpeaks_" + room] = numspeaktimes
 
         # concatenate the intermediate dataframe to our output dataframe
         out = pd.concat([out, newelems], axis=1)
@@ -174,95 +235,47 @@ def grab_json_files(override_path=""):
         path = os.getcwd()
 
     print("Searching " + path + " for json files\n")
-    json_files = glob.glob(os.path.join(path, "*.json"))
+    json_files = compressed.find_exports(path)
 
     # grab the filenames we find. There is probably a more efficent way to do this but here we are
     for filepath in json_files:
-        n = re.search(r".+\\([^\.]+)", filepath)
-        jsonnames.append(n.group(1))
+        jsonnames.append(nameFromPath(filepath))
 
     #check that there are in fact some files to parse
     if len(json_files) == 0:
         print("No json files found in the current directory. Exiting.")
-        time.sleep(2.5)
+        lightweight.pause(2.5)
         sys.exit()
 
     return json_files, jsonnames
 
 def nameFromPath(path):
-    n = re.search(r".+\\([^\.]+)", path)
-    return n.group(1)
-
-# Takes in a list of json files paths and return a list of pandas dataframes containing the userdata from each json
-# organized in rows by room and a list of all roomnames parsed from the json files.
-def parse_jsons(json_files, names):
-    parsed_jsons = []
-    roomnames = []
-
-    #loop through each file and parse the json data
-    i = 0
-    for file in json_files:
-        with open(file, 'r', encoding='utf-8', errors="replace") as json_file:
-            print("Searching for abuse flags in " + file + "...")
-            df = pd.read_json(json_file)
-
-            #this is a bit messy, but it makes the first row of our output dataframes the room the data corresponds to.
-            df_roomdata = pd.json_normalize(df['roomData'])
-            try:
-                df_userdata = pd.json_normalize(df['userData'])
-            except:
-                print("File " + file + " contains no user data.")
-                if nameFromPath(file) in names:
-                    print("popped " + file + " td")
-                    names.remove(nameFromPath(file))
-                continue
-            df_userdata.insert(0,'room','')
-            df_userdata['room'] = df_roomdata['name']
-            parsed_jsons.append(df_userdata)
-
-            #add the room names to our list of roomnames
-            roomnames.append(list(df_roomdata['name'])[0:])
-        i+=1 
-
-    return parsed_jsons, roomnames, names
-
-# Takes in a pandas dataframe resulting from a single deliberation and turns it into a list of speak instances.
-# The optional exclude argument can be used to exclude a list of users from the list of speak instances (such as admins, in 
-# cases where they spoke in the deliberation).
-def get_speak_instances_from_json(df, exclude_speakers=[]):
-    speak_instances = []
-    i = 0
-    for room in df['room']:
-        for col in df.columns[1:]:
-            user = df[col][i]
-            if user != None:
-                user = dict(user)
-                if (user['screenName'] not in exclude_speakers) and (user['role'] != 'observer'):
-                    speakBlocks = list(user['speakBlocks'])
-                    if speakBlocks:
-                        for block in speakBlocks:
-                            speak_instances.append(speakInstance(room, user['screenName'], user['id'], block))
-                    if user['id']:
-                        speak_instances.append(speakInstance(room, user['screenName'], user['id'], 0))
-        i+=1
-    return speak_instances
-
-# For prettifying speak-length data in miliseconds to human readable minutes:seconds format 
+    return compressed.export_name(path)
+
+# Reads a single json file in one pass, running the speak instance, connected time and abuse flag analyzers over it together. Returns
+# everything generate_output needs as a tuple of (roomnames, speak instances, disconnected time tables, transcript index), or None if the json contains no user
+# data. Observers and the 'Record' user are left out of the speak instances. Given a list of rooms, only those rooms are read, through the
+# file's room index (see roomindex.py).
+def extract_file(file, rooms=None):
+    print("Parsing " + file + "...")
+    with profiling.stage("analyzers") as stage:
+        # the connected time and abuse flag analyzers share one transcript index
+        flagger = AbuseFlagsAnalyzer()
+        source = file if rooms is None else roomindex.load_rooms(file, rooms)
+        speakdata, disconnections, flags = analyzers.run_analyzers(source, [jsonparser.SpeakInstancesAnalyzer(['Record'], exclude_observers=True),
+                                                                          ConnectedTimesAnalyzer(flagger.index), flagger])
+        roomnames, speak_instances = speakdata
+        stage.records = 0 if speak_instances is None else len(speak_instances)
+    if roomnames is None:
+        print("File " + file + " contains no user data.")
+        return None
+
+    return roomnames, speak_instances, disconnections, flags
+
+# For prettifying speak-length data in miliseconds to human readable minutes:seconds format. The organize functions format whole columns
+# at once with durations.format_durations instead.
 def convert_to_minsecs(length):
-    d = datetime.timedelta(milliseconds=length)
-    return str(d)[2:7]
-
-# Given a filename, checks for an existing output file, and returns the appropriate filename to use in the format output (n).xlsx.
-def check_for_existing_file(filename):
-    if os.path.isfile(filename + ".xlsx"):
-        i = 1
-        while True:
-            if not os.path.isfile(filename + " (" + str(i) + ").xlsx"):
-                return filename + " (" + str(i) + ").xlsx"
-            i+=1
-    else:
-        return filename + ".xlsx"
-
+    return durations.format_duration(length, "mm:ss")
 
 ########################################
 # ConnectedTime
@@ -270,128 +283,120 @@ def check_for_existing_file(filename):
 
 class User:
     def __init__(self, uid, room, name):
-        self.uid = uid
-        self.name = name
-        self.room = room
-        self.disconnectedTime = 0
-
-def generateConnectedTimes(df, exclude_speakers=[]):
-    users = []
-    i = 0
-    for room in df['room']:
-        for col in df.columns[1:]:
-            user = df[col][i]
-            if user != None:
-                user = dict(user)
-                if user['id'] and user['role'] != 'observer':
-                    cur_user = User(user['id'], room, user['screenName'])
-                    disconnectedBlocks = list(user['disconnectedBlocks'])
-                    if disconnectedBlocks:
-                        for block in disconnectedBlocks:
-                            block = dict(block)
-                            distime = block['connectedTime'] - block['disconnectedTime']
-                            cur_user.disconnectedTime += distime
-                    users.append(cur_user)
-        i+=1
-    return users
-
-def organize_connectedtimes_by_group(users, roomnames):
+        self.uid = identities.intern(uid)
+        self.name = identities.intern(name)
+        self.room = identities.intern(room)
+
+# Works out how long each (non-observer) user was disconnected, from the user and disconnectedBlock records of an export and the
+# deliberation window in its transcript index (see disconnects.py and transcripts.py). The blocks are collected as columns while the file
+# is read, and every user's are merged at once at the end. The result is a dictionary keyed by room of disconnects.RoomDisconnects tables.
+# Each user's disconnected blocks come right after the user's own record, so we only need to keep track of the latest one.
+@analyzers.register("connectedTimes")
+class ConnectedTimesAnalyzer(transcripts.TranscriptAnalyzer):
+    def __init__(self, index=None):
+        transcripts.TranscriptAnalyzer.__init__(self, index)
+        self.users = []
+        self.current = None
+        self.currentdata = None
+
+        # one entry per block: the index of its user in self.users, and its times (NaN if it never reconnected)
+        self.owners = []
+        self.disconnected = []
+        self.connected = []
+
+        # per room: the latest time in any of its blocks
+        self.latest = {}
+
+    def user(self, roomname, user):
+        self.current = None
+        if user['id'] and user['role'] != 'observer':
+            self.current = User(user['id'], roomname, user['screenName'])
+            self.currentdata = user
+            self.users.append(self.current)
+
+    def disconnectedBlock(self, roomname, user, block):
+        if self.current is not None and user is self.currentdata:
+            connected = block.get('connectedTime')
+            self.owners.append(len(self.users) - 1)
+            self.disconnected.append(block['disconnectedTime'])
+            self.connected.append(np.nan if connected is None else connected)
+            latest = block['disconnectedTime'] if connected is None else max(block['disconnectedTime'], connected)
+            self.latest[roomname] = max(self.latest.get(roomname, latest), latest)
+
+    # Returns the (start, end) of a room's deliberation window, from its "Introductions" and "Deliberation ends" moderator events. Without
+    # a start marker the start is NaN (no limit), and without an end marker the window ends at the latest time anything happened in it.
+    def window(self, roomname):
+        start = self.index.marker(roomname, "Introductions")
+        end = self.index.marker(roomname, "Deliberation ends")
+        if end is None:
+            times = [t for t in [self.index.latest(roomname), self.latest.get(roomname)] if t is not None]
+            end = max(times) if times else np.nan
+        return (np.nan if start is None else start), end
+
+    def result(self):
+        windows = {room: self.window(room) for room in set(user.room for user in self.users)}
+        windowstart = [windows[user.room][0] for user in self.users]
+        windowend = [windows[user.room][1] for user in self.users]
+        total, count, longest = disconnects.disconnected_times(self.owners, self.disconnected, self.connected, windowstart, windowend,
+                                                               len(self.users))
+
+        tables = {}
+        for room, indices in bucket_indices([user.room for user in self.users]).items():
+            tables[room] = disconnects.RoomDisconnects([self.users[i].name for i in indices], [self.users[i].uid for i in indices],
+                                                       total[indices], count[indices], longest[indices])
+        return tables
+
+# Takes in a list of rooms and returns a dictionary keyed by room of the positions each room appears at.
+def bucket_indices(rooms):
+    buckets = {}
+    for i, room in enumerate(rooms):
+        if room not in buckets:
+            buckets[room] = []
+        buckets[room].append(i)
+    return buckets
+
+# Takes in the disconnected time tables from ConnectedTimesAnalyzer and the roomnames and returns a dataframe with the following columns
+# corresponding to each room: DisplayName_[roomname], ParticipantID_[roomname], SpeakTime_[roomname] (total time disconnected; the name is
+# kept from earlier versions), NumDisconnects_[roomname] and LongestDisconnect_[roomname].
+def organize_connectedtimes_by_group(disconnections, roomnames, time_format="mm:ss"):
     out = pd.DataFrame()
 
-    # iterate over our many rooms, using list comprehensions to add the relevant data to our output dataframe
+    # iterate over our many rooms, reading each one's precomputed table
     for room in roomnames:
         room = str(room)
-        # get the users we care about and create a dataframe to store this group's data in. We use this intermediate dataframe because
-        # pandas is a bit annoying about adding new rows to a dataframe.
-        distimesinroom = [x for x in users if x.room == room]
-        newelems = pd.DataFrame(index=range(len(distimesinroom)))
+        table = disconnections.get(room, disconnects.RoomDisconnects([], [], [], [], []))
+        newelems = pd.DataFrame(index=range(len(table)))
+
+        newelems["DisplayName_" + room] = table.names
+        newelems["ParticipantID_" + room] = table.uids
+        newelems["SpeakTime_" + room] = durations.format_durations(table.total, time_format)
+        newelems["NumDisconnects_" + room] = np.asarray(table.count, dtype=np.int64)
+        newelems["LongestDisconnect_" + room] = durations.format_durations(table.longest, time_format)
 
-        # debug code for ensuring proper ordering of speaks
-        # speakstarts = [time.asctime(time.gmtime(x.start/1000.0)) for x in speaksinroom] 
-        # newelems[room + "_startTime"] = speakstarts
-        
-        # create lists with the data we care about and add them to our intermediate dataframe
-        newelems["DisplayName_" + room] = [x.name for x in distimesinroom]
-        newelems["ParticipantID_" + room] = [x.uid for x in distimesinroom]
-        newelems["SpeakTime_" + room] = [convert_to_minsecs(x.disconnectedTime) for x in distimesinroom] 
-        
         # concatenate the intermediate dataframe to our output dataframe
         out = pd.concat([out, newelems], axis=1)
-    
+
     return out
 
 ########################################
 # AbuseFlags woooo
 ########################################
 
-class AbuseFlag:
-    def __init__(self, room, time):
-        self.room = room
-        self.time = time
-
-
-# find transcriptData 
-def parse_jsons_for_transcriptData(json_files, names):
-    parsed_jsons = []
-    roomnames = []
-
-    #loop through each file and parse the json data
-    i = 0
-    for file in json_files:
-        with open(file, 'r', encoding='utf-8', errors="replace") as json_file:
-            print("Parsing " + file + "...")
-            df = pd.read_json(json_file)
-
-            #this is a bit messy, but it makes the first row of our output dataframes the room the data corresponds to.
-            df_roomdata = pd.json_normalize(df['roomData'])
-            try:
-                df_transcriptdata = pd.json_normalize(df['userData'])
-            except:
-                print("File " + file + " contains no user data.")
-                if nameFromPath(file) in names:
-                    print("popped " + file + " td")
-                    names.remove(nameFromPath(file))
-                continue
-            df_transcriptdata.insert(0,'room','')
-            df_transcriptdata['room'] = df_roomdata['name']
-            parsed_jsons.append(df_transcriptdata)
-
-            #add the room names to our list of roomnames
-            roomnames.append(list(df_roomdata['name'])[0:])
-        i+=1        
-
-    return parsed_jsons, roomnames, names
-
-#find abuse flags
-def generateAbuseFlags(df):
-    flags=[]
-    i = 0
-    for room in df['room']:
-        for col in df.columns[1:]:
-            transcriptEvent = df[col][i]
-            if transcriptEvent:
-                transcriptEvent = dict(transcriptEvent)
-                if 'type' in transcriptEvent.keys():
-                    if transcriptEvent['type'] == 'abusiveLanguage':
-                        flags.append(AbuseFlag(room, transcriptEvent['t']))
-        i+=1
-    return flags
+# Finds the abuse flags in the transcript events of an export. Flags are just counted per room in the transcript index, so the result is
+# the index itself.
+@analyzers.register("abuseFlags")
+class AbuseFlagsAnalyzer(transcripts.TranscriptAnalyzer):
+    def result(self):
+        return self.index
 
+# Takes in the transcript index from AbuseFlagsAnalyzer and the roomnames and returns a dataframe with the number of abuse flags raised
+# in each room.
 def organize_abuseflags(flags, roomnames):
-    flagsinroom = []
-
-    # iterate over our many rooms, using list comprehensions to add the relevant data to our output dataframe
-    for room in roomnames:
-        # get the flags we care about and create a dataframe to store this group's data in. We use this intermediate dataframe because
-        # pandas is a bit annoying about adding new rows to a dataframe.
-        flagsinroom.append(len([x for x in flags if x.room == room]))
-        
-    # create lists with the data we care about and add them to our intermediate dataframe
     out = pd.DataFrame(index=range(len(roomnames)), columns=["Room", "Flags"])
     out["Room"] = roomnames
-    out["Flags"] = flagsinroom
+    out["Flags"] = [flags.count(room, 'abusiveLanguage') for room in roomnames]
 
-    return out         
+    return out
 
 ########################################
 # Execution statement
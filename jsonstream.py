@@ -0,0 +1,135 @@
+import json
+import codecs
+import compressed
+
+# Deliberation exports are a single top-level json array with one object per room. Loading the whole thing with pd.read_json or
+# json.load means holding every room (and, for pandas, a wide object-typed dataframe of them) in memory at once. The functions in
+# this file decode the array one room at a time instead, so memory scales with the largest room rather than the whole export.
+
+# Size of each read from the underlying file. Rooms larger than this just cause the buffer to grow until the room fits.
+CHUNK_SIZE = 1 << 20
+
+# Takes in a path to a json export (or an already opened binary file) and yields each room dictionary in the top-level array. Compressed
+# exports are decompressed as they're read (see compressed.py). With
+# spans=True it yields (room, start, end) instead, where start and end are the byte offsets of the room's object in the file (see
+# roomindex.py).
+def iter_rooms(file, chunk_size=CHUNK_SIZE, spans=False):
+    if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+        with compressed.open_export(file) as json_file:
+            yield from iter_rooms(json_file, chunk_size, spans)
+        return
+
+    decoder = json.JSONDecoder()
+    # decode with errors="replace" to match the way the scripts have always opened exports. When we need byte offsets, decode with
+    # surrogateescape instead, so every character turns back into exactly the bytes it came from.
+    textdecoder = codecs.getincrementaldecoder('utf-8')(errors="surrogateescape" if spans else "replace")
+    buf = ""
+    pos = 0
+    eof = False
+    # the byte offset in the file of buf[mark]. mark only moves forward, so each character is encoded once to count its bytes.
+    mark = 0
+    markbyte = 0
+
+    # Returns the byte offset in the file of buf[i], for any i from mark on.
+    def offset(i):
+        nonlocal mark, markbyte
+        markbyte += len(buf[mark:i].encode('utf-8', 'surrogateescape'))
+        mark = i
+        return markbyte
+
+    # Drop what we've already consumed from the buffer and append at least readsize more bytes of the file to it.
+    def fill(readsize):
+        nonlocal buf, pos, eof, mark
+        if spans:
+            offset(pos)
+            mark = 0
+        data = file.read(readsize)
+        if not data:
+            eof = True
+            buf = buf[pos:] + textdecoder.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + textdecoder.decode(data)
+        pos = 0
+
+    # Advance pos past any whitespace, reading more of the file if we run off the end of the buffer. Returns the next character,
+    # or "" at the end of the file.
+    def next_char():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ""
+            fill(chunk_size)
+
+    if next_char() != "[":
+        raise ValueError("Expected a json array of rooms")
+    pos += 1
+
+    while True:
+        char = next_char()
+        if char == "]":
+            return
+        if char == "":
+            raise ValueError("Unexpected end of file while reading rooms")
+        if char == ",":
+            pos += 1
+            continue
+
+        try:
+            room, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the room doesn't fit in the buffer yet. Read at least as much again as we're holding so a huge room costs a
+            # handful of decode attempts rather than one per chunk.
+            fill(max(chunk_size, len(buf) - pos))
+            continue
+
+        # a value that runs right up to the end of the buffer might have been cut short, so make sure there's more after it
+        if end == len(buf) and not eof:
+            fill(chunk_size)
+            continue
+
+        if spans:
+            yield room, offset(pos), offset(end)
+        else:
+            yield room
+        pos = end
+
+# Takes in an iterable of room dictionaries and flattens it into a stream of records, so analyzers can work through an export
+# without ever holding more than one room. Each record is a tuple whose first element is the record type:
+#   ("room", roomname, room)
+#   ("user", roomname, user)
+#   ("speakBlock", roomname, user, block)
+#   ("disconnectedBlock", roomname, user, block)
+#   ("transcript", roomname, event)
+#   ("poll", roomname, pollid, poll)
+# Each room's records come in that order: the room itself, then each user followed by their speak and disconnected blocks, then the
+# room's transcript events and polls. Rooms without roomData are skipped, like votingparser does.
+def iter_records(rooms):
+    for room in rooms:
+        try:
+            roomname = room["roomData"]["name"]
+        except (KeyError, TypeError):
+            continue
+
+        yield ("room", roomname, room)
+
+        for user in room.get("userData") or []:
+            if user is None:
+                continue
+            yield ("user", roomname, user)
+            for block in user.get("speakBlocks") or []:
+                yield ("speakBlock", roomname, user, block)
+            for block in user.get("disconnectedBlocks") or []:
+                yield ("disconnectedBlock", roomname, user, block)
+
+        for event in room.get("transcriptData") or []:
+            if event:
+                yield ("transcript", roomname, event)
+
+        for pollid, poll in (room.get("pollData") or {}).items():
+            yield ("poll", roomname, pollid, poll)
@@ -0,0 +1,49 @@
+import os
+import sys
+import csv
+import math
+import time
+import importlib.util
+
+# Pieces for quick runs that only need the standard library. pandas and numpy take most of a second to import, which is most of the run
+# on a small folder, so the modules that use them get them through lazy_import and only pay for the import the first time they're
+# actually used. The --quick mode of votingparser and jsonparser writes its csvs with write_csv instead of a dataframe, so it never
+# imports them at all.
+
+# Returns a module that's only really imported the first time one of its attributes is used (see importlib.util.LazyLoader), or the
+# module itself if something has imported it already.
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# The scripts pause for a moment before exiting so their window stays open long enough to read when they're started by double clicking.
+# There's nobody to read it when the output is going to a file or a pipe (eg. batch jobs), so don't wait then.
+def pause(seconds):
+    if sys.stdout is not None and sys.stdout.isatty():
+        time.sleep(seconds)
+
+# Turns a value into the text DataFrame.to_csv would write for it: nothing for None and NaN, and the shortest repr for floats.
+def csv_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, float):
+        return repr(value)
+    return value
+
+# Writes rows to a csv the same way outputs.write_table writes a dataframe's csv (utf-8 with a byte order mark, so Excel opens it
+# properly). header is a list of header rows, and each row in rows is written led by its position, like a dataframe's default index.
+# Pass index=False to write the rows as they are.
+def write_csv(file, header, rows, index=True):
+    with open(file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        writer.writerows(header)
+        for i, row in enumerate(rows):
+            row = [csv_value(value) for value in row]
+            writer.writerow([i] + row if index else row)
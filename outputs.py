@@ -0,0 +1,128 @@
+import os
+import sys
+import importlib.util
+
+import lightweight
+pd = lightweight.lazy_import("pandas")
+
+# Writers for the scripts' output tables. Each script builds a dictionary of sheets (key=sheetname, value=dataframe) and write_sheets
+# saves them in whichever format was picked for the run:
+#   xlsx            one workbook with a sheet per table, through pandas' ExcelWriter
+#   xlsx-streaming  one workbook written a row at a time in constant memory (xlsxwriter if installed, otherwise openpyxl's write only mode)
+#   csv             one csv per table, written in chunks
+#   parquet         one parquet file per table (needs pyarrow)
+#   feather         one feather file per table (needs pyarrow)
+# Formats with a file per table name each one "<name> - <sheetname>.<ext>". Output is never written over: if any of the files for a
+# name already exist, the whole set is numbered "<name> (1)", "<name> (2)" and so on, unless
+# overwrite is asked for (eg. by watch mode, which keeps a single set of outputs up to date).
+
+FORMATS = ["xlsx", "xlsx-streaming", "csv", "parquet", "feather"]
+EXTENSIONS = {"xlsx": ".xlsx", "xlsx-streaming": ".xlsx", "csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+# Rows handled at a time by the chunked and streaming writers
+CHUNK_ROWS = 10000
+
+# Returns True for the formats that write every sheet into one file.
+def single_file(format):
+    return format in ["xlsx", "xlsx-streaming"]
+
+# Returns the files a set of sheets would be written to for a given name and format.
+def output_files(name, sheetnames, format):
+    if single_file(format):
+        return [name + EXTENSIONS[format]]
+    return [name + " - " + sheetname + EXTENSIONS[format] for sheetname in sheetnames]
+
+# Given a name, checks for existing output files and returns the name to use so none of them get written over, in the format name (n).
+def available_name(name, sheetnames, format):
+    candidate = name
+    i = 1
+    while any(os.path.isfile(file) for file in output_files(candidate, sheetnames, format)):
+        candidate = name + " (" + str(i) + ")"
+        i += 1
+    return candidate
+
+# Exits with a helpful message if the libraries a format needs aren't installed, so a run fails up front rather than after parsing.
+def check_available(format):
+    needed = {"parquet": ["pyarrow"], "feather": ["pyarrow"], "xlsx": ["openpyxl"], "xlsx-streaming": ["xlsxwriter", "openpyxl"]}
+    modules = needed.get(format, [])
+    if modules and not any(importlib.util.find_spec(module) for module in modules):
+        print("Writing " + format + " files needs " + " or ".join(modules) + ". Run: pip install " + modules[0])
+        sys.exit(1)
+
+# Writes a dictionary of sheets (key=sheetname, value=dataframe) under name in the given format and returns the list of files written.
+# With overwrite, any existing files for name are written over rather than a numbered name being used.
+def write_sheets(sheets, name, format="xlsx", overwrite=False):
+    if not overwrite:
+        name = available_name(name, list(sheets.keys()), format)
+    files = output_files(name, list(sheets.keys()), format)
+
+    if format == "xlsx":
+        with pd.ExcelWriter(files[0]) as writer:
+            for sheetname, data in sheets.items():
+                data.to_excel(writer, sheet_name=sheetname)
+    elif format == "xlsx-streaming":
+        write_streaming_xlsx(sheets, files[0])
+    else:
+        for (sheetname, data), file in zip(sheets.items(), files):
+            write_table(data, file, format)
+
+    return files
+
+# Writes a single dataframe to file in one of the table formats (csv, parquet or feather).
+def write_table(data, file, format, index=True):
+    if format == "csv":
+        data.to_csv(file, index=index, encoding='utf-8-sig', chunksize=CHUNK_ROWS)
+        return
+
+    data = columnar_frame(data, index)
+    if format == "parquet":
+        data.to_parquet(file, index=False)
+    elif format == "feather":
+        data.to_feather(file)
+    else:
+        raise ValueError("Unknown table format " + repr(format))
+
+# Parquet and feather want flat, string column names and no index, so join multi level columns (like votingparser's wide table) with "_"
+# and move the index into an ordinary column.
+def columnar_frame(data, index=True):
+    data = data.copy(deep=False)
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = ["_".join(str(level) for level in column if level is not None and level != "") for column in data.columns]
+    else:
+        data.columns = [str(column) for column in data.columns]
+
+    if index:
+        data = data.reset_index()
+        data.columns = [str(column) for column in data.columns]
+    else:
+        data = data.reset_index(drop=True)
+    return data
+
+# Writes sheets to an xlsx workbook a row at a time, so the workbook is never held in memory as a whole. Rows are laid out like
+# DataFrame.to_excel: a header row of column names, then each row led by its index.
+def write_streaming_xlsx(sheets, file):
+    if importlib.util.find_spec("xlsxwriter"):
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(file, {'constant_memory': True, 'nan_inf_to_errors': True})
+        for sheetname, data in sheets.items():
+            worksheet = workbook.add_worksheet(sheetname)
+            for r, row in enumerate(sheet_rows(data)):
+                worksheet.write_row(r, 0, row)
+        workbook.close()
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        for sheetname, data in sheets.items():
+            worksheet = workbook.create_sheet(sheetname)
+            for row in sheet_rows(data):
+                worksheet.append(row)
+        workbook.save(file)
+
+# Yields the rows of a dataframe as lists of plain python values, a chunk at a time, with empty cells as None.
+def sheet_rows(data):
+    yield [None] + [str(column) for column in data.columns]
+    for start in range(0, len(data), CHUNK_ROWS):
+        chunk = data.iloc[start:start + CHUNK_ROWS]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for index, values in zip(chunk.index.tolist(), chunk.values.tolist()):
+            yield [index] + values
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import pickle
+import zlib
+import hashlib
+import profiling
+import compressed
+
+# A persistent on-disk cache of the data each script extracts from a json file, so rerunning a script over a growing archive only parses
+# the files that are new or have changed.
+#
+# The cache directory holds two kinds of files:
+#   stats/<hash of the file's path>.json   the size, mtime and content hash of a json file when it was last seen
+#   data/<content hash>-<kind>.pkl.z       the extracted data for a file's contents, pickled and zlib compressed
+# A file whose path, size and mtime match its stats entry is looked up by the content hash already on record. Anything else is hashed
+# again, so a file that was copied or touched without changing still hits the cache. kind separates the data of the different scripts.
+# When the data files add up to more than max_bytes, the least recently used ones are deleted.
+
+# Bump this whenever the data a script caches changes shape, so old entries are ignored rather than loaded.
+CACHE_VERSION = 4
+
+DEFAULT_DIRECTORY = ".speakerdata_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class ParseCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.directory, "stats"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "data"), exist_ok=True)
+
+    # Returns the cached data for a json file, or None if the file is new, has changed or was evicted.
+    def get(self, file, kind):
+        path = self._data_path(self.content_hash(file), kind)
+        try:
+            with open(path, 'rb') as cached:
+                data = pickle.loads(zlib.decompress(cached.read()))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # written by an older version of a script, or damaged. Either way it's no use to us.
+            self._remove(path)
+            return None
+
+        # mark the entry as recently used so eviction keeps it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    # Stores the data extracted from a json file, then evicts old entries if the cache has grown past max_bytes.
+    def put(self, file, kind, data):
+        path = self._data_path(self.content_hash(file), kind)
+        self._write(path, zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.evict()
+
+    # Returns the sha256 of a file's contents, reusing the hash on record if the file's size and mtime haven't changed since it was taken.
+    # Compressed files are hashed as they are on disk, except for jsons in zip archives, which are hashed decompressed so changing one
+    # json in an archive doesn't throw out the cached data of the others.
+    def content_hash(self, file):
+        file = os.path.abspath(file)
+        stat = compressed.stat(file)
+        statpath = os.path.join(self.directory, "stats", hashlib.sha1(file.encode('utf-8')).hexdigest() + ".json")
+
+        try:
+            with open(statpath, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            if record["path"] == file and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime_ns:
+                return record["hash"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = hashlib.sha256()
+        archive, member = compressed.split(file)
+        with (open(file, 'rb') if member is None else compressed.open_export(file)) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+        record = {"path": file, "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest.hexdigest()}
+        self._write(statpath, json.dumps(record).encode('utf-8'))
+        return record["hash"]
+
+    # Deletes the least recently used data files until the cache is no bigger than max_bytes.
+    def evict(self):
+        datadir = os.path.join(self.directory, "data")
+        entries = []
+        total = 0
+        for name in os.listdir(datadir):
+            try:
+                stat = os.stat(os.path.join(datadir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(datadir, name))
+            total -= size
+
+    def _data_path(self, contenthash, kind):
+        return os.path.join(self.directory, "data", contenthash + "-" + kind + "-v" + str(CACHE_VERSION) + ".pkl.z")
+
+    # Writes to a temporary file and moves it into place, so other processes sharing the cache never read half a file.
+    def _write(self, path, data):
+        temp = path + "." + str(os.getpid()) + "." + str(time.time_ns()) + ".tmp"
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Returns the cached data for file if there is any, otherwise calls extract(file), caches what it returns and returns that. With no cache
+# this is just extract(file). None results aren't cached, so files with nothing in them are simply parsed again next time.
+def cached(cache, file, kind, extract):
+    if cache is None:
+        return extract(file)
+
+    with profiling.stage("cache_lookup"):
+        data = cache.get(file, kind)
+    if data is not None:
+        print("Using cached data for " + file)
+        return data
+
+    data = extract(file)
+    if data is not None:
+        with profiling.stage("cache_store"):
+            cache.put(file, kind, data)
+    return data
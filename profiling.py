@@ -0,0 +1,210 @@
+import sys
+import json
+import time
+import cProfile
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, where peak RSS just isn't reported
+    resource = None
+
+# Optional instrumentation for finding out where a run spends its time. The scripts wrap each step of their pipeline in a stage:
+#
+#   with profiling.stage("read_json") as s:
+#       df = pd.read_json(json_file)
+#       s.records = len(df)
+#
+# When profiling is off (the default) a stage does nothing. When it's on, every stage records its wall time, CPU time, the process's
+# peak RSS when it finished, the peak traced memory if --profile-memory is on, and the number of records it processed, against whichever
+# file is being worked on (see for_file). At the end of the run the stages are reported per file and totalled per stage, as a table
+# and/or a json file. add_arguments/start/finish hook all of this up to a script's command line arguments.
+
+class Stage:
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+        self.records = None
+        self.childpeak = 0
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.stages = []
+        self.file = None
+        self.started = None
+        self._open = []
+
+    def enable(self, trace_memory=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.started = (time.perf_counter(), time.process_time())
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        current = Stage(name, self.file)
+        if not self.enabled:
+            yield current
+            return
+
+        if self.trace_memory:
+            # get_traced_memory's peak is shared with any stage we're nested in, so hand what it has so far up to it before resetting
+            if self._open:
+                self._open[-1].childpeak = max(self._open[-1].childpeak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append(current)
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield current
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._open.pop()
+
+            traced = None
+            if self.trace_memory:
+                traced = max(tracemalloc.get_traced_memory()[1], current.childpeak)
+                if self._open:
+                    self._open[-1].childpeak = max(self._open[-1].childpeak, traced)
+
+            self.stages.append({"stage": name, "file": current.file, "wall": wall, "cpu": cpu, "peak_rss": peak_rss(),
+                                "peak_traced": traced, "records": current.records})
+
+    @contextlib.contextmanager
+    def for_file(self, file):
+        previous = self.file
+        self.file = file
+        try:
+            yield
+        finally:
+            self.file = previous
+
+    # Sums the stages by name, keeping the largest peaks.
+    def totals(self):
+        totals = {}
+        for s in self.stages:
+            if s["stage"] not in totals:
+                totals[s["stage"]] = {"stage": s["stage"], "calls": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": None, "peak_traced": None, "records": None}
+            total = totals[s["stage"]]
+            total["calls"] += 1
+            total["wall"] += s["wall"]
+            total["cpu"] += s["cpu"]
+            for key in ["peak_rss", "peak_traced"]:
+                if s[key] is not None:
+                    total[key] = s[key] if total[key] is None else max(total[key], s[key])
+            if s["records"] is not None:
+                total["records"] = (total["records"] or 0) + s["records"]
+        return list(totals.values())
+
+    def report(self):
+        wall = cpu = None
+        if self.started is not None:
+            wall = time.perf_counter() - self.started[0]
+            cpu = time.process_time() - self.started[1]
+        return {"wall": wall, "cpu": cpu, "peak_rss": peak_rss(), "stages": self.stages, "totals": self.totals()}
+
+    def summary(self):
+        lines = ["", "Profile by file:"]
+        columns = "  {:<28} {:>10} {:>10} {:>12} {:>12} {:>10}"
+        header = columns.format("stage", "wall s", "cpu s", "peak RSS MB", "traced MB", "records")
+        lastfile = object()
+        for s in self.stages:
+            if s["file"] != lastfile:
+                lines.append(" " + str(s["file"] if s["file"] is not None else "(all files)"))
+                lines.append(header)
+                lastfile = s["file"]
+            lines.append(format_row(s))
+
+        lines += ["", "Profile totals by stage:", columns.format("stage (calls)", "wall s", "cpu s", "peak RSS MB", "traced MB", "records")]
+        for total in self.totals():
+            lines.append(format_row(dict(total, stage=total["stage"] + " (" + str(total["calls"]) + ")")))
+
+        report = self.report()
+        if report["wall"] is not None:
+            lines.append("")
+            lines.append("Whole run: {:.3f} s wall, {:.3f} s cpu, {} MB peak RSS".format(report["wall"], report["cpu"], megabytes(report["peak_rss"])))
+        return "\n".join(lines)
+
+    # Adds stages recorded in another process (eg. a worker in jsonparser's parallel mode).
+    def merge(self, stages):
+        self.stages += stages
+
+def format_row(s):
+    records = "" if s["records"] is None else str(s["records"])
+    return "  {:<28} {:>10.3f} {:>10.3f} {:>12} {:>12} {:>10}".format(s["stage"], s["wall"], s["cpu"], megabytes(s["peak_rss"]),
+                                                                      megabytes(s["peak_traced"]), records)
+
+def megabytes(size):
+    return "" if size is None else "{:.1f}".format(size / (1024 * 1024))
+
+# Returns the peak resident memory of this process so far in bytes, or None where it isn't available.
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# The profiler the scripts record into. It does nothing until enabled.
+profiler = Profiler()
+
+def stage(name):
+    return profiler.stage(name)
+
+def for_file(file):
+    return profiler.for_file(file)
+
+# Calls func(*args) with profiling turned on and returns (its result, the stages it recorded). For running work in a worker process,
+# whose profiler isn't the one in the main process; hand the stages back to the main one with profiler.merge.
+def call_profiled(trace_memory, func, *args):
+    profiler.enable(trace_memory)
+    profiler.stages = []
+    return func(*args), profiler.stages
+
+########################################
+# Command line hooks
+########################################
+
+# Adds the profiling options to a script's argument parser.
+def add_arguments(parser):
+    parser.add_argument("--profile", action="store_true", help="print how long each step took for each file, and in total")
+    parser.add_argument("--profile-json", metavar="FILE", help="save the per-stage timings to a json file")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also measure the peak memory allocated by python in each step with tracemalloc. Makes the run slower.")
+    parser.add_argument("--cprofile", metavar="FILE", help="run under cProfile and save the stats to FILE, for finding hot functions")
+
+# Turns on whatever profiling the parsed arguments ask for. Returns the cProfile.Profile if --cprofile was given.
+def start(args):
+    if args.profile or args.profile_json or args.profile_memory:
+        profiler.enable(trace_memory=args.profile_memory)
+
+    if args.cprofile:
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+        return cprofiler
+    return None
+
+# Prints and/or saves the profile once the run has finished.
+def finish(args, cprofiler=None):
+    if cprofiler is not None:
+        cprofiler.disable()
+        cprofiler.dump_stats(args.cprofile)
+        print("cProfile stats saved to " + args.cprofile)
+
+    if not profiler.enabled:
+        return
+
+    if args.profile or args.profile_memory:
+        print(profiler.summary())
+
+    if args.profile_json:
+        with open(args.profile_json, 'w', encoding='utf-8') as f:
+            json.dump(profiler.report(), f, indent=2)
+        print("Profile saved to " + args.profile_json)
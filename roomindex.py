@@ -0,0 +1,101 @@
+import os
+import json
+import mmap
+import jsonstream
+import compressed
+
+# Random access to the rooms of an export. An index of where each room's object starts and ends in the file (in bytes) is kept in a
+# sidecar file next to the export, "<export>.json.roomindex", so a run that only wants a few rooms can memory-map the export and decode
+# just those, instead of parsing the whole file to reach them. The index is built the first time it's needed (which takes one pass over
+# the export) and rebuilt whenever the export's size or modification time no longer match it. If the sidecar can't be written (eg. a
+# read-only folder) the index is just built in memory for that run. Compressed exports (see compressed.py) can't be jumped around in, so
+# they don't get an index: picking rooms out of them reads through the whole file, keeping just the rooms asked for.
+#
+#   roomindex.room_names("export.json")                      every room in the export
+#   roomindex.load_rooms("export.json", ["Room 1"])          the room dictionaries of just those rooms, decoded lazily
+#   analyzers.run_analyzers(roomindex.load_rooms(...), ...)  run analyzers over a subset of rooms
+
+SIDECAR_SUFFIX = ".roomindex"
+INDEX_VERSION = 1
+
+def sidecar_path(file):
+    return str(file) + SIDECAR_SUFFIX
+
+# Reads through an export once and returns a list of [room name, start byte, end byte] for every room in it. Rooms without a name
+# (no roomData) are listed with None as their name.
+def build_index(file):
+    rooms = []
+    for room, start, end in jsonstream.iter_rooms(file, spans=True):
+        try:
+            name = room["roomData"]["name"]
+        except (KeyError, TypeError):
+            name = None
+        # the rooms were decoded keeping any invalid utf-8 as is, so give the name the replacement characters the scripts would see
+        if isinstance(name, str):
+            name = name.encode('utf-8', 'surrogateescape').decode('utf-8', errors="replace")
+        rooms.append([name, start, end])
+    return rooms
+
+# Returns the room index of an export from its sidecar, building (and saving) it first if the sidecar is missing or out of date.
+# Compressed exports just have it built.
+def load_index(file):
+    if not compressed.is_plain(file):
+        return build_index(file)
+    stat = os.stat(file)
+    try:
+        with open(sidecar_path(file), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved["version"] == INDEX_VERSION and saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime_ns:
+            return saved["rooms"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    rooms = build_index(file)
+    try:
+        with open(sidecar_path(file), 'w', encoding='utf-8') as f:
+            json.dump({"version": INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns, "rooms": rooms}, f)
+    except OSError:
+        pass
+    return rooms
+
+# Returns the names of the rooms in an export, in the order they appear.
+def room_names(file):
+    return [name for name, start, end in load_index(file) if name is not None]
+
+# Yields the room dictionaries of an export, decoding only the rooms named in rooms (or every room if rooms is None), in the order they
+# appear in the file. The file is memory-mapped, so rooms that aren't asked for are never read.
+def load_rooms(file, rooms=None):
+    if not compressed.is_plain(file):
+        yield from filter_rooms(file, rooms)
+        return
+
+    index = load_index(file)
+    if rooms is not None:
+        rooms = set(rooms)
+        index = [entry for entry in index if entry[0] in rooms]
+    if len(index) == 0:
+        return
+
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for name, start, end in index:
+            yield json.loads(mapped[start:end].decode('utf-8', errors="replace"))
+
+# Yields the rooms named in rooms (or every room if rooms is None) from a single pass over an export, for exports without an index.
+def filter_rooms(file, rooms=None):
+    rooms = None if rooms is None else set(rooms)
+    for room in jsonstream.iter_rooms(file):
+        if rooms is None:
+            yield room
+            continue
+        try:
+            name = room["roomData"]["name"]
+        except (KeyError, TypeError):
+            continue
+        if name in rooms:
+            yield room
+
+# Turns a comma separated list of room names from the command line into a list, or None to keep every room.
+def parse_rooms_argument(rooms):
+    if rooms is None:
+        return None
+    return [room.strip() for room in rooms.split(",") if room.strip()]
@@ -0,0 +1,463 @@
+import os
+import json
+import sqlite3
+import argparse
+import lightweight
+np = lightweight.lazy_import("numpy")
+pd = lightweight.lazy_import("pandas")
+import analyzers
+import profiling
+import durations
+import outputs
+import compressed
+import votingparser
+
+# A local SQLite database of every export in an archive, so questions about the data can be answered with a query instead of rerunning a
+# script over the jsons. Exports are read with the same single pass over their records as the scripts (see analyzers.py) and loaded into
+# normalized tables:
+#   exports            one row per json file, with its folder, size and modification time
+#   rooms              the rooms of each export, in the order they appear in it
+#   participants       each user in each room (uid, screen name, role)
+#   speak_blocks       every speak block, with the participant it belongs to
+#   disconnect_blocks  every disconnected block, with the participant it belongs to
+#   agenda_votes       each participant's move on votes (advanceAgenda answers, 0 for yea and 1 for nay)
+#   transcript_events  every transcript event (moderator markers, questions, question votes, abuse flags...)
+#   polls              every poll, with who started it and the rest of its data as json
+# Each export is loaded in one transaction, with rows inserted in batches, so a run that is stopped part way never leaves half an export
+# behind. Exports that haven't changed since they were loaded are skipped, and exports that have are replaced.
+#
+# jsonparser's Speaker Totals and Speak Instances By Group sheets and votingparser's long and wide tables can then be regenerated from the
+# database (see speaker_totals, speak_instances_by_group and voting_table), for a single export, a folder or the whole archive:
+#
+#   python speakerdb.py ingest                        load every json under the current folder into speakerdata.db
+#   python speakerdb.py sheets --export a.json        write jsonparser's two sheets for one export
+#   python speakerdb.py voting --folder term1         write votingparser's tables for a folder
+
+DEFAULT_DATABASE = "speakerdata.db"
+
+# Bump this whenever the tables change, so a database made by an older version is rebuilt rather than read wrongly.
+SCHEMA_VERSION = 1
+
+# How many rows to hold before writing them to the database while an export is being loaded.
+BATCH_ROWS = 50000
+
+SCHEMA = """
+CREATE TABLE exports (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL
+);
+CREATE TABLE rooms (
+    id INTEGER PRIMARY KEY,
+    export_id INTEGER NOT NULL REFERENCES exports(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    has_users INTEGER NOT NULL
+);
+CREATE TABLE participants (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    uid TEXT,
+    screen_name TEXT,
+    role TEXT
+);
+CREATE TABLE speak_blocks (
+    id INTEGER PRIMARY KEY,
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    room_id INTEGER NOT NULL,
+    request_time INTEGER,
+    speak_time INTEGER,
+    finish_time INTEGER
+);
+CREATE TABLE disconnect_blocks (
+    id INTEGER PRIMARY KEY,
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    room_id INTEGER NOT NULL,
+    disconnected_time INTEGER,
+    connected_time INTEGER
+);
+CREATE TABLE agenda_votes (
+    id INTEGER PRIMARY KEY,
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    room_id INTEGER NOT NULL,
+    answer INTEGER
+);
+CREATE TABLE transcript_events (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    type TEXT,
+    user_id TEXT,
+    text TEXT,
+    t INTEGER
+);
+CREATE TABLE polls (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    poll_id TEXT,
+    type TEXT,
+    from_uid TEXT,
+    t INTEGER,
+    data TEXT
+);
+CREATE INDEX exports_folder ON exports(folder);
+CREATE INDEX rooms_export ON rooms(export_id);
+CREATE INDEX rooms_name ON rooms(name);
+CREATE INDEX participants_room ON participants(room_id, uid);
+CREATE INDEX participants_uid ON participants(uid);
+CREATE INDEX speak_blocks_participant ON speak_blocks(participant_id);
+CREATE INDEX speak_blocks_room ON speak_blocks(room_id, speak_time);
+CREATE INDEX disconnect_blocks_participant ON disconnect_blocks(participant_id);
+CREATE INDEX disconnect_blocks_room ON disconnect_blocks(room_id);
+CREATE INDEX agenda_votes_participant ON agenda_votes(participant_id);
+CREATE INDEX agenda_votes_room ON agenda_votes(room_id);
+CREATE INDEX transcript_events_room ON transcript_events(room_id, type, user_id);
+CREATE INDEX polls_room ON polls(room_id, type, from_uid);
+"""
+
+TABLES = ["exports", "rooms", "participants", "speak_blocks", "disconnect_blocks", "agenda_votes", "transcript_events", "polls"]
+
+# Opens (creating if needed) the database at path and returns the connection. A database from a different SCHEMA_VERSION is emptied and
+# made again, since everything in it can be loaded again from the exports.
+def connect(path=DEFAULT_DATABASE):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        with connection:
+            for table in reversed(TABLES):
+                connection.execute("DROP TABLE IF EXISTS " + table)
+            connection.executescript(SCHEMA)
+            connection.execute("PRAGMA user_version = " + str(SCHEMA_VERSION))
+    return connection
+
+# Reads the rows for every table from an export's records and writes them to the database in batches. Ids are handed out here rather than
+# by SQLite, so speak blocks and the rest can point at their participant without a query per row, and so every table can be written with
+# executemany. Blocks and votes belong to the user record just before them, like in jsonstream.iter_records.
+class IngestAnalyzer(analyzers.Analyzer):
+    def __init__(self, connection, export_id):
+        self.connection = connection
+        self.export_id = export_id
+        self.rows = {table: [] for table in TABLES[1:]}
+        self.pending = 0
+        self.ids = {}
+        for table in TABLES[1:]:
+            self.ids[table] = connection.execute("SELECT COALESCE(MAX(id), 0) FROM " + table).fetchone()[0]
+        self.room_id = None
+        self.participant_id = None
+
+    def _row(self, table, row):
+        self.ids[table] += 1
+        self.rows[table].append((self.ids[table],) + row)
+        self.pending += 1
+        return self.ids[table]
+
+    def room(self, roomname, room):
+        if self.pending >= BATCH_ROWS:
+            self.flush()
+        self.room_id = self._row("rooms", (self.export_id, roomname, int("userData" in room)))
+
+    def user(self, roomname, user):
+        self.participant_id = self._row("participants", (self.room_id, user.get("id"), user.get("screenName"), user.get("role")))
+        for item in user.get("advanceAgenda") or []:
+            self._row("agenda_votes", (self.participant_id, self.room_id, item.get("answer")))
+
+    def speakBlock(self, roomname, user, block):
+        self._row("speak_blocks", (self.participant_id, self.room_id, block.get("requestTime"), block.get("speakTime"),
+                                   block.get("finishTime")))
+
+    def disconnectedBlock(self, roomname, user, block):
+        self._row("disconnect_blocks", (self.participant_id, self.room_id, block.get("disconnectedTime"), block.get("connectedTime")))
+
+    def transcript(self, roomname, event):
+        self._row("transcript_events", (self.room_id, event.get("type"), event.get("userId"), event.get("text"), event.get("t")))
+
+    def poll(self, roomname, pollid, poll):
+        data = poll.get("data") or {}
+        self._row("polls", (self.room_id, pollid, poll.get("type"), data.get("from"), poll.get("t"), json.dumps(data)))
+
+    # Writes out the rows collected so far. Tables are written parents first, so the foreign keys always have something to point at.
+    def flush(self):
+        for table in TABLES[1:]:
+            rows = self.rows[table]
+            if rows:
+                marks = ", ".join("?" * len(rows[0]))
+                self.connection.executemany("INSERT INTO " + table + " VALUES (" + marks + ")", rows)
+                self.rows[table] = []
+        self.pending = 0
+
+    def result(self):
+        self.flush()
+        return self.ids["rooms"]
+
+# Loads a json export into the database, replacing it if it was loaded before and has changed since. Returns True if the export was
+# loaded and False if it was already up to date.
+def ingest_file(connection, file):
+    file = os.path.abspath(file)
+    stat = compressed.stat(file)
+    existing = connection.execute("SELECT id, size, mtime FROM exports WHERE path = ?", (file,)).fetchone()
+    if existing is not None and existing[1] == stat.st_size and existing[2] == stat.st_mtime_ns:
+        return False
+
+    print("Loading " + file + "...")
+    with profiling.for_file(file), profiling.stage("ingest") as stage, connection:
+        if existing is not None:
+            # the cascades take the export's rooms, participants and everything under them with it
+            connection.execute("DELETE FROM exports WHERE id = ?", (existing[0],))
+        cursor = connection.execute("INSERT INTO exports (path, folder, size, mtime) VALUES (?, ?, ?, ?)",
+                                    (file, os.path.dirname(compressed.split(file)[0]), stat.st_size, stat.st_mtime_ns))
+        ingester = IngestAnalyzer(connection, cursor.lastrowid)
+        analyzers.run_analyzers(file, [ingester])
+        stage.records = ingester.ids["speak_blocks"]
+    return True
+
+# Returns every json file in paths, which can be files or folders, including compressed ones and the jsons in zip archives (see
+# compressed.py). Folders are searched however deeply nested, skipping hidden folders (like the parse cache), and their files are taken in
+# sorted order.
+def find_json_files(paths):
+    json_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            path = os.path.abspath(path)
+            json_files += compressed.zip_members(path) if path.endswith(".zip") else [path]
+            continue
+        for folder, dirnames, filenames in os.walk(os.path.abspath(path)):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            json_files += compressed.exports_in(folder, sorted(filenames))
+    return json_files
+
+# Loads every json file in paths into the database. A file that fails is reported without stopping the rest. With prune, exports in the
+# database whose files no longer exist are deleted too. Returns the number of files loaded.
+def ingest(connection, paths, prune=False):
+    loaded = 0
+    for file in find_json_files(paths):
+        try:
+            loaded += ingest_file(connection, file)
+        except Exception as e:
+            print("Failed to load " + file + ": " + repr(e))
+
+    if prune:
+        with connection:
+            for exportid, path in connection.execute("SELECT id, path FROM exports").fetchall():
+                if not os.path.exists(compressed.split(path)[0]):
+                    print("Removing " + path + " from the database")
+                    connection.execute("DELETE FROM exports WHERE id = ?", (exportid,))
+    return loaded
+
+# Returns the SQL condition and parameters that pick the rooms of one export (by path), one folder, or everything if both are None.
+def scope(export=None, folder=None):
+    if export is not None:
+        return "r.export_id = (SELECT id FROM exports WHERE path = ?)", [os.path.abspath(export)]
+    if folder is not None:
+        return "r.export_id IN (SELECT id FROM exports WHERE folder = ?)", [os.path.abspath(folder)]
+    return "1", []
+
+# Returns the names of the rooms in scope, in the order they first appear.
+def room_names(connection, export=None, folder=None):
+    where, params = scope(export, folder)
+    query = "SELECT r.name FROM rooms r WHERE " + where + " GROUP BY r.name ORDER BY MIN(r.id)"
+    return [row[0] for row in connection.execute(query, params)]
+
+# Puts a room at a time of (room, ...) rows side by side, like the jsonparser sheets: a block of columns for each room in roomnames, named
+# "<column>_<room>". columns is a list of (column, kind) pairs, where kind is "text", "count" or "time" (milliseconds, which are
+# formatted). With skip_empty, rooms without any rows are left out rather than given empty columns.
+def side_by_side(rows, roomnames, columns, time_format, skip_empty=False):
+    byroom = {}
+    for row in rows:
+        byroom.setdefault(row[0], []).append(row[1:])
+
+    out = pd.DataFrame()
+    for room in roomnames:
+        roomrows = byroom.get(room, [])
+        if skip_empty and len(roomrows) == 0:
+            continue
+        newelems = pd.DataFrame(index=range(len(roomrows)))
+        for i, (column, kind) in enumerate(columns):
+            values = [row[i] for row in roomrows]
+            if kind == "time":
+                values = durations.format_durations(np.array(values, dtype=np.int64), time_format)
+            elif kind == "count":
+                values = np.array(values, dtype=np.int64)
+            else:
+                values = np.array(values, dtype=object)
+            newelems[column + "_" + room] = values
+        out = pd.concat([out, newelems], axis=1)
+    return out
+
+# The Speak Instances By Group sheet of jsonparser, from the database: every speak with any length in each room, ordered by start time,
+# leaving out the users named in exclude_speakers.
+def speak_instances_by_group(connection, export=None, folder=None, time_format="mm:ss", exclude_speakers=['Record']):
+    where, params = scope(export, folder)
+    marks = ", ".join("?" * len(exclude_speakers)) or "NULL"
+    query = """
+        SELECT r.name, p.screen_name, p.uid, s.finish_time - s.speak_time
+        FROM speak_blocks s JOIN participants p ON p.id = s.participant_id JOIN rooms r ON r.id = s.room_id
+        WHERE """ + where + " AND s.finish_time - s.speak_time > 0 AND p.screen_name NOT IN (" + marks + """)
+        ORDER BY r.name, s.speak_time, s.id"""
+    rows = connection.execute(query, params + list(exclude_speakers)).fetchall()
+    roomnames = room_names(connection, export, folder)
+    return side_by_side(rows, roomnames, [("DisplayName", "text"), ("ParticipantID", "text"), ("SpeakTime", "time")], time_format)
+
+# The Speaker Totals sheet of jsonparser, from the database: each speaker's total speak time and number of speaks in each room, in the
+# order they first appear in it. Speakers are told apart by uid and screen name, and users who never spoke are listed with nothing (unless
+# they have no uid, like jsonparser).
+def speaker_totals(connection, export=None, folder=None, time_format="mm:ss", exclude_speakers=['Record']):
+    where, params = scope(export, folder)
+    marks = ", ".join("?" * len(exclude_speakers)) or "NULL"
+    query = """
+        SELECT r.name, p.screen_name, p.uid, COALESCE(SUM(s.finish_time - s.speak_time), 0),
+               COUNT(CASE WHEN s.finish_time - s.speak_time != 0 THEN 1 END)
+        FROM participants p JOIN rooms r ON r.id = p.room_id LEFT JOIN speak_blocks s ON s.participant_id = p.id
+        WHERE """ + where + " AND p.screen_name NOT IN (" + marks + """)
+        GROUP BY r.name, p.uid, p.screen_name
+        HAVING COALESCE(p.uid, '') != '' OR COUNT(s.id) > 0
+        ORDER BY MIN(r.id), MIN(p.id)"""
+    rows = connection.execute(query, params + list(exclude_speakers)).fetchall()
+    roomnames = room_names(connection, export, folder)
+    return side_by_side(rows, roomnames, [("DisplayName", "text"), ("ParticipantID", "text"), ("TotalSpeakTime", "time"),
+                                          ("NumSpeaks", "count")], time_format, skip_empty=True)
+
+# votingparser's long table, from the database, with times still in milliseconds: a row for each participant in each room, with their
+# counts summed across the exports in scope. Each participant keeps the name and role of the first export they appear in, and observers,
+# admins and removed users are left out. Rooms without users are skipped, and a room's deliberation runs from its earliest
+# "Introductions" to its latest "Deliberation ends" (taking the latest of each marker within an export).
+def voting_table(connection, export=None, folder=None):
+    where, params = scope(export, folder)
+    query = """
+        WITH scoped AS (
+            SELECT r.id, r.name, r.export_id FROM rooms r WHERE """ + where + """ AND r.has_users
+        ),
+        people AS (
+            SELECT p.id, p.uid, p.room_id, sr.name AS room FROM participants p JOIN scoped sr ON sr.id = p.room_id
+        ),
+        firsts AS (
+            SELECT uid, MIN(id) AS first FROM people GROUP BY uid
+        ),
+        votes AS (
+            SELECT v.participant_id AS id, SUM(v.answer = 0) AS yeas, SUM(v.answer = 1) AS nays
+            FROM agenda_votes v JOIN people pe ON pe.id = v.participant_id GROUP BY v.participant_id
+        ),
+        speaks AS (
+            SELECT s.participant_id AS id, SUM(s.finish_time != s.speak_time) AS count, SUM(s.finish_time - s.speak_time) AS total
+            FROM speak_blocks s JOIN people pe ON pe.id = s.participant_id GROUP BY s.participant_id
+        ),
+        initiations AS (
+            SELECT o.room_id, o.from_uid AS uid, COUNT(*) AS count
+            FROM polls o JOIN scoped sr ON sr.id = o.room_id WHERE o.type = 'advanceAgenda' GROUP BY o.room_id, o.from_uid
+        ),
+        questions AS (
+            SELECT t.room_id, t.user_id AS uid, SUM(t.type = 'submitQuestion') AS written, SUM(t.type = 'submitQuestionRanks') AS votes
+            FROM transcript_events t JOIN scoped sr ON sr.id = t.room_id
+            WHERE t.type IN ('submitQuestion', 'submitQuestionRanks') GROUP BY t.room_id, t.user_id
+        ),
+        markers AS (
+            SELECT sr.name, MAX(CASE WHEN t.text = 'Introductions' THEN t.t END) AS start,
+                   MAX(CASE WHEN t.text = 'Deliberation ends' THEN t.t END) AS finish
+            FROM transcript_events t JOIN scoped sr ON sr.id = t.room_id
+            WHERE t.type = 'moderator' GROUP BY sr.name, sr.export_id
+        ),
+        delibs AS (
+            SELECT name, COALESCE(MAX(finish), 0) - COALESCE(MIN(NULLIF(start, 0)), 0) AS delib FROM markers GROUP BY name
+        ),
+        speaking AS (
+            SELECT sr.name, SUM(s.finish_time - s.speak_time) AS total FROM speak_blocks s JOIN scoped sr ON sr.id = s.room_id GROUP BY sr.name
+        )
+        SELECT pe.uid, fp.screen_name, pe.room, SUM(COALESCE(v.yeas, 0)), SUM(COALESCE(v.nays, 0)), SUM(COALESCE(i.count, 0)),
+               SUM(COALESCE(q.written, 0)), SUM(COALESCE(q.votes, 0)), SUM(COALESCE(s.count, 0)), SUM(COALESCE(s.total, 0)),
+               COALESCE(d.delib, 0), COALESCE(g.total, 0)
+        FROM people pe
+            JOIN firsts f ON f.uid = pe.uid JOIN participants fp ON fp.id = f.first
+            LEFT JOIN votes v ON v.id = pe.id
+            LEFT JOIN speaks s ON s.id = pe.id
+            LEFT JOIN initiations i ON i.room_id = pe.room_id AND i.uid = pe.uid
+            LEFT JOIN questions q ON q.room_id = pe.room_id AND q.uid = pe.uid
+            LEFT JOIN delibs d ON d.name = pe.room
+            LEFT JOIN speaking g ON g.name = pe.room
+        WHERE COALESCE(fp.role, '') NOT IN ('observer', 'admin', 'removed')
+        GROUP BY pe.uid, pe.room
+        ORDER BY f.first, MIN(pe.id)"""
+    rows = connection.execute(query, params).fetchall()
+    return pd.DataFrame.from_records(rows, columns=votingparser.output_columns)
+
+# Returns the paths of the exports in scope, in the order they were loaded.
+def exports_in(connection, export=None, folder=None):
+    where, params = scope(export, folder)
+    query = "SELECT e.path FROM exports e WHERE e.id IN (SELECT r.export_id FROM rooms r WHERE " + where + ") ORDER BY e.id"
+    return [row[0] for row in connection.execute(query, params)]
+
+# Writes jsonparser's Speak Instances By Group and Speaker Totals sheets for each export in scope, named after the export like jsonparser
+# names its workbooks. Returns the files written.
+def write_sheets(connection, export=None, folder=None, time_format="mm:ss", output_format="xlsx"):
+    files = []
+    for path in exports_in(connection, export, folder):
+        with profiling.for_file(path):
+            sheets = {}
+            with profiling.stage("query_speak_instances_by_group"):
+                sheets['Speak Instances By Group'] = speak_instances_by_group(connection, path, None, time_format)
+            with profiling.stage("query_speaker_totals"):
+                sheets['Speaker Totals'] = speaker_totals(connection, path, None, time_format)
+            with profiling.stage("write_" + output_format):
+                files += outputs.write_sheets(sheets, compressed.export_name(path), output_format)
+    return files
+
+# Writes votingparser's long and wide tables for each folder of exports in scope, named after the folder's path under the current folder
+# like votingparser names them.
+def write_voting(connection, folder=None, time_format="h:mm:ss", output_format="csv"):
+    if folder is None:
+        folders = [row[0] for row in connection.execute("SELECT folder FROM exports GROUP BY folder ORDER BY MIN(id)")]
+    else:
+        folders = [os.path.abspath(folder)]
+
+    for path in folders:
+        name = os.path.relpath(path, os.getcwd()).replace(os.sep, "_")
+        with profiling.for_file(name):
+            with profiling.stage("query_voting_table") as stage:
+                df = voting_table(connection, None, path)
+                stage.records = len(df)
+            votingparser.write_tables(df, name, time_format, output_format)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load deliberation jsons into a SQLite database and write the scripts' outputs from it.")
+    parser.add_argument("--db", default=DEFAULT_DATABASE, help="the database file to use (default " + DEFAULT_DATABASE + ")")
+    profiling.add_arguments(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingestcommand = commands.add_parser("ingest", help="load json files, or every json under folders, into the database. Files that haven't "
+                                       "changed since they were loaded are skipped.")
+    ingestcommand.add_argument("paths", nargs="*", default=["."], help="json files or folders (default the current folder)")
+    ingestcommand.add_argument("--prune", action="store_true", help="also remove exports whose files no longer exist")
+
+    sheetscommand = commands.add_parser("sheets", help="write jsonparser's Speak Instances By Group and Speaker Totals sheets for each export")
+    sheetscommand.add_argument("--export", help="only write the sheets for this json file")
+    sheetscommand.add_argument("--folder", help="only write the sheets for the exports in this folder")
+    sheetscommand.add_argument("--time-format", choices=durations.STYLES, default="mm:ss")
+    sheetscommand.add_argument("--output-format", choices=outputs.FORMATS, default="xlsx")
+
+    votingcommand = commands.add_parser("voting", help="write votingparser's long and wide tables for each folder of exports")
+    votingcommand.add_argument("--folder", help="only write the tables for this folder")
+    votingcommand.add_argument("--time-format", choices=durations.STYLES, default="h:mm:ss")
+    votingcommand.add_argument("--output-format", choices=["csv", "parquet", "feather"], default="csv")
+
+    args = parser.parse_args(argv)
+    if args.command != "ingest":
+        outputs.check_available(args.output_format)
+    cprofiler = profiling.start(args)
+
+    connection = connect(args.db)
+    if args.command == "ingest":
+        loaded = ingest(connection, args.paths, args.prune)
+        print("Loaded " + str(loaded) + " files into " + args.db)
+    elif args.command == "sheets":
+        files = write_sheets(connection, args.export, args.folder, args.time_format, args.output_format)
+        print("Data saved to " + (", ".join(files) or "nothing") + ".")
+    else:
+        write_voting(connection, args.folder, args.time_format, args.output_format)
+    connection.close()
+
+    profiling.finish(args, cprofiler)
+
+if __name__ == "__main__":
+    main()
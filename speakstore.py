@@ -0,0 +1,238 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+from array import array
+import identities
+
+# Containers for keeping parsed data bucketed by room, so the organize functions can look a room up once rather than scanning every
+# speak instance in the deliberation for each room.
+
+# Holds every speak instance from a deliberation in columns rather than as one python object per speak. Times are kept in compact
+# arrays (start, end, requestTime, length) and rooms, uids and speakers are stored as integer codes into lists of their distinct
+# values, so a season's worth of speak blocks costs a few bytes per block and can be aggregated with numpy instead of python loops.
+# Iterating over the store, or calling in_room/by_start/by_speaker, gives speakInstanceView objects with a speak instance's attributes
+# (group, speaker, uid, start, end, requestTime, length) for code that wants one speak at a time.
+class SpeakInstanceStore:
+    def __init__(self, speak_instances=[]):
+        self.rooms = []
+        self.uids = []
+        self.speakers = []
+        self._codes = ({}, {}, {})
+
+        self._start = array('q')
+        self._end = array('q')
+        self._requestTime = array('d')
+        self._room = array('l')
+        self._uid = array('l')
+        self._speaker = array('l')
+
+        self._columns = None
+        self._roomrows = None
+        self._decoded = {}
+
+        for instance in speak_instances:
+            self.append(instance)
+
+    # Adds a single speak instance from its room, speaker, uid and speakBlock. A speakBlock of 0 adds a zero length instance, which
+    # is used to make sure every user shows up in the totals even if they never spoke.
+    def add(self, group, speaker, uid, speakBlock):
+        if speakBlock == 0:
+            self._add(group, speaker, uid, 0, 0, None)
+        else:
+            self._add(group, speaker, uid, speakBlock['speakTime'], speakBlock['finishTime'], speakBlock['requestTime'])
+
+    # Adds anything with the attributes of a speak instance (eg. a speakInstanceView from another store) to the store.
+    def append(self, instance):
+        self._add(instance.group, instance.speaker, instance.uid, instance.start, instance.end, instance.requestTime)
+
+    def _add(self, group, speaker, uid, start, end, requestTime):
+        self._start.append(start)
+        self._end.append(end)
+        self._requestTime.append(np.nan if requestTime is None else requestTime)
+        self._room.append(self._encode(0, self.rooms, group))
+        self._uid.append(self._encode(1, self.uids, uid))
+        self._speaker.append(self._encode(2, self.speakers, speaker))
+        self._columns = None
+        self._roomrows = None
+        self._decoded = {}
+
+    # Returns the integer code for value in one of the categorical columns, adding it to the column's list of values if it's new.
+    def _encode(self, column, values, value):
+        codes = self._codes[column]
+        if value not in codes:
+            # interned, so stores from different exports share their copies (see identities.intern)
+            value = identities.intern(value)
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    # Adds every speak instance from another store, eg. to analyse all the exports in a folder together. Only the other store's lists
+    # of distinct rooms, uids and speakers are looked up one by one; its columns are recoded with numpy.
+    def extend(self, other):
+        self._start.extend(other._start)
+        self._end.extend(other._end)
+        self._requestTime.extend(other._requestTime)
+        for column, values, mine, theirs in [(0, other.rooms, self.rooms, other._room), (1, other.uids, self.uids, other._uid),
+                                             (2, other.speakers, self.speakers, other._speaker)]:
+            recode = np.array([self._encode(column, mine, value) for value in values], dtype=np.int64)
+            target = [self._room, self._uid, self._speaker][column]
+            target.extend(recode[np.array(theirs, dtype=np.int64)].tolist())
+        self._columns = None
+        self._roomrows = None
+        self._decoded = {}
+
+    # Returns a dictionary of numpy arrays, one per column. The arrays are built once and kept until the store changes.
+    def columns(self):
+        if self._columns is None:
+            start = np.array(self._start, dtype=np.int64)
+            end = np.array(self._end, dtype=np.int64)
+            self._columns = {
+                'start': start,
+                'end': end,
+                'length': end - start,
+                'requestTime': np.array(self._requestTime, dtype=np.float64),
+                'room': np.array(self._room, dtype=np.int64),
+                'uid': np.array(self._uid, dtype=np.int64),
+                'speaker': np.array(self._speaker, dtype=np.int64),
+            }
+        return self._columns
+
+    # Returns the row numbers of the speak instances in a room, in the order they were added or sorted by start time. Every room's
+    # rows are found with a single stable sort of the whole store, so looking up a room is just a slice.
+    def room_rows(self, room, by_start=False):
+        code = self._codes[0].get(room)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+
+        if self._roomrows is None:
+            columns = self.columns()
+            inorder = np.argsort(columns['room'], kind='stable')
+            bystart = np.lexsort((columns['start'], columns['room']))
+            bounds = np.searchsorted(columns['room'][inorder], np.arange(len(self.rooms) + 1))
+            self._roomrows = (inorder, bystart, bounds)
+
+        inorder, bystart, bounds = self._roomrows
+        rows = bystart if by_start else inorder
+        return rows[bounds[code]:bounds[code + 1]]
+
+    # Returns the speak instances in a room in the order they were added.
+    def in_room(self, room):
+        return [speakInstanceView(self, i) for i in self.room_rows(room)]
+
+    # Returns the speak instances in a room sorted by start time.
+    def by_start(self, room):
+        return [speakInstanceView(self, i) for i in self.room_rows(room, by_start=True)]
+
+    # Returns a dictionary with (uid, speaker) tuples as keys and the list of that speaker's instances in the room as values.
+    def by_speaker(self, room):
+        speakers = {}
+        for instance in self.in_room(room):
+            key = (instance.uid, instance.speaker)
+            if key not in speakers:
+                speakers[key] = []
+            speakers[key].append(instance)
+        return speakers
+
+    # Sums the speak instances in every room by speaker in one pass. Returns a dictionary keyed by room code with a tuple of
+    # (uid codes, speaker codes, total lengths, number of non-zero length speaks) arrays, with speakers in the order they first appear
+    # in the room.
+    def speaker_totals(self):
+        columns = self.columns()
+        if len(columns['room']) == 0:
+            return {}
+
+        key = (columns['room'] * len(self.uids) + columns['uid']) * len(self.speakers) + columns['speaker']
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        totals = np.bincount(inverse, weights=columns['length'], minlength=len(first)).astype(np.int64)
+        counts = np.bincount(inverse, weights=columns['length'] > 0, minlength=len(first)).astype(np.int64)
+
+        # order the groups by room and then by first appearance, and find where each room's groups start and end
+        grouprooms = columns['room'][first]
+        order = np.lexsort((first, grouprooms))
+        firstrows = first[order]
+        bounds = np.searchsorted(grouprooms[order], np.arange(len(self.rooms) + 1))
+
+        out = {}
+        for code in range(len(self.rooms)):
+            rows = firstrows[bounds[code]:bounds[code + 1]]
+            if len(rows):
+                groups = order[bounds[code]:bounds[code + 1]]
+                out[code] = (columns['uid'][rows], columns['speaker'][rows], totals[groups], counts[groups])
+        return out
+
+    # Returns the code for a room, or None if the room has no speak instances.
+    def room_code(self, room):
+        return self._codes[0].get(room)
+
+    # Turns an array of codes back into an object array of the values they stand for.
+    def decode(self, column, codes):
+        if column not in self._decoded:
+            values = {'room': self.rooms, 'uid': self.uids, 'speaker': self.speakers}[column]
+            self._decoded[column] = np.empty(len(values), dtype=object)
+            self._decoded[column][:] = values
+        return self._decoded[column][codes]
+
+    # The numpy columns and room orderings are rebuilt on demand, so leave them out when pickling (eg. for the parse cache).
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        state['_roomrows'] = None
+        state['_decoded'] = {}
+        return state
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield speakInstanceView(self, i)
+
+    def __len__(self):
+        return len(self._start)
+
+# A read-only speak instance that reads its attributes from a row of a SpeakInstanceStore.
+class speakInstanceView:
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = int(row)
+
+    @property
+    def uid(self):
+        return self.store.uids[self.store._uid[self.row]]
+
+    @property
+    def speaker(self):
+        return self.store.speakers[self.store._speaker[self.row]]
+
+    @property
+    def group(self):
+        return self.store.rooms[self.store._room[self.row]]
+
+    @property
+    def start(self):
+        return self.store._start[self.row]
+
+    @property
+    def end(self):
+        return self.store._end[self.row]
+
+    @property
+    def length(self):
+        return self.store._end[self.row] - self.store._start[self.row]
+
+    @property
+    def requestTime(self):
+        requestTime = self.store._requestTime[self.row]
+        return None if requestTime != requestTime else int(requestTime)
+
+# Wraps a plain list of speak instances in a SpeakInstanceStore, so the organize functions still accept lists built elsewhere.
+def as_store(speak_instances):
+    if isinstance(speak_instances, SpeakInstanceStore):
+        return speak_instances
+    return SpeakInstanceStore(speak_instances)
+
+# Combines several stores (eg. one per export in a folder) into a new one.
+def concat(stores):
+    combined = SpeakInstanceStore()
+    for store in stores:
+        combined.extend(as_store(store))
+    return combined
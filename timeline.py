@@ -0,0 +1,259 @@
+import lightweight
+pd = lightweight.lazy_import("pandas")
+np = lightweight.lazy_import("numpy")
+import os
+import argparse
+import analyzers
+import profiling
+import durations
+import outputs
+import compressed
+import speakstore
+import transcripts
+
+# How speaking is spread over each deliberation: the time spent speaking in each fixed-width bin (a minute by default) of every room, and
+# of every speaker in every room. Each room's bins start at its "Introductions" moderator event and stop at its "Deliberation ends" event
+# (the same markers votingparser uses for groupDelibTime), or at its first and last speak if it doesn't have them, so bin n is the same
+# stretch of every room's deliberation. Speaking before the start or after the end is left out.
+#
+# The bins are filled for every room and speaker at once, without looking at any speak more than once or stepping through it second by
+# second. A speak from s to e covers part of the bin s falls in, part of the bin e falls in, and the whole of every bin in between:
+#   - the two partial bins are added up with a bincount over (row, bin) keys
+#   - the whole bins are marked with +width at the first and -width after the last, also with a bincount, and filled in with a cumulative
+#     sum along each row
+# so a term's worth of exports costs a few sorts and bincounts over its speak blocks.
+#
+#   python timeline.py                        writes "<export> - Timeline" for every json in the current folder
+#   python timeline.py term1 --bin-seconds 30 every export under term1, in 30 second bins
+
+DEFAULT_WIDTH = 60 * 1000
+
+class Timeline:
+    def __init__(self, width, rooms, starts, ends, startmarked, endmarked, nbins, rooms_bins, speaker_rooms, speaker_uids,
+                 speaker_names, speakers_bins):
+        # bin width in milliseconds
+        self.width = width
+        # per room: its name, the times its first bin starts and its last bin ends, whether they came from the moderator markers, and its
+        # number of bins
+        self.rooms = rooms
+        self.starts = starts
+        self.ends = ends
+        self.startmarked = startmarked
+        self.endmarked = endmarked
+        self.nbins = nbins
+        # milliseconds spoken in each bin, a row per room (rooms x the most bins of any room). Bins past the end of a room are 0.
+        self.rooms_bins = rooms_bins
+        # a row per speaker in each room, grouped by room and in the order they first spoke: the room's position in rooms, their uid and
+        # screen name, and the milliseconds they spoke in each bin
+        self.speaker_rooms = speaker_rooms
+        self.speaker_uids = speaker_uids
+        self.speaker_names = speaker_names
+        self.speakers_bins = speakers_bins
+
+# Takes in the start and end of every interval (relative to the start of its row's timeline, and already clipped to it), the row each
+# one is counted in, the number of rows and the number of bins, and returns a rows x bins array of how much of the intervals fall in each
+# bin. Intervals must have end > start >= 0 and end <= bins * width.
+def spread(starts, ends, keys, nrows, nbins, width):
+    size = nrows * nbins
+    if size == 0:
+        return np.zeros((nrows, nbins), dtype=np.int64)
+    first = starts // width
+    last = (ends - 1) // width
+    same = first == last
+
+    # the bins the intervals start and end in, or the whole interval when it's within one bin
+    partial = np.concatenate([keys * nbins + first, keys[~same] * nbins + last[~same]])
+    amounts = np.concatenate([np.where(same, ends - starts, (first + 1) * width - starts), ends[~same] - last[~same] * width])
+    binned = np.bincount(partial, weights=amounts, minlength=size)
+
+    # the whole bins in between, as steps that the cumulative sum turns into runs of width
+    between = ~same
+    steps = np.concatenate([keys[between] * nbins + first[between] + 1, keys[between] * nbins + last[between]])
+    sizes = np.concatenate([np.full(between.sum(), width), np.full(between.sum(), -width)])
+    whole = np.cumsum(np.bincount(steps, weights=sizes, minlength=size).reshape(nrows, nbins), axis=1)
+
+    return np.rint(binned.reshape(nrows, nbins) + whole).astype(np.int64)
+
+# Works out the Timeline of every room in roomnames from a SpeakInstanceStore of their speaks and a TranscriptIndex for their markers.
+def build(store, roomnames, index, width=DEFAULT_WIDTH):
+    rooms = list(dict.fromkeys(str(room) for room in roomnames))
+    columns = store.columns()
+    spoke = np.flatnonzero(columns['length'] > 0)
+
+    # the position in rooms of each of the store's rooms, and of each speak
+    positions = {room: i for i, room in enumerate(rooms)}
+    position = np.array([positions.get(room, -1) for room in store.rooms], dtype=np.int64)
+    spoke = spoke[position[columns['room'][spoke]] >= 0]
+    where = position[columns['room'][spoke]]
+    start = columns['start'][spoke]
+    end = columns['end'][spoke]
+
+    # each room's first and last speak, for the rooms without markers
+    firststart = np.full(len(rooms), np.iinfo(np.int64).max)
+    lastend = np.full(len(rooms), np.iinfo(np.int64).min)
+    np.minimum.at(firststart, where, start)
+    np.maximum.at(lastend, where, end)
+    hasspeaks = np.bincount(where, minlength=len(rooms)) > 0
+
+    starts = np.zeros(len(rooms), dtype=np.int64)
+    ends = np.zeros(len(rooms), dtype=np.int64)
+    startmarked = np.zeros(len(rooms), dtype=bool)
+    endmarked = np.zeros(len(rooms), dtype=bool)
+    for i, room in enumerate(rooms):
+        introductions = index.marker(room, "Introductions")
+        finished = index.marker(room, "Deliberation ends")
+        startmarked[i] = introductions is not None and introductions == introductions
+        starts[i] = introductions if startmarked[i] else (firststart[i] if hasspeaks[i] else 0)
+        endmarked[i] = finished is not None and finished == finished and finished > starts[i]
+        ends[i] = finished if endmarked[i] else (max(lastend[i], starts[i]) if hasspeaks[i] else starts[i])
+    nbins = -((starts - ends) // width)
+    totalbins = int(nbins.max()) if len(rooms) else 0
+
+    # the speaks relative to their room's first bin, clipped to the room's timeline
+    clippedstart = np.maximum(start, starts[where]) - starts[where]
+    clippedend = np.minimum(end, ends[where]) - starts[where]
+    inside = clippedend > clippedstart
+    rows = np.flatnonzero(inside)
+    clippedstart, clippedend, where = clippedstart[inside], clippedend[inside], where[inside]
+
+    rooms_bins = spread(clippedstart, clippedend, where, len(rooms), totalbins, width)
+
+    # number the speakers in each room, grouped by room and in the order they first started speaking
+    order = np.lexsort((start[rows], where))
+    speakerkeys = where[order] * max(len(store.uids), 1) + columns['uid'][spoke[rows[order]]]
+    keys, first, inverse = np.unique(speakerkeys, return_index=True, return_inverse=True)
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(keys))
+    speakers = np.empty(len(order), dtype=np.int64)
+    speakers[order] = rank[inverse.reshape(-1)]
+    firstrows = spoke[rows[order[np.sort(first)]]]
+
+    speakers_bins = spread(clippedstart, clippedend, speakers, len(keys), totalbins, width)
+
+    return Timeline(width, rooms, starts, ends, startmarked, endmarked, nbins, rooms_bins, where[order[np.sort(first)]],
+                    store.decode('uid', columns['uid'][firstrows]), store.decode('speaker', columns['speaker'][firstrows]), speakers_bins)
+
+# Collects the speaks and moderator markers of an export and returns its Timeline (or None if it has no rooms). Users named in
+# exclude_speakers are left out, like jsonparser's speak instances. Can share a transcript index with other analyzers in the same run (see
+# transcripts.py).
+@analyzers.register("timeline")
+class TimelineAnalyzer(transcripts.TranscriptAnalyzer):
+    def __init__(self, width=DEFAULT_WIDTH, index=None, exclude_speakers=['Record']):
+        transcripts.TranscriptAnalyzer.__init__(self, index)
+        self.width = width
+        self.exclude_speakers = exclude_speakers
+        self.roomnames = []
+        self.speak_instances = speakstore.SpeakInstanceStore()
+
+    def room(self, roomname, room):
+        self.roomnames.append(roomname)
+
+    def speakBlock(self, roomname, user, block):
+        if user['screenName'] not in self.exclude_speakers:
+            self.speak_instances.add(roomname, user['screenName'], user['id'], block)
+
+    def result(self):
+        if not self.roomnames:
+            return None
+        return build(self.speak_instances, self.roomnames, self.index, self.width)
+
+# The column names for the bins: the time each bin starts, from the start of the room's timeline.
+def bin_labels(timeline, time_format="mm:ss"):
+    labels = durations.format_durations(np.arange(timeline.rooms_bins.shape[1]) * timeline.width, time_format)
+    return [str(label) for label in labels]
+
+# Takes in a Timeline and returns two dataframes of seconds spoken per bin, with a column per bin named after the time it starts:
+#   by room, with a row for each room: its name, what its timeline starts and ends at ("Introductions"/"First speak" and
+#   "Deliberation ends"/"Last speak"), its length, and its bins
+#   by speaker, with a row for each speaker in each room: the room, their DisplayName and ParticipantID, and their bins
+# Bins past the end of a room are left empty.
+def organize_timeline(timeline, time_format="mm:ss"):
+    labels = bin_labels(timeline, time_format)
+    past = np.arange(len(labels)) >= timeline.nbins[:, None]
+
+    values = timeline.rooms_bins / 1000
+    values[past] = np.nan
+    byroom = pd.DataFrame({
+        "Room": timeline.rooms,
+        "StartsAt": np.where(timeline.startmarked, "Introductions", "First speak"),
+        "EndsAt": np.where(timeline.endmarked, "Deliberation ends", "Last speak"),
+        "Length": durations.format_durations(timeline.ends - timeline.starts, time_format),
+    })
+    byroom = pd.concat([byroom, pd.DataFrame(values, columns=labels)], axis=1)
+
+    values = timeline.speakers_bins / 1000
+    values[past[timeline.speaker_rooms]] = np.nan
+    byspeaker = pd.DataFrame({
+        "Room": [timeline.rooms[i] for i in timeline.speaker_rooms],
+        "DisplayName": timeline.speaker_names,
+        "ParticipantID": timeline.speaker_uids,
+    })
+    byspeaker = pd.concat([byspeaker, pd.DataFrame(values, columns=labels)], axis=1)
+
+    return byroom, byspeaker
+
+# Reads an export and writes its timeline sheets under name. Returns the files written, or None if it has no rooms.
+def process_file(file, name, width=DEFAULT_WIDTH, time_format="mm:ss", output_format="xlsx"):
+    with profiling.for_file(file):
+        print("Reading " + file + "...")
+        with profiling.stage("timeline") as stage:
+            timeline = analyzers.run_analyzers(file, [TimelineAnalyzer(width)])[0]
+            stage.records = 0 if timeline is None else len(timeline.speaker_rooms)
+        if timeline is None:
+            print("File " + file + " contains no rooms.")
+            return None
+
+        with profiling.stage("organize_timeline"):
+            byroom, byspeaker = organize_timeline(timeline, time_format)
+        with profiling.stage("write_" + output_format):
+            return outputs.write_sheets({"Room Timeline": byroom, "Speaker Timeline": byspeaker}, name, output_format)
+
+# Returns every export in paths (files or folders, searched however deeply nested), in order.
+def find_exports(paths):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files += compressed.zip_members(path) if path.endswith(".zip") else [path]
+            continue
+        for folder, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            files += compressed.exports_in(folder, sorted(filenames))
+    return files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write how much was spoken in each minute of every room, and by every speaker, for deliberation jsons.")
+    parser.add_argument("paths", nargs="*", help="json files or folders to read (the jsons in the current folder if none are given)")
+    parser.add_argument("--bin-seconds", type=float, default=DEFAULT_WIDTH / 1000, metavar="SECONDS",
+                        help="width of each bin in seconds (default " + str(DEFAULT_WIDTH // 1000) + ")")
+    parser.add_argument("--time-format", choices=durations.STYLES, default="mm:ss",
+                        help="how to write the bin start times and room lengths (default mm:ss)")
+    parser.add_argument("--output-format", choices=outputs.FORMATS, default="xlsx",
+                        help="what to write the output as (default xlsx)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    width = int(round(args.bin_seconds * 1000))
+    if width <= 0:
+        parser.error("--bin-seconds must be more than 0")
+    outputs.check_available(args.output_format)
+    cprofiler = profiling.start(args)
+
+    files = compressed.find_exports(os.getcwd()) if not args.paths else find_exports(args.paths)
+    if len(files) == 0:
+        print("No json files found. Exiting.")
+
+    for file in files:
+        try:
+            written = process_file(file, compressed.export_name(file) + " - Timeline", width, args.time_format, args.output_format)
+        except Exception as e:
+            print("Failed to read " + file + ": " + repr(e))
+            continue
+        if written:
+            print("Saved " + ", ".join(written))
+
+    profiling.finish(args, cprofiler)
+
+    print("Done. Exiting...")
+    lightweight.pause(1.5)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+from array import array
+import analyzers
+
+# An index of an export's transcript events, built once as the file is read so every transcript metric is a lookup rather than another
+# scan of the transcript. Events are kept in columns (room, type, userId as integer codes, and time), and the first time the index is
+# queried they are sorted by room, type and time, and by room, type, user and time, so that:
+#   count(room, type, user)                 is a dictionary lookup (kept up to date as events are added, so it doesn't need the sort)
+#   times(room, type, user)                 is a slice of the sorted times
+#   count_between(room, type, start, end)   is a pair of binary searches in that slice
+#   marker(room, text)                      gives the time of a moderator event such as "Introductions" or "Deliberation ends"
+#   latest(room)                            gives the time of the room's last event
+# user can be left out (None) to cover everyone in the room.
+
+class TranscriptIndex:
+    def __init__(self):
+        self.rooms = []
+        self.types = []
+        self.users = []
+        self._codes = ({}, {}, {})
+
+        self._room = array('l')
+        self._type = array('l')
+        self._user = array('l')
+        self._t = array('d')
+
+        # (room, text): times of the moderator events with that text
+        self._markers = {}
+        # (room, type, user) and (room, type, None): number of events
+        self._counts = {}
+        self._built = None
+
+    # Adds a transcript event from a room.
+    def add(self, room, event):
+        t = event.get('t')
+        t = float('nan') if t is None else t
+        self._room.append(self._encode(0, self.rooms, room))
+        self._type.append(self._encode(1, self.types, event.get('type')))
+        self._user.append(self._encode(2, self.users, event.get('userId')))
+        self._t.append(t)
+        for key in {(room, event.get('type'), event.get('userId')), (room, event.get('type'), None)}:
+            self._counts[key] = self._counts.get(key, 0) + 1
+        if event.get('type') == 'moderator' and 'text' in event:
+            self._markers.setdefault((room, event['text']), []).append(t)
+        self._built = None
+
+    def _encode(self, column, values, value):
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    # Sorts the events twice, by room, type and time and by room, type, user and time, and works out where each (room, type) and
+    # (room, type, user) starts and ends in the matching sorted times.
+    def _build(self):
+        if self._built is not None:
+            return self._built
+
+        room = np.array(self._room, dtype=np.int64)
+        kind = np.array(self._type, dtype=np.int64)
+        user = np.array(self._user, dtype=np.int64)
+        t = np.array(self._t, dtype=np.float64)
+        bytype = room * max(len(self.types), 1) + kind
+        byuser = bytype * max(len(self.users), 1) + user
+
+        built = []
+        for keys in [bytype, byuser]:
+            order = np.lexsort((t, keys))
+            unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+            built.append((t[order], dict(zip(unique.tolist(), zip(starts.tolist(), (starts + counts).tolist())))))
+
+        latest = {}
+        if len(t):
+            rooms, inverse = np.unique(room, return_inverse=True)
+            roomlatest = np.full(len(rooms), np.nan)
+            np.fmax.at(roomlatest, inverse.reshape(-1), t)
+            latest = dict(zip(rooms.tolist(), roomlatest.tolist()))
+
+        self._built = (built[0], built[1], latest)
+        return self._built
+
+    # Returns the sorted times the events of a type (and user) in a room are in, and where they are in them as (start, end).
+    def _slice(self, room, type, user=None):
+        bytype, byuser, latest = self._build()
+        roomcode = self._codes[0].get(room)
+        typecode = self._codes[1].get(type)
+        if roomcode is None or typecode is None:
+            return bytype[0], 0, 0
+
+        key = roomcode * max(len(self.types), 1) + typecode
+        if user is None:
+            return (bytype[0],) + bytype[1].get(key, (0, 0))
+        usercode = self._codes[2].get(user)
+        if usercode is None:
+            return byuser[0], 0, 0
+        return (byuser[0],) + byuser[1].get(key * max(len(self.users), 1) + usercode, (0, 0))
+
+    # Returns the number of events of a type in a room, optionally just those by one user.
+    def count(self, room, type, user=None):
+        return self._counts.get((room, type, user), 0)
+
+    # Returns the sorted times of the events of a type in a room, optionally just those by one user.
+    def times(self, room, type, user=None):
+        times, start, end = self._slice(room, type, user)
+        return times[start:end]
+
+    # Returns the number of events of a type in a room from start up to (but not including) end.
+    def count_between(self, room, type, start, end, user=None):
+        times = self.times(room, type, user)
+        return int(np.searchsorted(times, end, side='left') - np.searchsorted(times, start, side='left'))
+
+    # Returns the time of the latest moderator event in a room with the given text, or None if there isn't one.
+    def marker(self, room, text):
+        times = self._markers.get((room, text))
+        if not times:
+            return None
+        return max(times)
+
+    # Returns the time of the latest event in a room, or None if it has none.
+    def latest(self, room):
+        code = self._codes[0].get(room)
+        time = self._build()[2].get(code)
+        return None if time is None or time != time else time
+
+    # The sorted columns are rebuilt on demand, so leave them out when pickling (eg. for the parse cache).
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_built'] = None
+        return state
+
+    def __len__(self):
+        return len(self._t)
+
+# Base for analyzers that get their transcript data from a TranscriptIndex. Given an index, the analyzer reads from it and leaves filling
+# it to whoever made it (eg. a TranscriptIndexAnalyzer running in the same pass), so several analyzers can share one index. Without one
+# the analyzer builds its own. Subclasses should query the index in result(), once the whole file has been read.
+class TranscriptAnalyzer(analyzers.Analyzer):
+    def __init__(self, index=None):
+        self.ownsindex = index is None
+        self.index = TranscriptIndex() if index is None else index
+
+    def transcript(self, roomname, event):
+        if self.ownsindex:
+            self.index.add(roomname, event)
+
+# Builds the transcript index of an export. Hand its index to the other analyzers in the same run to share it:
+#
+#   indexer = transcripts.TranscriptIndexAnalyzer()
+#   analyzers.run_analyzers(file, [indexer, AbuseFlagsAnalyzer(indexer.index), ...])
+@analyzers.register("transcriptIndex")
+class TranscriptIndexAnalyzer(TranscriptAnalyzer):
+    def __init__(self):
+        TranscriptAnalyzer.__init__(self)
+
+    def result(self):
+        return self.index
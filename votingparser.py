@@ -1,13 +1,29 @@
-import pandas as pd
+import lightweight
+pd = lightweight.lazy_import("pandas")
+np = lightweight.lazy_import("numpy")
 import time
 import os, sys
-import json
-import glob
-import datetime
-
+import argparse
+import pickle
+import zlib
+import tempfile
+import concurrent.futures
+import parsecache
+import analyzers
+import profiling
+import durations
+import outputs
+import transcripts
+import roomindex
+import compressed
+import identities
+import watch
+
+# The uids, names and rooms held by these are interned (see identities.intern), so each is kept in memory once however many files and
+# folders it comes up in. Ones read back from the parse cache or a worker process are copies, so they're interned again when unpickled.
 class participant_groupLevel:
     def __init__(self, group):
-        self.group = group
+        self.group = identities.intern(group)
         self.numYeas = 0
         self.numNays = 0
         self.numInitates = 0
@@ -16,20 +32,36 @@ class participant_groupLevel:
         self.speakTime = 0
         self.speakCount = 0
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.group = identities.intern(self.group)
+
 class participant:
     def __init__(self, uid, name, role):
-        self.uid = uid
-        self.name = name
+        self.uid = identities.intern(uid)
+        self.name = identities.intern(name)
         self.role = role
         self.groups = {}
+        # position of the file the name and role were taken from, see merge_data
+        self.order = 0
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.uid = identities.intern(self.uid)
+        self.name = identities.intern(self.name)
+        self.groups = {identities.intern(room): grouplevel for room, grouplevel in self.groups.items()}
 
 class group:
     def __init__(self, group):
-        self.name = group
+        self.name = identities.intern(group)
         self.startTime = 0
         self.endTime = 0
         self.speakingTime = 0
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.name = identities.intern(self.name)
+
 def grab_json_files(override_path=""):
 
     if override_path != "":
@@ -38,137 +70,573 @@ def grab_json_files(override_path=""):
         path = os.getcwd()
 
     print("Searching " + path + " for json files\n")
-    folder = path + "/*.json"
-    json_files = glob.glob(folder)
+    json_files = compressed.find_exports(path)
 
     #check that there are in fact some files to parse
     if len(json_files) == 0:
         print("No json files found in the current directory. Exiting.")
-        time.sleep(2.5)
+        lightweight.pause(2.5)
         sys.exit()
 
     return json_files
 
-def grab_data_from_file(json_files):
+# Reads the participants and groups from every json file in json_files into a pair of dictionaries, keyed by uid and by room name.
+# This is a map/reduce: each file is read on its own into a partial (participants, group_list) by read_partial, and the partials are
+# folded into the totals one at a time with merge_data as they come in, so only the totals and the partials in flight are ever held
+# at once. With workers other than 1 the files are read in that many worker processes at once (0 for one per cpu core), and with a spill
+# folder the workers hand their partials back through files there rather than keeping them in memory until they're merged. If a
+# ParseCache is given, files that haven't changed since they were last read are taken from it instead. Given a list of rooms, only those
+# rooms are read from each file. Given a list as seen, (file, the (uid, screen name, room name) of everyone in it) is added to it for each
+# file, for the identity table (see identities.py).
+def grab_data_from_file(json_files, cache=None, workers=1, spill=None, rooms=None, seen=None):
 
     participants = {}
     group_list = {}
 
-    for file in json_files:
-        with open(file, 'r', encoding='utf-8', errors="replace") as json_file:
-            parsed_json = json.load(json_file)
+    for order, partial in map_partials(json_files, cache, workers, spill, rooms):
+        if seen is not None:
+            # merge_data hands the partial's participants over to the totals, so take them before it does
+            seen.append((json_files[order], identities.partial_appearances(partial)))
+        with profiling.for_file(json_files[order]), profiling.stage("merge_data") as stage:
+            merge_data(participants, group_list, partial, order)
+            stage.records = len(partial[0])
 
-            for room in parsed_json:
+    return participants, group_list
+
+# Yields (index of the file in json_files, partial) for every json file, reading them in worker processes if workers isn't 1. At most two
+# files per worker are handed to the pool at a time, so finished partials never pile up waiting to be merged. A file that fails in a
+# worker is reported and skipped without stopping the others.
+def map_partials(json_files, cache=None, workers=1, spill=None, rooms=None):
+    if workers == 1:
+        for order, file in enumerate(json_files):
+            yield order, read_partial(file, cache, None, rooms)
+        return
+
+    workers = workers or os.cpu_count()
+    waiting = iter(enumerate(json_files))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def submit():
+            for order, file in waiting:
+                if profiling.profiler.enabled:
+                    future = pool.submit(profiling.call_profiled, profiling.profiler.trace_memory, read_partial, file, cache, spill, rooms)
+                else:
+                    future = pool.submit(read_partial, file, cache, spill, rooms)
+                pending[future] = order
+                return
+
+        for _ in range(workers * 2):
+            submit()
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                order = pending.pop(future)
+                submit()
                 try:
-                    roomName = room["roomData"]["name"]
-                except KeyError:
+                    partial = future.result()
+                except Exception as e:
+                    print("Failed to read " + json_files[order] + ": " + repr(e))
                     continue
-                
-                if "userData" not in room.keys():
-                    print("Skipped room " +  roomName + " because it has no users")
-                    continue
-
-                if roomName not in group_list.keys():
-                    group_list[roomName] = group(roomName)
-                
-                for user in room["userData"]:
-
-                    if user["id"] not in participants.keys():
-                        participants[user["id"]] = participant(user["id"], user["screenName"], user["role"])
-                    
-                    person = participants[user["id"]]
-                    person.groups[roomName] = participant_groupLevel(roomName)
-
-                    for item in user["advanceAgenda"]:
-                        if item["answer"] == 1:
-                            person.groups[roomName].numNays += 1
-                        elif item["answer"] == 0:
-                            person.groups[roomName].numYeas += 1
-
-                    for block in user["speakBlocks"]:
-                        time = block["finishTime"] - block["speakTime"]
-                        if time:
-                            person.groups[roomName].speakCount += 1
-                            person.groups[roomName].speakTime += time
-                            group_list[roomName].speakingTime += time
-                
-                for item in room["transcriptData"]:                    
-                    if item["type"] == "submitQuestion":
-                        person = item["userId"]
-                        participants[person].groups[roomName].wroteQuestions += 1
-
-                    if item["type"] == "submitQuestionRanks":
-                        person = item["userId"]
-                        participants[person].groups[roomName].numVotesForQuestions += 1
-
-                    if item["type"] == "moderator":
-                        if "text" in item.keys():
-                            if item["text"] == "Deliberation ends":
-                                group_list[roomName].endTime = item["t"]
-                            if item["text"] == "Introductions":
-                                group_list[roomName].startTime = item["t"]
-
-                        
-                                    
-                for item in room["pollData"].values():
-                    if item["type"] == "advanceAgenda":
-                        initator = item["data"]["from"]
-
-                        participants[initator].groups[roomName].numInitates += 1
 
+                if profiling.profiler.enabled:
+                    partial, stages = partial
+                    profiling.profiler.merge(stages)
+                if spill is not None:
+                    partial = load_spilled(partial)
+                yield order, partial
+
+# The map step: reads one json file (or takes it from the cache) into a partial (participants, group_list). With a spill folder the
+# partial is written to a file there and the file's path is returned instead.
+def read_partial(file, cache=None, spill=None, rooms=None):
+    with profiling.for_file(file):
+        if rooms is None:
+            partial = parsecache.cached(cache, file, "votingparser", grab_partial_data)
+        else:
+            # the cache holds whole files, so runs over a subset of rooms go straight to the file
+            partial = grab_partial_data(file, rooms)
+        if spill is None:
+            return partial
+
+        with profiling.stage("spill_partial"):
+            os.makedirs(spill, exist_ok=True)
+            handle, path = tempfile.mkstemp(suffix=".pkl.z", dir=spill)
+            with os.fdopen(handle, 'wb') as f:
+                f.write(zlib.compress(pickle.dumps(partial, protocol=pickle.HIGHEST_PROTOCOL)))
+        return path
+
+# Loads a partial that read_partial spilled to disk, and deletes its file.
+def load_spilled(path):
+    with profiling.stage("load_spilled"):
+        with open(path, 'rb') as f:
+            partial = pickle.loads(zlib.decompress(f.read()))
+        os.remove(path)
+    return partial
+
+# Reads a single json file and returns the participants and groups in it, in the same form as grab_data_from_file. Given a list of rooms,
+# only those rooms are read, through the file's room index (see roomindex.py).
+def grab_partial_data(file, rooms=None):
+    with profiling.stage("read_file") as stage:
+        source = file if rooms is None else roomindex.load_rooms(file, rooms)
+        participants, group_list = analyzers.run_analyzers(source, [VotingAnalyzer()])[0]
+        stage.records = len(participants)
     return participants, group_list
 
+# Counts up each participant's votes, speaks, questions and move on initiations per group, and each group's start/end time and total
+# speaking time, from the records of an export. The result is a (participants, group_list) tuple like grab_data_from_file returns.
+# Rooms with no users are skipped entirely. Questions, question votes and the start/end markers are looked up in the export's transcript
+# index (see transcripts.py) once the file has been read, rather than checked event by event.
+@analyzers.register("voting")
+class VotingAnalyzer(transcripts.TranscriptAnalyzer):
+    def __init__(self, index=None):
+        transcripts.TranscriptAnalyzer.__init__(self, index)
+        self.participants = {}
+        self.group_list = {}
+        self.skipping = False
+        self.current = None
+
+    def room(self, roomName, room):
+        self.skipping = "userData" not in room.keys()
+        if self.skipping:
+            print("Skipped room " +  roomName + " because it has no users")
+            return
+
+        if roomName not in self.group_list.keys():
+            room = group(roomName)
+            self.group_list[room.name] = room
+
+    def user(self, roomName, user):
+        if user["id"] not in self.participants.keys():
+            person = participant(user["id"], user["screenName"], user["role"])
+            self.participants[person.uid] = person
+
+        person = self.participants[user["id"]]
+        # the user's speak blocks come straight after them, so keep hold of their group level data for speakBlock
+        self.current = participant_groupLevel(roomName)
+        person.groups[self.current.group] = self.current
+
+        for item in user["advanceAgenda"]:
+            if item["answer"] == 1:
+                self.current.numNays += 1
+            elif item["answer"] == 0:
+                self.current.numYeas += 1
+
+    def speakBlock(self, roomName, user, block):
+        time = block["finishTime"] - block["speakTime"]
+        if time:
+            self.current.speakCount += 1
+            self.current.speakTime += time
+            self.group_list[roomName].speakingTime += time
+
+    def poll(self, roomName, pollid, item):
+        if self.skipping:
+            return
+
+        if item["type"] == "advanceAgenda":
+            initator = item["data"]["from"]
+
+            self.participants[initator].groups[roomName].numInitates += 1
+
+    def result(self):
+        for person in self.participants.values():
+            for roomName, grouplevel in person.groups.items():
+                grouplevel.wroteQuestions = self.index.count(roomName, "submitQuestion", person.uid)
+                grouplevel.numVotesForQuestions = self.index.count(roomName, "submitQuestionRanks", person.uid)
+
+        for roomName, room in self.group_list.items():
+            room.startTime = self.index.marker(roomName, "Introductions") or 0
+            room.endTime = self.index.marker(roomName, "Deliberation ends") or 0
+
+        return self.participants, self.group_list
+
+# The counts in participant_groupLevel that add up across files.
+summed_fields = ["numYeas", "numNays", "numInitates", "wroteQuestions", "numVotesForQuestions", "speakTime", "speakCount"]
+
+# The reduce step: folds the (participants, group_list) read from one file into the dictionaries collected from the files before it. The
+# result doesn't depend on the order partials are merged in:
+#   - a participant's counts and speaking time in a group are summed across every file that has them in that group
+#   - a participant keeps the name and role from the earliest file they appear in, by order (the file's position in the folder)
+#   - a group's speaking time is summed across files
+#   - a group starts at the earliest "Introductions" and ends at the latest "Deliberation ends" moderator event of any file
+def merge_data(participants, group_list, partial, order=0):
+    partial_participants, partial_groups = partial
+
+    for uid, person in partial_participants.items():
+        person.order = order
+        if uid not in participants:
+            participants[person.uid] = person
+            continue
+
+        merged = participants[uid]
+        if order < merged.order:
+            merged.name, merged.role, merged.order = person.name, person.role, order
+        for roomName, grouplevel in person.groups.items():
+            if roomName not in merged.groups:
+                merged.groups[grouplevel.group] = grouplevel
+                continue
+            for field in summed_fields:
+                setattr(merged.groups[roomName], field, getattr(merged.groups[roomName], field) + getattr(grouplevel, field))
+
+    for roomName, partial_group in partial_groups.items():
+        if roomName not in group_list:
+            group_list[partial_group.name] = partial_group
+            continue
+        merged = group_list[roomName]
+        merged.speakingTime += partial_group.speakingTime
+        if partial_group.startTime and (not merged.startTime or partial_group.startTime < merged.startTime):
+            merged.startTime = partial_group.startTime
+        if partial_group.endTime and partial_group.endTime > merged.endTime:
+            merged.endTime = partial_group.endTime
+
+# For prettifying a length in milliseconds to h:mm:ss. generate_output formats whole columns at once with durations.format_durations instead.
 def convert_to_minsecs(length):
-    d = datetime.timedelta(milliseconds=length)
-    return str(d)[:7]
+    return durations.format_duration(length, "h:mm:ss")
+
+# The columns of the long output, and which of them hold lengths of time in milliseconds that get formatted at the end.
+output_columns = "Uid, _Name, Group, YeasMoveOn, NaysMoveOn, MoveOnInitiations, QuestionsWritten, VotesForQuestions, SpeakCount, SpeakTime, groupDelibTime, groupSpeakingTime".split(", ")
+time_columns = ["SpeakTime", "groupDelibTime", "groupSpeakingTime"]
 
-def generate_output(participants, groups, folder):
-    df = pd.DataFrame(columns="Uid, _Name, Group, YeasMoveOn, NaysMoveOn, MoveOnInitiations, QuestionsWritten, VotesForQuestions, SpeakCount, SpeakTime, groupDelibTime, groupSpeakingTime".split(", "))
+def generate_output(participants, groups, folder, time_format="h:mm:ss", output_format="csv"):
+    # collect every participant-group row first and build the dataframe in one go, rather than growing it a row at a time
+    with profiling.stage("build_rows") as stage:
+        rows = build_rows(participants, groups)
+        df = pd.DataFrame.from_records(rows, columns=output_columns)
+        stage.records = len(rows)
 
+    write_tables(df, folder, time_format, output_format)
+
+# Returns a row of the long output for every participant in every group they were in, as tuples lined up with output_columns, with times
+# in milliseconds.
+def build_rows(participants, groups):
+    rows = []
     for person in participants.values():
         if person.role in ["observer", "admin", "removed"]:
             continue
         for group in person.groups.values():
-            df.loc[len(df.index)] = [person.uid, person.name, group.group, group.numYeas, group.numNays, group.numInitates, 
-                                     group.wroteQuestions, group.numVotesForQuestions, group.speakCount, 
-                                     str(convert_to_minsecs(group.speakTime)), 
-                                     str(convert_to_minsecs(groups[group.group].endTime - groups[group.group].startTime)), 
-                                     str(convert_to_minsecs(groups[group.group].speakingTime))]
-    
-    df.to_csv("metaverse_" + folder + "_long.csv", index=True, encoding='utf-8-sig')
-    df = df.sort_values(by='Group')
-
-    wdf = pd.pivot(df, index='Uid', columns='Group')
-
-    wdf.columns = wdf.columns.swaplevel(0, 1)  # Swap the levels of multiindex columns
-    wdf = wdf.sort_index(axis=1, level=0)
-
-    wdf.to_csv("metaverse_" + folder + "_wide.csv", index=True, encoding='utf-8-sig')
+            rows.append((person.uid, person.name, group.group, group.numYeas, group.numNays, group.numInitates,
+                         group.wroteQuestions, group.numVotesForQuestions, group.speakCount, group.speakTime,
+                         groups[group.group].endTime - groups[group.group].startTime,
+                         groups[group.group].speakingTime))
+    return rows
+
+# The --quick version of generate_output: writes the same long and wide csvs byte for byte, but with the standard library alone, so
+# pandas and numpy are never imported.
+def generate_output_quick(participants, groups, folder, time_format="h:mm:ss"):
+    with profiling.stage("build_rows") as stage:
+        timeindexes = [output_columns.index(column) for column in time_columns]
+        rows = []
+        for row in build_rows(participants, groups):
+            row = list(row)
+            for i in timeindexes:
+                row[i] = durations.format_duration(row[i], time_format)
+            rows.append(row)
+        stage.records = len(rows)
+
+    with profiling.stage("write_long_quick_csv") as stage:
+        lightweight.write_csv("metaverse_" + folder + "_long.csv", [[""] + output_columns], rows)
+        stage.records = len(rows)
+
+    # the wide view, laid out like widen_output's dataframe: a row per uid and a block of columns per group, both sorted, with every
+    # column's fields sorted inside each block. Numbers become floats there so missing participants can be left empty.
+    with profiling.stage("write_wide_quick_csv") as stage:
+        uid, group = output_columns.index("Uid"), output_columns.index("Group")
+        fields = sorted(column for column in output_columns if column not in ["Uid", "Group"])
+        fieldindexes = [output_columns.index(field) for field in fields]
+        numeric = [all(isinstance(row[i], (int, float)) for row in rows) for i in fieldindexes]
+
+        cells = {(row[uid], row[group]): row for row in rows}
+        uids = sorted(set(row[uid] for row in rows))
+        groupnames = sorted(set(row[group] for row in rows))
+
+        header = [["Group"] + [name for name in groupnames for field in fields], [""] + fields * len(groupnames),
+                  ["Uid"] + [""] * (len(fields) * len(groupnames))]
+        lines = []
+        for u in uids:
+            line = [u]
+            for g in groupnames:
+                row = cells.get((u, g))
+                for i, isnumber in zip(fieldindexes, numeric):
+                    if row is None:
+                        line.append(None)
+                    else:
+                        line.append(float(row[i]) if isnumber else row[i])
+            lines.append(line)
+        lightweight.write_csv("metaverse_" + folder + "_wide.csv", header, lines, index=False)
+        stage.records = len(lines)
     print("Saved data for " + folder)
 
-def main():
-
-    # Specify the directory path
-    directory_path = os.getcwd()
-
-    # List all items in the directory
-    all_items = os.listdir(directory_path)
-
-    # Iterate through the items and filter out folders
-    for item in all_items:
-        # Create the full path to the item
-        full_path = os.path.join(directory_path, item)
-        
-        # Check if it is a directory
-        if os.path.isdir(full_path):
-            json_files = grab_json_files(full_path)
+# Formats the times in a long table (with times in milliseconds, like generate_output builds) and writes it and its wide view for a
+# folder. speakerdb.py writes the tables it gets from its database through here too.
+def write_tables(df, folder, time_format="h:mm:ss", output_format="csv"):
+    # the times stay in milliseconds until here, where each column is formatted at once
+    with profiling.stage("format_times") as stage:
+        for column in time_columns:
+            df[column] = durations.format_durations(df[column].to_numpy(), time_format)
+        stage.records = len(df) * len(time_columns)
+
+    # csv by default, or parquet/feather (see outputs.py). Unlike the workbooks, these are written over on every run.
+    with profiling.stage("write_long_" + output_format) as stage:
+        outputs.write_table(df, "metaverse_" + folder + "_long" + outputs.EXTENSIONS[output_format], output_format)
+        stage.records = len(df)
+
+    with profiling.stage("widen_output") as stage:
+        wdf = widen_output(df)
+        stage.records = len(wdf)
+
+    with profiling.stage("write_wide_" + output_format) as stage:
+        outputs.write_table(wdf, "metaverse_" + folder + "_wide" + outputs.EXTENSIONS[output_format], output_format)
+        stage.records = len(wdf)
+    print("Saved data for " + folder)
 
-            participants, groups = grab_data_from_file(json_files)
+# Turns the long output into the wide view, with one row per Uid and a block of columns for each group. Each participant is in a given
+# group at most once, so every value just gets placed at its (uid, group) position in a numpy array for each column, instead of
+# pivoting the whole frame.
+def widen_output(df):
+    uidcodes, uids = pd.factorize(df['Uid'], sort=True)
+    groupcodes, groupnames = pd.factorize(df['Group'], sort=True)
+
+    widecolumns = {}
+    for column in df.columns:
+        if column in ["Uid", "Group"]:
+            widecolumns[column] = None
+            continue
+        values = df[column].to_numpy()
+        # numeric columns become floats so participants missing from a group can be left empty, just like pivot did
+        if values.dtype.kind in "iuf":
+            wide = np.full((len(uids), len(groupnames)), np.nan)
+        else:
+            wide = np.full((len(uids), len(groupnames)), np.nan, dtype=object)
+        wide[uidcodes, groupcodes] = values
+        widecolumns[column] = wide
+
+    # group by group, with each group's columns in sorted order
+    data = {}
+    fields = sorted(column for column in widecolumns if widecolumns[column] is not None)
+    for g in range(len(groupnames)):
+        for field in fields:
+            data[(groupnames[g], field)] = widecolumns[field][:, g]
+
+    wdf = pd.DataFrame(data, index=pd.Index(uids, name='Uid'))
+    wdf.columns = pd.MultiIndex.from_tuples(list(data.keys()), names=['Group', None])
+    return wdf
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Produce voting data csvs for every folder of deliberation jsons under the current folder.")
+    parser.add_argument("--cache", nargs="?", const=parsecache.DEFAULT_DIRECTORY, default=None, metavar="DIR",
+                        help="keep the data read from each json in a cache folder (" + parsecache.DEFAULT_DIRECTORY + " by default) and reuse it "
+                        "on later runs for any file that hasn't changed.")
+    parser.add_argument("--cache-size", type=int, default=parsecache.DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="largest the cache folder is allowed to grow before old entries are deleted.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of folders to process at once in separate processes. Use 0 for one per cpu core.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of json files in a folder to read at once in separate processes, when folders are processed one at a "
+                        "time. Use 0 for one per cpu core.")
+    parser.add_argument("--spill", metavar="DIR",
+                        help="with --workers, pass each file's data back from the workers through temporary files in DIR instead of memory")
+    parser.add_argument("--time-format", choices=durations.STYLES, default="h:mm:ss",
+                        help="how to write lengths of time in the output (default h:mm:ss)")
+    parser.add_argument("--output-format", choices=["csv", "parquet", "feather"], default="csv",
+                        help="what to write the long and wide tables as (default csv)")
+    parser.add_argument("--rooms", metavar="NAMES",
+                        help="comma separated names of the only rooms to process. Reads just those rooms from each export through a "
+                        "room index saved next to it.")
+    parser.add_argument("--quick", action="store_true",
+                        help="write the csvs using nothing but the standard library. Starts and finishes much faster on small folders.")
+    parser.add_argument("--identities", nargs="?", const=identities.DEFAULT_PATH, default=None, metavar="FILE",
+                        help="also record every participant read in the identity table in FILE (" + identities.DEFAULT_PATH + " by "
+                        "default), for looking them up across deliberations with identities.py")
+    watch.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.quick and args.output_format != "csv":
+        parser.error("--quick always writes csv")
+    if args.identities is not None and args.rooms is not None:
+        parser.error("--identities records whole exports, so it can't be used with --rooms")
+    if args.watch and args.jobs != 1:
+        parser.error("--watch processes folders one at a time as their jsons change, so it can't be used with --jobs")
+    outputs.check_available(args.output_format)
+    cprofiler = profiling.start(args)
+
+    cache = None
+    if args.cache is not None:
+        cache = parsecache.ParseCache(args.cache, args.cache_size * 1024 * 1024)
+    elif args.watch:
+        # a folder is read again whenever one of its jsons changes, so keep the others from being read every time
+        cache = parsecache.ParseCache(parsecache.DEFAULT_DIRECTORY, args.cache_size * 1024 * 1024)
+
+    skip = [args.spill] if args.spill is not None else []
+    table = None
+    if args.identities is not None:
+        table = identities.load(args.identities)
+
+    if args.watch:
+        try:
+            watch_folders(os.getcwd(), skip, cache, args.workers, args.spill, args.time_format, args.output_format,
+                          roomindex.parse_rooms_argument(args.rooms), args.quick, table, args.identities, args.poll_seconds,
+                          args.settle_seconds)
+        except KeyboardInterrupt:
+            print("\nStopped watching. Exiting...")
+        profiling.finish(args, cprofiler)
+        return
+
+    jobs = find_folders(os.getcwd(), skip)
+    if len(jobs) == 0:
+        print("No folders of json files found under " + os.getcwd() + ". Exiting.")
+    else:
+        run_folders(jobs, args.jobs, cache, args.workers, args.spill, args.time_format, args.output_format,
+                    roomindex.parse_rooms_argument(args.rooms), args.quick, table)
+        if table is not None:
+            identities.save(table, args.identities)
 
-            generate_output(participants, groups, item)
+    profiling.finish(args, cprofiler)
 
     print("Data saved. Exiting...")
-    time.sleep(1.5)
+    lightweight.pause(1.5)
+
+# Walks the folder tree under root and returns a job for every folder with json files directly in it, as (path, name, number of json
+# files, total size of the json files in bytes). root itself isn't included. Hidden folders (like the parse cache) and the folders in
+# skip aren't searched. name is the folder's path under root with its separators replaced by "_", so term1/courseA/session2 is saved
+# as metaverse_term1_courseA_session2_long.csv, and a folder straight under root keeps its own name like before.
+def find_folders(root, skip=[]):
+    root = os.path.abspath(root)
+    skip = [os.path.abspath(folder) for folder in skip]
+
+    jobs = []
+    for path, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and os.path.join(path, d) not in skip)
+        if path == root:
+            continue
+
+        json_files = compressed.exports_in(path, filenames)
+        if len(json_files) == 0:
+            continue
+        name = os.path.relpath(path, root).replace(os.sep, "_")
+        jobs.append((path, name, len(json_files), sum(compressed.disk_size(f) for f in json_files)))
+    return jobs
+
+# Processes one folder of jsons: reads them into the folder's totals and writes its output. Returns how long it took, for the summary,
+# and with identify, the participants of each file for the identity table like grab_data_from_file's seen (None otherwise).
+def run_folder(path, name, cache=None, workers=1, spill=None, time_format="h:mm:ss", output_format="csv", rooms=None, quick=False,
+               identify=False):
+    started = time.perf_counter()
+    seen = [] if identify else None
+    with profiling.for_file(name):
+        json_files = grab_json_files(path)
+        participants, groups = grab_data_from_file(json_files, cache, workers, spill, rooms, seen)
+        if quick:
+            generate_output_quick(participants, groups, name, time_format)
+        else:
+            generate_output(participants, groups, name, time_format, output_format)
+    return time.perf_counter() - started, seen
+
+# Runs run_folder for each job from find_folders. With jobs other than 1, that many folders are processed at once in separate processes
+# (0 for one per cpu core), starting with the largest so the long ones aren't left running on their own at the end. Each folder then
+# reads its own files one at a time, since workers can't start pools of their own. A folder that fails is reported without stopping the
+# others. Given an identities.IdentityTable, the participants of every file read are recorded in it. Prints each folder's throughput at
+# the end.
+def run_folders(folders, jobs=1, cache=None, workers=1, spill=None, time_format="h:mm:ss", output_format="csv", rooms=None,
+                quick=False, table=None):
+    folders = sorted(folders, key=lambda job: job[3], reverse=True)
+    started = time.perf_counter()
+    timings = {}
+    identify = table is not None
+
+    def record(seen):
+        for file, appearances in seen or []:
+            table.record(file, appearances)
+
+    if jobs == 1:
+        for path, name, numfiles, size in folders:
+            timings[name], seen = run_folder(path, name, cache, workers, spill, time_format, output_format, rooms, quick, identify)
+            record(seen)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            futures = {}
+            for path, name, numfiles, size in folders:
+                if profiling.profiler.enabled:
+                    future = pool.submit(profiling.call_profiled, profiling.profiler.trace_memory, run_folder, path, name, cache, 1, None,
+                                         time_format, output_format, rooms, quick, identify)
+                else:
+                    future = pool.submit(run_folder, path, name, cache, 1, None, time_format, output_format, rooms, quick, identify)
+                futures[future] = name
+
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print("Failed to process " + name + ": " + repr(e))
+                    continue
+                if profiling.profiler.enabled:
+                    result, stages = result
+                    profiling.profiler.merge(stages)
+                timings[name], seen = result
+                record(seen)
+
+    print(throughput_summary(folders, timings, time.perf_counter() - started))
+
+# Watch mode (see watch.py): processes a folder again whenever any of its jsons is added, changed or deleted, until stopped with Ctrl+C.
+# The folder's totals are built from all of its jsons again, but with a parse cache only the ones that changed are actually read, and its
+# long and wide tables are written over the ones from before. Given an identities.IdentityTable, the files read are recorded in it and it's
+# saved to table_path after each folder.
+def watch_folders(root, skip=[], cache=None, workers=1, spill=None, time_format="h:mm:ss", output_format="csv", rooms=None, quick=False,
+                  table=None, table_path=None, interval=watch.POLL_SECONDS, settle=watch.SETTLE_SECONDS):
+    # export: (path, name) of the folder it's in. Kept for deleted exports too, so their folder can be processed again without them.
+    owners = {}
+
+    def scan():
+        exports = []
+        for path, name, numfiles, size in find_folders(root, skip):
+            for export in compressed.find_exports(path):
+                owners[export] = (path, name)
+                exports.append(export)
+        return exports
+
+    watcher = watch.Watcher(scan, settle)
+    print("Watching the folders under " + root + " for new and changed json files. Press Ctrl+C to stop.\n")
+
+    for ready, removed in watcher.changes(interval):
+        changed = {}
+        for export in ready + removed:
+            changed.setdefault(owners[export], []).append(export)
+
+        for (path, name), exports in changed.items():
+            if not compressed.find_exports(path):
+                print("No json files left in " + path + ", so its tables were left as they are.")
+            else:
+                try:
+                    seconds, seen = run_folder(path, name, cache, workers, spill, time_format, output_format, rooms, quick, table is not None)
+                except Exception as e:
+                    print("Failed to process " + name + ": " + repr(e))
+                else:
+                    print("Updated the tables for " + name + " in {:.2f} s".format(seconds))
+                    if table is not None:
+                        for file, appearances in seen:
+                            table.record(file, appearances)
+                        identities.save(table, table_path)
+            for export in exports:
+                watcher.processed(export)
+
+# Formats a table of how many files and MB each folder had and how fast it was processed, followed by the totals for the whole run.
+def throughput_summary(folders, timings, wall):
+    columns = "  {:<40} {:>8} {:>10} {:>10} {:>10} {:>10}"
+    lines = ["", "Folder throughput:", columns.format("folder", "files", "MB", "seconds", "MB/s", "files/s")]
+    for path, name, numfiles, size in folders:
+        if name not in timings:
+            lines.append("  {:<40} failed".format(name))
+            continue
+        seconds = max(timings[name], 1e-9)
+        lines.append(columns.format(name, numfiles, "{:.1f}".format(size / 1e6), "{:.3f}".format(seconds),
+                                    "{:.2f}".format(size / 1e6 / seconds), "{:.1f}".format(numfiles / seconds)))
+
+    numfiles = sum(job[2] for job in folders if job[1] in timings)
+    size = sum(job[3] for job in folders if job[1] in timings)
+    wall = max(wall, 1e-9)
+    lines.append("Processed {} folders, {} files and {:.1f} MB in {:.3f} s: {:.2f} MB/s, {:.1f} files/s".format(
+        len(timings), numfiles, size / 1e6, wall, size / 1e6 / wall, numfiles / wall))
+    return "\n".join(lines) + "\n"
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+import lightweight
+np = lightweight.lazy_import("numpy")
+
+# How long speakers wait between requesting the floor and getting it, from the requestTime of each speak block. The wait is
+# speakTime - requestTime. Speak blocks without a request time (null in the export, NaN in a speakstore's columns) and the zero length
+# placeholders for users who never spoke are left out of the waits, but the speaks without a request time are still counted, so it's
+# clear how much of a room the figures cover. Everything is worked out for every room and every speaker at once with sorts and
+# bincounts, so it can be run over a whole folder's exports combined with speakstore.concat (see jsonparser's --combined).
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+class WaitTimes:
+    def __init__(self, keys, speaks, requests, mean, quantiles, maximum, rows):
+        # the group each entry is for, and a row of the store in that group (for looking up names)
+        self.keys = keys
+        self.rows = rows
+        # the number of speaks, and how many of them had a request time
+        self.speaks = speaks
+        self.requests = requests
+        # wait statistics in milliseconds, NaN for groups without any request times. quantiles has one array per entry in QUANTILES.
+        self.mean = mean
+        self.quantiles = quantiles
+        self.maximum = maximum
+
+# Takes in a SpeakInstanceStore and returns a pair of WaitTimes: one by room (keyed by room code) and one by speaker in each room (keyed
+# by room code * number of uids + uid code).
+def request_waits(store):
+    columns = store.columns()
+    spoke = np.flatnonzero(columns['length'] > 0)
+    rooms = columns['room'][spoke]
+    speakers = rooms * max(len(store.uids), 1) + columns['uid'][spoke]
+    waits = columns['start'][spoke] - columns['requestTime'][spoke]
+    return group_waits(rooms, waits, spoke), group_waits(speakers, waits, spoke)
+
+# Works out the wait statistics for each distinct key in keys, given the waits (NaN where there's no request time) and the store row of
+# each. Percentiles interpolate linearly between the two nearest waits, the same as numpy.percentile's default.
+def group_waits(keys, waits, rows):
+    groups, firsts, inverse, speaks = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    known = ~np.isnan(waits)
+    requests = np.bincount(inverse[known], minlength=len(groups))
+
+    # sort the known waits by group and then by wait, so each group's waits are a sorted slice
+    order = np.lexsort((waits[known], inverse[known]))
+    sortedwaits = waits[known][order]
+    starts = np.cumsum(requests) - requests
+    has = requests > 0
+
+    mean = np.full(len(groups), np.nan)
+    mean[has] = np.bincount(inverse[known], weights=waits[known], minlength=len(groups))[has] / requests[has]
+
+    maximum = np.full(len(groups), np.nan)
+    maximum[has] = sortedwaits[starts[has] + requests[has] - 1]
+
+    quantiles = []
+    for q in QUANTILES:
+        values = np.full(len(groups), np.nan)
+        position = starts[has] + q * (requests[has] - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        values[has] = sortedwaits[lower] + (sortedwaits[upper] - sortedwaits[lower]) * (position - lower)
+        quantiles.append(values)
+
+    return WaitTimes(groups, speaks, requests, mean, quantiles, maximum, rows[firsts])
@@ -0,0 +1,86 @@
+import time
+import compressed
+
+# Watch mode for the scripts: rather than being run by hand after new exports are dropped in, a script started with --watch keeps
+# running, checks its folders every few seconds, and processes each export that's new or has changed since it was last processed,
+# writing its output over the output from before. Nothing is installed for this; the folders are just listed and each export's size and
+# modification time compared with the last look (for a json in a zip archive, the archive's).
+#
+# Exports are often copied or downloaded into a folder over several seconds, and reading one part way through would give wrong numbers
+# (or fail), so an export is only processed once its size and modification time have stayed the same for SETTLE_SECONDS. One that
+# changes again while it's being processed is processed again once it settles. One that fails isn't retried until it changes.
+
+POLL_SECONDS = 2
+SETTLE_SECONDS = 5
+
+# Returns {export: (size, mtime)} for every export in exports that's still there.
+def snapshot(exports):
+    stats = {}
+    for export in exports:
+        try:
+            stat = compressed.stat(export)
+        except OSError:
+            continue
+        stats[export] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+# Keeps track of which exports have been processed, and which have changed since and settled. scan is a function returning the exports to
+# watch, called at every poll so new files and folders are picked up.
+class Watcher:
+    def __init__(self, scan, settle=SETTLE_SECONDS):
+        self.scan = scan
+        self.settle = settle
+        # export: its (size, mtime) when it was last processed
+        self.done = {}
+        # export: (its (size, mtime) when last looked at, when it was first seen like that), for the ones waiting to settle
+        self.waiting = {}
+
+    # Looks at the exports once. Returns the exports that have changed and settled since they were last processed, and the ones that have
+    # been deleted since. Mark each with processed once it has been dealt with.
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        current = snapshot(self.scan())
+
+        ready = []
+        for export, stat in current.items():
+            if self.done.get(export) == stat:
+                self.waiting.pop(export, None)
+                continue
+            seen = self.waiting.get(export)
+            if seen is None or seen[0] != stat:
+                self.waiting[export] = (stat, now)
+            elif now - seen[1] >= self.settle:
+                ready.append(export)
+
+        for export in list(self.waiting):
+            if export not in current:
+                del self.waiting[export]
+        removed = [export for export in self.done if export not in current]
+        return ready, removed
+
+    # Marks an export returned by poll as dealt with, as it was when poll looked at it (whether it worked or not). A deleted export is
+    # forgotten.
+    def processed(self, export):
+        if export in self.waiting:
+            self.done[export] = self.waiting.pop(export)[0]
+        else:
+            self.done.pop(export, None)
+
+    # Polls every interval seconds forever, yielding (ready, removed) whenever anything is. Stop it with Ctrl+C (KeyboardInterrupt).
+    def changes(self, interval=POLL_SECONDS):
+        while True:
+            ready, removed = self.poll()
+            if ready or removed:
+                yield ready, removed
+            time.sleep(interval)
+
+# Adds the watch mode options to a script's argument parser.
+def add_arguments(parser):
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, and process every json that's added or changed from then on, writing over its output. Everything "
+                        "is processed once at the start. Stop with Ctrl+C.")
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS, metavar="SECONDS",
+                        help="with --watch, how often to look for new or changed jsons (default " + str(POLL_SECONDS) + ")")
+    parser.add_argument("--settle-seconds", type=float, default=SETTLE_SECONDS, metavar="SECONDS",
+                        help="with --watch, how long a json has to stay the same before it's processed, so files still being copied in "
+                        "aren't read part way (default " + str(SETTLE_SECONDS) + ")")